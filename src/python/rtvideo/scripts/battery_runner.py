@@ -1,9 +1,33 @@
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import json
 import os
 import signal
 import sys
 import time
 import threading
+from typing import List, Optional
+
+# Processes currently running, so an interrupt can kill every one of them.
+running_processes = set()
+running_lock = threading.Lock()
+# Set once the scripts running side by side have been told to stop.
+interrupted_event = threading.Event()
+
+
+@dataclass
+class ScriptResult:
+    label: str
+    command: str
+    exit_code: Optional[int]
+    wall_time: float
+    user_time: float
+    system_time: float
+    # Peak resident set of the largest process the script ran, in KB, sampled while it ran (see PeakRssSampler).
+    max_rss_kb: int
+    interrupted: bool = False
+
 
 def print_output(stream, label):
     """
@@ -12,44 +36,131 @@ def print_output(stream, label):
     for line in iter(stream.readline, ''):
         print(f"{label}: {line}", end='')
 
-def run_script(label, command):
-    print(f"Running script: {label}\n{command}\n")
-    try:
-        proc = subprocess.Popen(command, shell=True,  
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, preexec_fn=os.setpgrp)
+class PeakRssSampler:
+    """
+    Samples the peak resident set (VmHWM) of every process in a process group while it runs, keeping the largest.
+    The rusage from wait4 can't be used: the scripts are forked from this process, and Linux carries the parent's
+    high-water mark across the fork and exec, so every script would report at least this process's own RSS.
+    Processes that start and exit between two samples are missed. Linux only, elsewhere the peak stays 0.
+    """
+    def __init__(self, pgid: int, interval: float = 0.1):
+        self.pgid = pgid
+        self.interval = interval
+        self.max_rss_kb = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
 
-        # Create threads to read stdout and stderr
-        stdout_thread = threading.Thread(target=print_output, args=(proc.stdout, "STDOUT"))
-        stderr_thread = threading.Thread(target=print_output, args=(proc.stderr, "STDERR"))
+    def start(self):
+        if os.path.isdir('/proc'):
+            self.thread.start()
 
-        # Start the threads
-        stdout_thread.start()
-        stderr_thread.start()
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
 
-        # Wait for the subprocess to finish while the threads read the output
-        proc.wait()
+    def _run(self):
+        while True:
+            self.sample()
+            if self.stop_event.wait(self.interval):
+                return
 
-        # Wait for the output threads to finish
-        stdout_thread.join()
-        stderr_thread.join()
+    def sample(self):
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    stat = f.read()
+                # The process group is the third field after the command name, which may contain spaces.
+                if int(stat[stat.rindex(')') + 2:].split()[2]) != self.pgid:
+                    continue
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmHWM:'):
+                            self.max_rss_kb = max(self.max_rss_kb, int(line.split()[1]))
+                            break
+            except (FileNotFoundError, ProcessLookupError, ValueError):
+                # Exited since listing.
+                continue
 
-        if proc.returncode != 0:
-            print(f"\nError running script {label} with return code {proc.returncode}")
-    except KeyboardInterrupt:
-        print(f"\nInterrupt received for script: {label}. Killing script...")
+def kill_process_group(proc):
+    try:
         # Send SIGTERM to the process group of the subprocess to kill it and its children
         os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
         time.sleep(1)  # Give a short moment to handle the signal
         # Send SIGKILL to the process group of the subprocess to kill it and its children
         os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
-        # Wait for the threads
-        print("Waiting for threads to finish...")
+    except ProcessLookupError:
+        pass
+
+def run_script(label, command, prefix_output=False) -> ScriptResult:
+    """
+    Runs a command to completion, or until interrupted, and returns how long it took and what it used.
+    Output lines are prefixed with the label when `prefix_output` is set, for scripts running side by side.
+    """
+    print(f"Running script: {label}\n{command}\n")
+    output_prefix = f"{label} " if prefix_output else ""
+    start = time.time()
+    proc = subprocess.Popen(command, shell=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, text=True, bufsize=1, universal_newlines=True, preexec_fn=os.setpgrp)
+    with running_lock:
+        running_processes.add(proc)
+    # The script leads its own process group (setpgrp), so the group id is its pid.
+    rss_sampler = PeakRssSampler(proc.pid)
+    rss_sampler.start()
+
+    # Create threads to read stdout and stderr
+    stdout_thread = threading.Thread(target=print_output, args=(proc.stdout, f"{output_prefix}STDOUT"))
+    stderr_thread = threading.Thread(target=print_output, args=(proc.stderr, f"{output_prefix}STDERR"))
+
+    # Start the threads
+    stdout_thread.start()
+    stderr_thread.start()
+
+    interrupted = False
+    try:
+        # Wait for the subprocess to finish while the threads read the output. wait4 also reports the CPU
+        # used by the shell and everything it waited on.
+        while True:
+            try:
+                _, status, usage = os.wait4(proc.pid, 0)
+                break
+            except InterruptedError:
+                continue
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    except KeyboardInterrupt:
+        print(f"\nInterrupt received for script: {label}. Killing script...")
+        interrupted = True
+        kill_process_group(proc)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        print(f"Killed script: {label}")
+    finally:
+        rss_sampler.stop()
+        interrupted = interrupted or interrupted_event.is_set()
+        with running_lock:
+            running_processes.discard(proc)
+        # Wait for the output threads to finish
         proc.stdin.close()
         stdout_thread.join()
         stderr_thread.join()
-        print(f"Killed script: {label}")
+
+    if proc.returncode != 0 and not interrupted:
+        print(f"\nError running script {label} with return code {proc.returncode}")
+
+    return ScriptResult(
+        label=label,
+        command=command,
+        exit_code=proc.returncode,
+        wall_time=time.time() - start,
+        user_time=usage.ru_utime,
+        system_time=usage.ru_stime,
+        max_rss_kb=rss_sampler.max_rss_kb,
+        interrupted=interrupted,
+    )
 
 def ask_for_confirmation(label, skip_confirmation):
     skip_confirmation = skip_confirmation or ('-y' in sys.argv or '--yes' in sys.argv)
@@ -59,19 +170,77 @@ def ask_for_confirmation(label, skip_confirmation):
     response = input(f"Do you want to run the script '{label}'? (Y/n): ").strip().lower()
     return response in ("", "y", "yes")
 
-def run_scripts(scripts_to_run, skip_confirmation=False):
+def argv_option(name, default=None):
+    """
+    The value of a `--name=value` command line option, read the same way as `-y`.
+    """
+    for arg in sys.argv:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+def write_report(results: List[ScriptResult], path, wall_time):
+    report = {
+        'wall_time': wall_time,
+        'scripts': [asdict(result) for result in results],
+    }
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote report for {len(results)} scripts to {path}")
+
+def run_scripts(scripts_to_run, skip_confirmation=False, parallel=None, report_path=None) -> List[ScriptResult]:
+    """
+    Runs the scripts one after another, or up to `parallel` at a time when they don't depend on each other
+    (`--parallel=N` on the command line). Returns what each one used, and writes it as JSON to `report_path`
+    (`--report=path.json`) if given.
+    """
+    parallel = int(parallel or argv_option('parallel', 1))
+    report_path = report_path or argv_option('report')
+
     print(f"Running {len(scripts_to_run)} scripts...")
+    start = time.time()
+    results = []
+    interrupted_event.clear()
     try:
-        for label, command in scripts_to_run:
-            if ask_for_confirmation(label, skip_confirmation=skip_confirmation):
-                    run_script(label, command)
-            else:
-                print(f"Skipping script {label}.")
-    
+        if parallel <= 1:
+            for label, command in scripts_to_run:
+                if ask_for_confirmation(label, skip_confirmation=skip_confirmation):
+                    results.append(run_script(label, command))
+                    if results[-1].interrupted:
+                        raise KeyboardInterrupt
+                else:
+                    print(f"Skipping script {label}.")
+        else:
+            # Ask up front, prompts would get lost among the output of scripts already running.
+            selected = [(label, command) for label, command in scripts_to_run if ask_for_confirmation(label, skip_confirmation)]
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                futures = [executor.submit(run_script, label, command, True) for label, command in selected]
+                try:
+                    for future in futures:
+                        results.append(future.result())
+                except KeyboardInterrupt:
+                    # Only the main thread sees the interrupt, kill every running script from here.
+                    interrupted_event.set()
+                    for future in futures:
+                        future.cancel()
+                    with running_lock:
+                        processes = list(running_processes)
+                    for proc in processes:
+                        kill_process_group(proc)
+                    results = [future.result() for future in futures if not future.cancelled()]
+                    raise
+
     except KeyboardInterrupt:
         print("Interrupt received. Stopping all scripts.")
 
-    print("Finished running scripts.")
+    wall_time = time.time() - start
+    print(f"Finished running scripts in {wall_time:.1f}s.")
+    for result in results:
+        print(f"  {result.label}: exit {result.exit_code}, {result.wall_time:.1f}s wall, "
+              f"{result.user_time + result.system_time:.1f}s CPU, {result.max_rss_kb / 1024:.0f}MB peak RSS")
+    if report_path:
+        write_report(results, report_path, wall_time)
+    return results
 
 if __name__ == "__main__":
     run_scripts([
@@ -80,4 +249,4 @@ if __name__ == "__main__":
         ("List files in current directory", "ls", ),
         ("Print current working directory", "pwd", ),
         ("Print Python version", "python --version", ),
-    ])
\ No newline at end of file
+    ])
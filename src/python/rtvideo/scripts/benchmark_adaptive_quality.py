@@ -0,0 +1,91 @@
+"""
+Runs MultiThreadPipeline through a load spike with and without an AdaptiveQualityController, and reports the
+frames delivered, latency and the knob changes the controller made. A synthetic stage takes `--work-ms` per frame
+at full quality, scaled down by its quality knob, and `--slowdown` times longer between `--slowdown-at` and
+`--recover-at` seconds, standing in for a detector on a busy GPU.
+
+    python scripts/benchmark_adaptive_quality.py --fps 30 --work-ms 25 --slowdown 2 --seconds 30
+"""
+import argparse
+import logging
+import threading
+import time
+
+from rtvideo.common.structs import Frame, FrameProcessor, QualityKnob
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.adaptive_quality import AdaptiveQualityController
+from rtvideo.pipelines.multi_threaded_pipeline import MultiThreadPipeline
+from rtvideo.sinks.null import NullSink
+from synthetic import SyntheticSource
+
+# Fraction of the full-quality work done at each level, roughly how detector time falls with input size.
+WORK_SCALES = (1.0, 0.65, 0.42, 0.25)
+
+
+class LoadProcessor(FrameProcessor):
+    def __init__(self, work_ms: float, slowdown: float, slowdown_at: float, recover_at: float):
+        self.work_ms = work_ms
+        self.slowdown = slowdown
+        self.slowdown_at = slowdown_at
+        self.recover_at = recover_at
+        self.knob = QualityKnob('work_scale', WORK_SCALES)
+
+    def __str__(self) -> str:
+        return f"LoadProcessor({self.work_ms}ms)"
+
+    def open(self):
+        self.start = time.perf_counter()
+
+    def quality_knobs(self):
+        return [self.knob]
+
+    def __call__(self, frame: Frame) -> Frame:
+        elapsed = time.perf_counter() - self.start
+        slowdown = self.slowdown if self.slowdown_at <= elapsed < self.recover_at else 1.0
+        time.sleep(self.work_ms * self.knob.value * slowdown / 1000)
+        return frame
+
+
+def run(args, adaptive: bool):
+    source = SyntheticSource(args.fps, int(args.seconds * args.fps))
+    processor = LoadProcessor(args.work_ms, args.slowdown, args.slowdown_at, args.recover_at)
+    controller = AdaptiveQualityController(target_fps=args.fps, latency_budget_ms=args.latency_budget_ms, interval=args.interval) if adaptive else None
+    pipeline = MultiThreadPipeline(
+        source, [processor, NullSink()], logging.getLogger('benchmark'), Timer(), target_fps=args.fps, controller=controller,
+    )
+    thread = threading.Thread(target=pipeline.run)
+    thread.start()
+    thread.join()
+
+    print(f"{'adaptive' if adaptive else 'fixed'} quality:")
+    print(pipeline.stats)
+    if controller is not None:
+        start = processor.start
+        for adjustment in controller.adjustments:
+            print(f"\t{adjustment.timestamp - time.time() + time.perf_counter() - start:6.1f}s "
+                  f"{adjustment.knob} {adjustment.old_value} -> {adjustment.new_value} ({adjustment.reason})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--work-ms', type=float, default=25.0, help="Stage time per frame at full quality")
+    parser.add_argument('--slowdown', type=float, default=2.0, help="How much slower the stage gets during the spike")
+    parser.add_argument('--slowdown-at', type=float, default=8.0, help="Seconds in when the spike starts")
+    parser.add_argument('--recover-at', type=float, default=18.0, help="Seconds in when the spike ends")
+    parser.add_argument('--seconds', type=float, default=30.0)
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between controller checks")
+    parser.add_argument('--latency-budget-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    # The pipeline logs every dropped frame, which would drown out the results.
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f"{args.work_ms}ms stage at {args.fps} fps (one frame interval is {1000 / args.fps:.1f}ms), "
+          f"{args.slowdown}x slower from {args.slowdown_at}s to {args.recover_at}s")
+    for adaptive in (False, True):
+        run(args, adaptive)
+
+
+if __name__ == "__main__":
+    main()
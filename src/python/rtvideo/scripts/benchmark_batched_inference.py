@@ -0,0 +1,111 @@
+"""
+Runs an ONNX model for N streams at once, first with a session per stream as separate pipelines would, then with
+every stream sharing one BatchedSession, and reports the inferences per second across all streams, each stream's
+share of them, request latency and roughly how much memory the sessions took (resident memory, Linux only).
+
+    python scripts/benchmark_batched_inference.py .data/models/scrfd_2.5g.onnx --streams 1,2,4,8
+
+Batching only helps models exported with a dynamic batch dimension, others run a request at a time. Symbolic
+dimensions other than the batch are set to --input-size.
+"""
+import argparse
+import gc
+import os
+import statistics
+import threading
+import time
+
+import numpy as np
+
+from rtvideo.common.batched_session import BatchedSession
+from rtvideo.common.cpu_budget import ort_session_options
+
+
+def resident_memory_mb() -> float:
+    # Linux only, elsewhere memory isn't reported.
+    if not os.path.exists('/proc/self/status'):
+        return 0.0
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def load_session(model_path: str, threads: int):
+    import onnxruntime
+
+    return onnxruntime.InferenceSession(model_path, sess_options=ort_session_options(threads), providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+
+
+def make_input(session, input_size: int):
+    model_input = session.get_inputs()[0]
+    shape = [1] + [dim if isinstance(dim, int) else input_size for dim in model_input.shape[1:]]
+    return {model_input.name: np.random.default_rng(0).random(shape, dtype=np.float32)}
+
+
+def drive(sessions, feed, seconds: float):
+    """
+    Runs every session from its own thread as fast as it answers, returning each stream's request latencies.
+    """
+    latencies = [[] for _ in sessions]
+    deadline = time.perf_counter() + seconds
+
+    def stream(index):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            sessions[index].run(None, feed)
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=stream, args=(index,)) for index in range(len(sessions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def report(label: str, latencies, seconds: float, memory_mb: float):
+    counts = [len(stream_latencies) for stream_latencies in latencies]
+    all_latencies = sorted(latency * 1000 for stream_latencies in latencies for latency in stream_latencies)
+    p50 = all_latencies[len(all_latencies) // 2] if all_latencies else 0.0
+    p95 = all_latencies[int(len(all_latencies) * 0.95)] if all_latencies else 0.0
+    spread = statistics.pstdev(counts) / statistics.fmean(counts) if sum(counts) else 0.0
+    print(f"{label:>10}: {sum(counts) / seconds:8.1f} inferences/s, per stream {min(counts)}-{max(counts)} "
+          f"(spread {spread:.0%}), p50={p50:.2f}ms p95={p95:.2f}ms, sessions took {memory_mb:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', help='ONNX model, ideally exported with a dynamic batch dimension.')
+    parser.add_argument('--streams', default='1,2,4,8', help='Stream counts to compare. Default is 1,2,4,8.')
+    parser.add_argument('--seconds', type=float, default=5.0, help='How long each configuration runs. Default is 5.')
+    parser.add_argument('--input-size', type=int, default=640, help='Size of symbolic input dimensions. Default is 640.')
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime intra-op threads per session. Default is ONNX Runtime\'s.')
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    args = parser.parse_args()
+
+    for streams in [int(streams) for streams in args.streams.split(',')]:
+        print(f"{streams} streams:")
+
+        gc.collect()
+        before = resident_memory_mb()
+        sessions = [load_session(args.model, args.threads) for _ in range(streams)]
+        memory = resident_memory_mb() - before
+        feed = make_input(sessions[0], args.input_size)
+        report('separate', drive(sessions, feed, args.seconds), args.seconds, memory)
+        del sessions
+
+        gc.collect()
+        before = resident_memory_mb()
+        batched = BatchedSession(load_session(args.model, args.threads), max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms, name=args.model)
+        memory = resident_memory_mb() - before
+        stream_sessions = [batched.for_stream(f"stream{index}") for index in range(streams)]
+        report('batched', drive(stream_sessions, feed, args.seconds), args.seconds, memory)
+        print(f"{'':>12}{batched.summary()}")
+        batched.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Runs the same CPU-heavy pipeline with every library sizing its thread pools for the whole machine, then within a
+CpuBudget, and compares frame rate, latency and CPU used. The stages stand in for the real ones: `blur` runs
+OpenCV filters (OpenCV's pool), `infer` multiplies matrices (BLAS's pool), or runs `--model` with ONNX Runtime,
+and `record` encodes with ffmpeg.
+
+    python scripts/benchmark_cpu_budget.py --fps 30 --seconds 10 --stages blur=2,infer=4,record=2
+
+The oversubscribed run goes first, since OpenCV and BLAS thread limits can't be lifted again within a process.
+Install threadpoolctl for the budget to reach BLAS pools numpy has already started.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from rtvideo.common.cpu_budget import CpuBudget, ort_session_options, parse_cpus
+from rtvideo.common.structs import Frame, FrameProcessor
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.multi_threaded_pipeline import MultiThreadPipeline
+from rtvideo.sinks.recording import RecordingSink
+from synthetic import SyntheticSource
+
+
+class BlurProcessor(FrameProcessor):
+    def __str__(self) -> str:
+        return "BlurProcessor()"
+
+    def __call__(self, frame: Frame) -> Frame:
+        output_frame = frame.copy()
+        output_frame.pixels = cv2.GaussianBlur(frame.pixels, (15, 15), 0)
+        return output_frame
+
+
+class InferProcessor(FrameProcessor):
+    def __init__(self, model_path: str = None, size: int = 768):
+        self.model_path = model_path
+        self.size = size
+
+    def __str__(self) -> str:
+        return f"InferProcessor(model_path={self.model_path})"
+
+    def open(self):
+        if self.model_path is not None:
+            import onnxruntime
+
+            self.session = onnxruntime.InferenceSession(self.model_path, sess_options=ort_session_options(self.cpu_threads), providers=['CPUExecutionProvider'])
+            model_input = self.session.get_inputs()[0]
+            shape = [dim if isinstance(dim, int) else 1 for dim in model_input.shape]
+            self.input = {model_input.name: np.random.default_rng(0).random(shape, dtype=np.float32)}
+        else:
+            self.weights = np.random.default_rng(0).random((self.size, self.size), dtype=np.float32)
+
+    def __call__(self, frame: Frame) -> Frame:
+        if self.model_path is not None:
+            self.session.run(None, self.input)
+        else:
+            self.weights @ self.weights
+        return frame
+
+
+def parse_stages(stages: str):
+    counts = {}
+    for part in stages.split(','):
+        name, _, count = part.partition('=')
+        counts[name.strip()] = int(count)
+    return counts
+
+
+def default_stages(cpus: int):
+    # Encoding and blurring a quarter each, inference the rest, with a CPU left for the source.
+    record = blur = max(1, cpus // 4)
+    return {'blur': blur, 'infer': max(1, cpus - record - blur - 1), 'record': record}
+
+
+def run(args, budget: CpuBudget, output_dir: str):
+    pixels = np.random.default_rng(0).integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    source = SyntheticSource(args.fps, int(args.seconds * args.fps), pixels)
+    blur = BlurProcessor()
+    infer = InferProcessor(args.model)
+    record = RecordingSink(os.path.join(output_dir, 'budget.mp4'), fps=args.fps, drop_frames=True)
+    if budget is not None:
+        for processor, stage in ((blur, 'blur'), (infer, 'infer'), (record, 'record')):
+            budget.assign(processor, stage)
+
+    timer = Timer()
+    pipeline = MultiThreadPipeline(source, [blur, infer, record], logging.getLogger('benchmark'), timer, target_fps=args.fps, cpu_budget=budget)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    thread = threading.Thread(target=pipeline.run)
+    thread.start()
+    thread.join()
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    print(f"{'budgeted: ' + str(budget) if budget is not None else 'oversubscribed'}")
+    print(pipeline.stats)
+    for processor in (blur, infer):
+        durations = sorted(span.duration * 1000 for span in timer.spans if span.name == f"{processor}(frame)" and 'duration' in span.__dict__)
+        if durations:
+            print(f"\t{processor}: p50={durations[len(durations) // 2]:.2f}ms")
+    print(f"\tprocess: {cpu:.2f}s CPU over {wall:.2f}s, {cpu / wall:.2f} CPUs busy")
+    if budget is not None:
+        print("\t" + budget.report().replace("\n", "\n\t"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--cpus', default=None, help="CPUs to budget, e.g. 0-7. Default is every available CPU.")
+    parser.add_argument('--stages', default=None, help="CPUs per stage, e.g. blur=2,infer=4,record=2. Default splits --cpus.")
+    parser.add_argument('--library-threads', type=int, default=1, help="OpenCV and BLAS threads in the budgeted run")
+    parser.add_argument('--model', default=None, help="ONNX model to run in the infer stage instead of a matrix multiply")
+    args = parser.parse_args()
+
+    # The pipeline logs every dropped frame, which would drown out the results.
+    logging.basicConfig(level=logging.ERROR)
+
+    cpus = parse_cpus(args.cpus)
+    stages = parse_stages(args.stages) if args.stages else default_stages(len(cpus))
+    budget = CpuBudget(cpus, stages, library_threads=args.library_threads)
+    print(f"{len(budget.cpus)} CPUs at {args.fps} fps for {args.seconds}s")
+    with tempfile.TemporaryDirectory() as output_dir:
+        run(args, None, output_dir)
+        run(args, budget, output_dir)
+
+
+if __name__ == "__main__":
+    main()
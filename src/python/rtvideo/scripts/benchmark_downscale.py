@@ -0,0 +1,65 @@
+import argparse
+
+import cv2
+import numpy as np
+
+from rtvideo.common.structs import Frame, PixelArrangement, PixelFormat
+from rtvideo.common.timer import Timer
+from synthetic import make_test_frames
+
+DETECTOR_INPUT_SIZE = 640
+
+
+def make_test_frame(width: int, height: int, pixel_format: PixelFormat) -> Frame:
+    bgr = make_test_frames(width, height, count=1)[0]
+
+    pixels = bgr
+    if pixel_format == PixelFormat.I420_uint8:
+        pixels = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+    elif pixel_format == PixelFormat.NV12_uint8:
+        i420 = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+        u, v = i420[height:].reshape(2, -1)
+        pixels = np.vstack([i420[:height], np.dstack([u, v]).reshape(height // 2, width)])
+    return Frame(pixels, pixel_format, PixelArrangement.HWC, [])
+
+
+def full_resolution_path(frame: Frame) -> np.ndarray:
+    """
+    What the pipeline used to do: PixelFormatTransformer converts the whole frame, then SCRFD.preprocess resizes it.
+    """
+    rgb = Frame(frame.pixels, frame.pixel_format, frame.pixel_arrangement, [])._convert(PixelFormat.RGB_uint8)
+    scale = DETECTOR_INPUT_SIZE / max(frame.width, frame.height)
+    return cv2.resize(rgb, (int(frame.width * scale), int(frame.height * scale)))
+
+
+def fused_path(frame: Frame) -> np.ndarray:
+    # A fresh frame each time so the memoization doesn't hide the cost.
+    return Frame(frame.pixels, frame.pixel_format, frame.pixel_arrangement, []).downscaled(PixelFormat.RGB_uint8, DETECTOR_INPUT_SIZE)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full-frame convert+resize against Frame.downscaled for detector input.')
+    parser.add_argument('--width', type=int, default=3840, help='Width of the test frame. Default is 3840.')
+    parser.add_argument('--height', type=int, default=2160, help='Height of the test frame. Default is 2160.')
+    parser.add_argument('--iterations', type=int, default=100, help='Number of iterations per path. Default is 100.')
+    args = parser.parse_args()
+
+    timer = Timer()
+    for pixel_format in [PixelFormat.BGR_uint8, PixelFormat.NV12_uint8, PixelFormat.I420_uint8]:
+        frame = make_test_frame(args.width, args.height, pixel_format)
+        # Warm up OpenCV's thread pool and allocators.
+        full_resolution_path(frame)
+        fused_path(frame)
+
+        for _ in range(args.iterations):
+            with timer.span(f"{pixel_format.value} full-resolution convert+resize"):
+                full_resolution_path(frame)
+            with timer.span(f"{pixel_format.value} fused downscale"):
+                fused_path(frame)
+
+    print(f"{args.width}x{args.height} -> {DETECTOR_INPUT_SIZE}px detector input ({args.iterations} iterations)")
+    print(timer)
+
+
+if __name__ == "__main__":
+    main()
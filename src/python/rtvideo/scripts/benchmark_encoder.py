@@ -0,0 +1,82 @@
+"""
+Measures how fast an encoder config runs and how much CPU it takes at several resolutions, so cores can be
+budgeted between encoding and inference. Frames are pushed as fast as ffmpeg accepts them and the output is
+discarded. CPU time is the ffmpeg process's user + system time, so `cores` is how many cores it kept busy.
+
+    python scripts/benchmark_encoder.py --codec libx264 --preset veryfast --threads 2 --cpu-affinity 2,3
+"""
+import argparse
+import resource
+import time
+
+from rtvideo.common.structs import Frame, PixelArrangement, PixelFormat
+from rtvideo.sinks.encoder import EncoderConfig, FfmpegEncoder
+from synthetic import make_test_frames
+
+RESOLUTIONS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+
+
+def children_cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def benchmark(config: EncoderConfig, width: int, height: int, frame_count: int, fps: int):
+    frames = [Frame(pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, []) for pixels in make_test_frames(width, height)]
+    # Block instead of dropping so every frame is encoded.
+    encoder = FfmpegEncoder(['-loglevel', 'error', '-f', 'null', '-'], config, fps=fps, queue_size=4, drop_frames=False)
+
+    cpu_start = children_cpu_time()
+    start = time.perf_counter()
+    for i in range(frame_count):
+        encoder.write(frames[i % len(frames)])
+    encoder.close()
+    elapsed = time.perf_counter() - start
+    # Only counts once the process has been waited on, which close() does.
+    cpu_time = children_cpu_time() - cpu_start
+    return elapsed, cpu_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--codec', default='libx264', help="ffmpeg encoder, or 'auto'")
+    parser.add_argument('--preset', default='veryfast')
+    parser.add_argument('--tune', default=None)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--cpu-affinity', type=lambda value: [int(cpu) for cpu in value.split(',')], default=None,
+                        help="Comma separated CPUs to pin ffmpeg to")
+    parser.add_argument('--resolutions', default='480p,720p,1080p', help=f"Any of {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--fps', type=int, default=30, help="Frame rate the stream is encoded for")
+    args = parser.parse_args()
+
+    config = EncoderConfig(
+        codec=args.codec,
+        preset=args.preset,
+        tune=args.tune,
+        threads=args.threads,
+        cpu_affinity=args.cpu_affinity,
+        gop=args.fps,
+    )
+    codec = config.resolved_codec()
+    print(f"{codec} preset={config.preset} tune={config.tune} threads={config.threads} affinity={config.cpu_affinity}")
+
+    for name in args.resolutions.split(','):
+        width, height = RESOLUTIONS[name]
+        elapsed, cpu_time = benchmark(config, width, height, args.frames, args.fps)
+        encode_fps = args.frames / elapsed
+        # CPU needed to keep up with a live stream at the target frame rate.
+        cores_at_target = cpu_time / args.frames * args.fps
+        print(f"{name:>6} ({width}x{height}): {encode_fps:7.1f} fps, "
+              f"{cpu_time / args.frames * 1000:6.2f}ms CPU/frame, "
+              f"{cpu_time / elapsed:4.2f} cores busy, "
+              f"{cores_at_target:4.2f} cores at {args.fps} fps")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Replays a recorded MJPEG stream through WebcamSource at a camera's frame rate, decoding inside read() as OpenCV
+does by default, then on pools of decode threads, and reports how many frames each delivers and how long frames
+take from arriving to being handed out, detector input included. Raise --fps until frames start dropping to find
+the rate each keeps up with. Also compares shrinking a full decode for detector input against a reduced-size decode.
+
+Record a stream straight from a camera without re-encoding:
+
+    ffmpeg -f v4l2 -input_format mjpeg -video_size 1920x1080 -framerate 60 -i /dev/video0 -c copy -t 10 camera.mjpeg
+
+or make one from any video:
+
+    ffmpeg -i input.mp4 -c:v mjpeg -q:v 3 -f mjpeg camera.mjpeg
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from rtvideo.common.structs import Frame, PixelArrangement, PixelFormat
+from rtvideo.common.timer import Timer
+from rtvideo.sources.webcam import WebcamSource
+
+JPEG_START = b'\xff\xd8\xff'
+
+
+def read_jpegs(path: str):
+    """
+    Splits a raw MJPEG stream (ffmpeg's `-f mjpeg`) into its JPEG images.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    starts = []
+    position = data.find(JPEG_START)
+    while position != -1:
+        starts.append(position)
+        position = data.find(JPEG_START, position + 1)
+    return [np.frombuffer(data[start:end], dtype=np.uint8) for start, end in zip(starts, starts[1:] + [len(data)])]
+
+
+class RecordedCapture:
+    """
+    Stands in for cv2.VideoCapture, delivering recorded JPEGs at `fps`, decoded unless CONVERT_RGB is turned off
+    like a V4L2 capture. Remembers when each frame arrived.
+    """
+    def __init__(self, jpegs, frames: int, fps: float):
+        self.jpegs = jpegs
+        self.frames = frames
+        self.interval = 1 / fps
+        self.convert_rgb = True
+        self.read_times = []
+
+    def __call__(self, device, api):
+        return self
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+    def read(self):
+        index = len(self.read_times)
+        if index >= self.frames:
+            return False, None
+        if index == 0:
+            self.start = time.perf_counter()
+        delay = self.start + index * self.interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.read_times.append(time.perf_counter())
+        jpeg = self.jpegs[index % len(self.jpegs)]
+        pixels = cv2.imdecode(jpeg, cv2.IMREAD_COLOR) if self.convert_rgb else jpeg.copy()
+        return True, pixels
+
+
+def run_source(jpegs, frames: int, fps: float, decode_threads: int, detection_size: int, width: int, height: int, timer: Timer, label: str):
+    capture = RecordedCapture(jpegs, frames, fps)
+    source = WebcamSource(width, height, fps, fourcc='MJPG', capture_factory=capture, decode_threads=decode_threads, detection_size=detection_size if decode_threads else None)
+    source.open()
+    delivered = 0
+    try:
+        for frame in source:
+            if not decode_threads:
+                # Decoding inline, the detector input is made on the source thread too.
+                frame.downscaled(PixelFormat.RGB_uint8, detection_size)
+            # The decode pool may drop frames, it numbers the ones it reads.
+            index = frame.sequence if decode_threads else delivered
+            timer.span(f"{label} arrival to delivery").duration = time.perf_counter() - capture.read_times[index]
+            delivered += 1
+    finally:
+        source.close()
+    elapsed = time.perf_counter() - capture.start
+    print(f"{label}: {delivered}/{frames} frames delivered, {delivered / elapsed:.1f} fps")
+
+
+def compare_detection_input(jpegs, detection_size: int, iterations: int, timer: Timer):
+    jpeg = jpegs[0]
+    reduced = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+    for _ in range(iterations):
+        with timer.span("full decode"):
+            pixels = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+        with timer.span(f"downscale full decode to {detection_size}"):
+            Frame(pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, []).downscaled(PixelFormat.RGB_uint8, detection_size)
+        for factor, flag in reduced.items():
+            if max(pixels.shape[:2]) // factor >= detection_size:
+                with timer.span(f"reduced 1/{factor} decode"):
+                    cv2.imdecode(jpeg, flag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='Raw MJPEG stream, e.g. recorded with ffmpeg -c copy -f mjpeg.')
+    parser.add_argument('--frames', type=int, default=600, help='Frames to deliver per run, looping the recording. Default is 600.')
+    parser.add_argument('--fps', type=float, default=60, help='Rate the recording is delivered at, like a camera. Default is 60.')
+    parser.add_argument('--threads', default='0,1,2,4', help='Decode thread counts to compare, 0 decodes inside read(). Default is 0,1,2,4.')
+    parser.add_argument('--detection-size', type=int, default=640, help='Detector input size. Default is 640.')
+    args = parser.parse_args()
+
+    jpegs = read_jpegs(args.input)
+    if not jpegs:
+        parser.error(f"No JPEG images found in {args.input}")
+    first = cv2.imdecode(jpegs[0], cv2.IMREAD_COLOR)
+    height, width = first.shape[:2]
+    print(f"{len(jpegs)} JPEGs of {width}x{height}, {sum(jpeg.size for jpeg in jpegs) / len(jpegs) / 1024:.0f}KB on average")
+
+    timer = Timer()
+    for threads in [int(threads) for threads in args.threads.split(',')]:
+        label = f"{threads} decode threads" if threads else "decode in read()"
+        run_source(jpegs, args.frames, args.fps, threads, args.detection_size, width, height, timer, label)
+    compare_detection_input(jpegs, args.detection_size, min(args.frames, 100), timer)
+    print(timer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measures how long MultiThreadPipeline takes to shut down and how many frames it loses on the way, for a chain
+of synthetic stages that each take `--work-ms` per frame.
+
+    python scripts/benchmark_shutdown.py --stages 4 --work-ms 20
+
+Scenarios:
+    end of stream   a finite source runs out, the pipeline drains and exits on its own
+    stop            stop() mid-stream, in-flight frames finish within the shutdown deadline
+    abort           abort() mid-stream, in-flight frames are dropped
+"""
+import argparse
+import logging
+import threading
+import time
+
+from rtvideo.common.structs import Frame, FrameProcessor
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.multi_threaded_pipeline import MultiThreadPipeline
+from rtvideo.sinks.null import NullSink
+from synthetic import SyntheticSource
+
+
+class WorkProcessor(FrameProcessor):
+    def __init__(self, work_ms: float):
+        self.work_ms = work_ms
+
+    def __str__(self) -> str:
+        return f"WorkProcessor({self.work_ms}ms)"
+
+    def __call__(self, frame: Frame) -> Frame:
+        time.sleep(self.work_ms / 1000)
+        return frame
+
+
+def run_scenario(args, scenario: str, drain: bool):
+    max_frames = args.frames if scenario == 'end of stream' else None
+    source = SyntheticSource(args.fps, max_frames)
+    sink = NullSink()
+    processors = [WorkProcessor(args.work_ms) for _ in range(args.stages)] + [sink]
+    pipeline = MultiThreadPipeline(
+        source, processors, logging.getLogger('benchmark'), Timer(), target_fps=args.fps, drain=drain,
+        shutdown_timeout=args.shutdown_timeout,
+    )
+
+    thread = threading.Thread(target=pipeline.run)
+    thread.start()
+    if scenario == 'end of stream':
+        while thread.is_alive() and source.frame_count < args.frames:
+            time.sleep(0.001)
+    else:
+        time.sleep(args.frames / args.fps)
+    requested = time.perf_counter()
+    if scenario == 'stop':
+        pipeline.stop()
+    elif scenario == 'abort':
+        pipeline.abort()
+    thread.join()
+    latency = time.perf_counter() - requested
+    return latency, source.frame_count, sink.frame_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stages', type=int, default=4)
+    parser.add_argument('--work-ms', type=float, default=20.0)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--frames', type=int, default=90, help="Frames to run before shutting down")
+    parser.add_argument('--shutdown-timeout', type=float, default=10.0)
+    args = parser.parse_args()
+
+    # The pipeline logs every dropped frame, which would drown out the results.
+    logging.basicConfig(level=logging.ERROR)
+
+    print(f"{args.stages} stages x {args.work_ms}ms at {args.fps} fps "
+          f"(one stage interval is {1000 / args.fps:.1f}ms)")
+    for scenario in ('end of stream', 'stop', 'abort'):
+        for drain in (False, True):
+            latency, produced, delivered = run_scenario(args, scenario, drain)
+            print(f"{scenario:>13} {'drain' if drain else 'live ':>5}: shutdown {latency * 1000:7.1f}ms, "
+                  f"{delivered}/{produced} frames reached the sink")
+
+
+if __name__ == "__main__":
+    main()
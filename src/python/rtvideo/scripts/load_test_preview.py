@@ -0,0 +1,137 @@
+"""
+Headless load test for PreviewSink. Feeds synthetic frames at a fixed rate while many local clients watch over
+WebSocket and MJPEG, some of them reading deliberately slowly, then reports how long the sink held up the
+pipeline and what frame rate each kind of client got.
+
+    python scripts/load_test_preview.py --clients 50 --slow-clients 5 --duration 10
+"""
+import argparse
+import asyncio
+import base64
+import os
+import threading
+import time
+
+import numpy as np
+
+from rtvideo.common.structs import Frame, PixelArrangement, PixelFormat
+from rtvideo.sinks.http import read_websocket_frame
+from rtvideo.sinks.preview import PreviewSink
+from synthetic import make_test_frames
+
+
+def produce(sink: PreviewSink, frames: list, fps: int, duration: float, ready: threading.Event, call_times: list):
+    ready.wait()
+    start = time.perf_counter()
+    i = 0
+    while time.perf_counter() - start < duration:
+        frame = Frame(frames[i % len(frames)], PixelFormat.BGR_uint8, PixelArrangement.HWC, [])
+        call_start = time.perf_counter()
+        sink(frame)
+        call_times.append(time.perf_counter() - call_start)
+        i += 1
+        time.sleep(max(0.0, start + i / fps - time.perf_counter()))
+
+
+async def mjpeg_client(port: int, delay: float, stats: dict):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b"GET /stream.mjpeg HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    stats['connected'] = True
+    try:
+        while True:
+            length = 0
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length + 2)
+            stats['frames'] += 1
+            await asyncio.sleep(delay)
+    finally:
+        writer.close()
+
+
+async def websocket_client(port: int, delay: float, stats: dict):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((
+        "GET /ws HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+    stats['connected'] = True
+    try:
+        while True:
+            await read_websocket_frame(reader)
+            stats['frames'] += 1
+            await asyncio.sleep(delay)
+    finally:
+        writer.close()
+
+
+async def run_clients(args, ready: threading.Event) -> list:
+    clients = []
+    for i in range(args.clients):
+        slow = i < args.slow_clients
+        kind = 'websocket' if i % 2 == 0 else 'mjpeg'
+        stats = {'kind': kind, 'slow': slow, 'frames': 0, 'connected': False}
+        client = websocket_client if kind == 'websocket' else mjpeg_client
+        clients.append((stats, asyncio.ensure_future(client(args.port, args.slow_delay if slow else 0.0, stats))))
+
+    while not all(stats['connected'] for stats, _ in clients):
+        await asyncio.sleep(0.01)
+    ready.set()
+    await asyncio.sleep(args.duration)
+    for _, task in clients:
+        task.cancel()
+    await asyncio.gather(*[task for _, task in clients], return_exceptions=True)
+    return [stats for stats, _ in clients]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8890)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--slow-clients', type=int, default=5)
+    parser.add_argument('--slow-delay', type=float, default=0.5, help="Seconds slow clients wait between frames")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--max-size', type=int, default=1280)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    frames = make_test_frames(args.width, args.height)
+    sink = PreviewSink(port=args.port, max_size=args.max_size, workers=args.workers)
+    sink.open()
+    call_times = []
+    # Every client connects before the first frame so none of them miss the start.
+    ready = threading.Event()
+    producer = threading.Thread(target=produce, args=(sink, frames, args.fps, args.duration, ready, call_times))
+    producer.start()
+    try:
+        results = asyncio.run(run_clients(args, ready))
+    finally:
+        producer.join()
+        sink.close()
+
+    call_times_ms = np.array(call_times) * 1000
+    print(f"Produced {len(call_times)} frames at {args.fps} fps, sink call p50 {np.percentile(call_times_ms, 50):.2f}ms "
+          f"p99 {np.percentile(call_times_ms, 99):.2f}ms max {call_times_ms.max():.2f}ms")
+    print(f"Skipped {sink.skipped_frames} frames with every encoder busy, final preview size {sink.size}")
+    print(f"Viewer slots replaced before sending {sink.server.dropped}/{sink.server.offered}")
+    print(f"Encodes finished after a newer frame and discarded {sink.server.stale}")
+    for kind in ('websocket', 'mjpeg'):
+        for slow in (False, True):
+            frames = [stats['frames'] for stats in results if stats['kind'] == kind and stats['slow'] == slow]
+            if frames:
+                fps = np.array(frames) / args.duration
+                print(f"{kind:>9} {'slow' if slow else 'fast'}: {len(frames):3d} clients, "
+                      f"{fps.mean():5.1f} fps avg, {fps.min():5.1f} fps min")
+
+
+if __name__ == "__main__":
+    main()
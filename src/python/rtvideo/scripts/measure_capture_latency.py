@@ -0,0 +1,421 @@
+"""
+Measures the latency and throughput of each way of capturing frames, across resolutions, frame rates and
+pixel formats, and writes the results as a matrix. No camera needed:
+
+    python scripts/measure_capture_latency.py --resolutions 640x480,1920x1080 --fps 30,60 --output .data/capture.csv
+
+A producer draws a TimestampOverlay barcode into a test pattern at the target frame rate and writes the raw
+frames to a stand-in device, a FIFO by default or a v4l2loopback device with `--device /dev/video10`
+(`sudo modprobe v4l2loopback video_nr=10`). Each backend reads them back the way the pipelines and
+play_opencv.py do, and every frame's barcode is compared with the clock when the backend hands it over, so
+latency covers the transport, the backend's buffering and its pixel format conversion.
+
+A FIFO applies backpressure instead of dropping frames like a camera would, so a backend that can't keep up
+shows a low frame rate rather than a growing latency.
+"""
+import argparse
+import csv
+from dataclasses import dataclass
+import errno
+import json
+import os
+import subprocess as sp
+import tempfile
+import threading
+import time
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+from rtvideo.common.structs import PLANAR_YUV_FORMATS, Frame, PixelArrangement, PixelFormat
+from rtvideo.processors.timestamp_overlay import TimestampOverlay, read_timestamp
+from rtvideo.sinks.encoder import FFMPEG_PIXEL_FORMATS
+from rtvideo.sources.replay import frame_shape
+
+V4L2_FOURCCS = {
+    PixelFormat.BGR_uint8: 'BGR3',
+    PixelFormat.YUYV422_uint8: 'YUYV',
+    PixelFormat.NV12_uint8: 'NV12',
+    PixelFormat.I420_uint8: 'YU12',
+}
+
+GSTREAMER_FORMATS = {
+    PixelFormat.BGR_uint8: 'BGR',
+    PixelFormat.YUYV422_uint8: 'YUY2',
+    PixelFormat.NV12_uint8: 'NV12',
+    PixelFormat.I420_uint8: 'I420',
+}
+
+HAS_GSTREAMER = any(
+    'GStreamer' in line and 'YES' in line for line in cv2.getBuildInformation().splitlines()
+)
+
+
+@dataclass
+class CaptureConfig:
+    width: int
+    height: int
+    fps: int
+    pixel_format: PixelFormat
+
+    @property
+    def ffmpeg_pix_fmt(self) -> str:
+        return FFMPEG_PIXEL_FORMATS[self.pixel_format]
+
+    @property
+    def cell_size(self) -> int:
+        # The barcode needs 36 cells across, shrink them on small frames.
+        return max(4, min(12, self.width // 40))
+
+    def __str__(self) -> str:
+        return f"{self.width}x{self.height}@{self.fps} {self.pixel_format.value}"
+
+
+def test_pattern(config: CaptureConfig) -> np.ndarray:
+    """
+    A diagonal gradient in the config's pixel format, neutral chroma for YUV.
+    """
+    shape, dtype = frame_shape(config.pixel_format, config.width, config.height)
+    ramp = ((np.arange(config.height)[:, None] + np.arange(config.width)[None, :]) % 256).astype(dtype)
+    pixels = np.full(shape, 128, dtype=dtype)
+    if config.pixel_format in PLANAR_YUV_FORMATS:
+        pixels[:config.height] = ramp
+    elif config.pixel_format == PixelFormat.YUYV422_uint8:
+        pixels[:, :, 0] = ramp
+    else:
+        pixels[:] = ramp[:, :, None]
+    return pixels
+
+
+def decodable(pixels: np.ndarray, pixel_format: Optional[PixelFormat], height: int) -> np.ndarray:
+    """
+    The part of a captured frame read_timestamp understands, BGR as is or the luma plane of raw YUV.
+    """
+    if pixel_format in PLANAR_YUV_FORMATS:
+        return pixels.reshape(-1, pixels.shape[-1])[:height]
+    if pixel_format == PixelFormat.YUYV422_uint8:
+        return pixels.reshape(height, -1, 2)[:, :, 0]
+    return pixels
+
+
+def read_exact(stream, buffer: np.ndarray) -> bool:
+    """
+    Fills `buffer` from `stream` in place, returning False if the stream ends first.
+    """
+    view = memoryview(buffer).cast('B')
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
+            return False
+        filled += count
+    return True
+
+
+class Producer(threading.Thread):
+    """
+    Stamps the test pattern and writes it to the stand-in device at the config's frame rate until stopped.
+    """
+    def __init__(self, config: CaptureConfig, device: Optional[str], fifo: Optional[str]):
+        super().__init__(name='producer')
+        self.config = config
+        self.device = device
+        self.fifo = fifo
+        self.stop_event = threading.Event()
+        self.frames = 0
+
+    def open_fifo(self):
+        # Opening a FIFO for writing fails until there's a reader, poll so a backend that never opens it can't hang us.
+        while not self.stop_event.is_set():
+            try:
+                fd = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                time.sleep(0.01)
+                continue
+            os.set_blocking(fd, True)
+            return open(fd, 'wb', buffering=0)
+        return None
+
+    def run(self):
+        config = self.config
+        frame = Frame(test_pattern(config), config.pixel_format, PixelArrangement.HWC, [])
+        overlay = TimestampOverlay(cell_size=config.cell_size, show_text=False)
+
+        if self.device is not None:
+            process = sp.Popen([
+                'ffmpeg', '-hide_banner', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', config.ffmpeg_pix_fmt, '-s', f'{config.width}x{config.height}',
+                '-framerate', str(config.fps), '-i', '-',
+                '-f', 'v4l2', '-pix_fmt', config.ffmpeg_pix_fmt, self.device,
+            ], stdin=sp.PIPE)
+            output = process.stdin
+        else:
+            process = None
+            output = self.open_fifo()
+            if output is None:
+                return
+
+        start = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                delay = start + self.frames / config.fps - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                overlay(frame)
+                output.write(frame.pixels.data)
+                self.frames += 1
+        except (BrokenPipeError, ValueError):
+            # The backend has closed its end.
+            pass
+        finally:
+            try:
+                output.close()
+            except BrokenPipeError:
+                pass
+            if process is not None:
+                process.wait()
+
+
+class Reader:
+    """
+    A capture backend. `read` returns the next frame, or None once the stream has ended.
+    """
+    pixel_format: Optional[PixelFormat] = None
+
+    def read(self) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RawReader(Reader):
+    """
+    Reads raw frames straight from the FIFO, the floor for every other backend.
+    """
+    def __init__(self, config: CaptureConfig, path: str):
+        shape, dtype = frame_shape(config.pixel_format, config.width, config.height)
+        self.pixel_format = config.pixel_format
+        self.buffer = np.empty(shape, dtype=dtype)
+        self.file = open(path, 'rb', buffering=0)
+
+    def read(self) -> Optional[np.ndarray]:
+        return self.buffer if read_exact(self.file, self.buffer) else None
+
+    def close(self):
+        self.file.close()
+
+
+class FfmpegPipeReader(Reader):
+    """
+    An ffmpeg subprocess converting to BGR on a pipe, like play_opencv.py's ffmpeg source.
+    """
+    def __init__(self, config: CaptureConfig, path: str, is_device: bool):
+        size = f'{config.width}x{config.height}'
+        if is_device:
+            input_args = ['-f', 'v4l2', '-input_format', config.ffmpeg_pix_fmt, '-video_size', size, '-framerate', str(config.fps)]
+        else:
+            input_args = ['-f', 'rawvideo', '-pix_fmt', config.ffmpeg_pix_fmt, '-s', size, '-framerate', str(config.fps)]
+        self.process = sp.Popen([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-fflags', 'nobuffer',
+            *input_args, '-i', path,
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-',
+        ], stdout=sp.PIPE)
+        self.buffer = np.empty((config.height, config.width, 3), dtype=np.uint8)
+
+    def read(self) -> Optional[np.ndarray]:
+        return self.buffer if read_exact(self.process.stdout, self.buffer) else None
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class OpenCvReader(Reader):
+    """
+    cv2.VideoCapture, the way FileSource and WebcamSource capture.
+    """
+    def __init__(self, capture: cv2.VideoCapture):
+        if not capture.isOpened():
+            raise RuntimeError("VideoCapture failed to open")
+        self.capture = capture
+
+    def read(self) -> Optional[np.ndarray]:
+        ret, pixels = self.capture.read()
+        return pixels if ret else None
+
+    def close(self):
+        self.capture.release()
+
+
+def open_opencv_ffmpeg(config: CaptureConfig, path: str) -> Reader:
+    # OpenCV passes these to avformat_open_input, there's no other way to describe a raw stream to it.
+    os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = '|'.join([
+        'input_format;rawvideo',
+        f'pixel_format;{config.ffmpeg_pix_fmt}',
+        f'video_size;{config.width}x{config.height}',
+        f'framerate;{config.fps}',
+    ])
+    try:
+        return OpenCvReader(cv2.VideoCapture(path, cv2.CAP_FFMPEG))
+    finally:
+        del os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS']
+
+
+def open_opencv_v4l2(config: CaptureConfig, path: str) -> Reader:
+    capture = cv2.VideoCapture(path, cv2.CAP_V4L2)
+    capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc(*V4L2_FOURCCS[config.pixel_format]))
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, config.width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, config.height)
+    capture.set(cv2.CAP_PROP_FPS, config.fps)
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return OpenCvReader(capture)
+
+
+def open_gstreamer(config: CaptureConfig, path: str, is_device: bool) -> Reader:
+    caps = f'width={config.width},height={config.height},framerate={config.fps}/1'
+    if is_device:
+        source = f'v4l2src device={path} ! video/x-raw,format={GSTREAMER_FORMATS[config.pixel_format]},{caps}'
+    else:
+        source = (
+            f'filesrc location={path} ! rawvideoparse format={GSTREAMER_FORMATS[config.pixel_format].lower()} '
+            f'width={config.width} height={config.height} framerate={config.fps}/1'
+        )
+    pipeline = f'{source} ! videoconvert ! video/x-raw,format=BGR ! appsink sync=false max-buffers=1 drop=true'
+    return OpenCvReader(cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER))
+
+
+def backends(is_device: bool):
+    """
+    The backends that can read the stand-in device, by name.
+    """
+    available = {}
+    if is_device:
+        available['opencv-v4l2'] = open_opencv_v4l2
+    else:
+        available['raw'] = RawReader
+        available['opencv-ffmpeg'] = open_opencv_ffmpeg
+    available['ffmpeg-pipe'] = lambda config, path: FfmpegPipeReader(config, path, is_device)
+    if HAS_GSTREAMER:
+        available['gstreamer'] = lambda config, path: open_gstreamer(config, path, is_device)
+    return available
+
+
+def measure(config: CaptureConfig, name: str, open_reader: Callable, device: Optional[str], seconds: float, warmup: float):
+    fifo = None
+    if device is None:
+        fifo = os.path.join(tempfile.mkdtemp(prefix='capture-latency-'), 'frames')
+        os.mkfifo(fifo)
+
+    producer = Producer(config, device, fifo)
+    producer.start()
+    reader = None
+    latencies_ms = []
+    unreadable = 0
+    try:
+        reader = open_reader(config, device or fifo)
+        start = time.time()
+        while time.time() < start + warmup + seconds:
+            pixels = reader.read()
+            if pixels is None:
+                break
+            received_ms = time.time() * 1000
+            if received_ms < (start + warmup) * 1000:
+                continue
+
+            timestamp_ms = read_timestamp(decodable(pixels, reader.pixel_format, config.height), config.cell_size)
+            if timestamp_ms is None:
+                unreadable += 1
+            else:
+                latencies_ms.append(received_ms - timestamp_ms)
+    except Exception as e:
+        print(f"  {name} failed: {e}")
+    finally:
+        producer.stop_event.set()
+        if reader is not None:
+            reader.close()
+        producer.join()
+        if fifo is not None:
+            os.remove(fifo)
+            os.rmdir(os.path.dirname(fifo))
+
+    result = {
+        'backend': name,
+        'resolution': f'{config.width}x{config.height}',
+        'fps': config.fps,
+        'pixel_format': config.pixel_format.value,
+        'frames': len(latencies_ms),
+        'unreadable': unreadable,
+        'received_fps': round((len(latencies_ms) + unreadable) / seconds, 1),
+    }
+    if latencies_ms:
+        latencies_ms = np.array(latencies_ms)
+        result.update({
+            'latency_p50_ms': round(float(np.percentile(latencies_ms, 50)), 1),
+            'latency_p95_ms': round(float(np.percentile(latencies_ms, 95)), 1),
+            'latency_max_ms': round(float(latencies_ms.max()), 1),
+        })
+    return result
+
+
+def write_results(results: List[dict], path: str):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        return
+
+    columns = list(dict.fromkeys(key for result in results for key in result))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', default='640x480,1280x720,1920x1080', help="Comma-separated WIDTHxHEIGHT")
+    parser.add_argument('--fps', default='30', help="Comma-separated frame rates")
+    parser.add_argument('--pixel-formats', default='BGR_uint8,YUYV422_uint8,NV12_uint8', help="Comma-separated PixelFormat names")
+    parser.add_argument('--backends', help="Comma-separated backends to run. Default is every one available")
+    parser.add_argument('--device', help="v4l2loopback device to use instead of a FIFO")
+    parser.add_argument('--seconds', type=float, default=5.0, help="Measurement time per combination")
+    parser.add_argument('--warmup', type=float, default=1.0, help="Seconds to ignore while each backend settles")
+    parser.add_argument('--output', help="Write the matrix to a .csv or .json file")
+    args = parser.parse_args()
+
+    available = backends(args.device is not None)
+    names = args.backends.split(',') if args.backends else list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"Unavailable backends {unknown}, expected some of {list(available)}")
+
+    configs = [
+        CaptureConfig(*map(int, resolution.split('x')), fps, PixelFormat(pixel_format))
+        for resolution in args.resolutions.split(',')
+        for fps in map(int, args.fps.split(','))
+        for pixel_format in args.pixel_formats.split(',')
+    ]
+
+    results = []
+    for config in configs:
+        print(f"{config}:")
+        for name in names:
+            result = measure(config, name, available[name], args.device, args.seconds, args.warmup)
+            results.append(result)
+            if 'latency_p50_ms' in result:
+                print(f"  {name:>14}: {result['received_fps']:6.1f} fps, latency p50 {result['latency_p50_ms']:6.1f}ms "
+                      f"p95 {result['latency_p95_ms']:6.1f}ms max {result['latency_max_ms']:6.1f}ms")
+            else:
+                print(f"  {name:>14}: no readable frames")
+
+    if args.output:
+        write_results(results, args.output)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
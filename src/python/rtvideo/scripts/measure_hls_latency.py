@@ -0,0 +1,66 @@
+"""
+Measures end-to-end HLS latency. Put a TimestampOverlay right after the source, e.g.
+
+    processors:
+      - type: timestamp_overlay
+      - type: face_detector
+        ...
+    sinks:
+      - type: hls
+        output_dir: .data/hls
+        low_latency: true
+
+then point this script at the playlist while the pipeline runs. Every decoded frame's barcode is compared
+with the wall clock, so the numbers cover processing, encoding, segmenting and player buffering.
+Both ends must run on the same machine (or on NTP-synced clocks).
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from rtvideo.processors.timestamp_overlay import read_timestamp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('url', help="Playlist URL or path, e.g. http://localhost:8888/stream.m3u8")
+    parser.add_argument('--frames', type=int, default=300, help="Number of frames to sample")
+    parser.add_argument('--cell-size', type=int, default=12, help="Cell size the overlay was drawn with")
+    args = parser.parse_args()
+
+    capture = cv2.VideoCapture(args.url)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open {args.url}")
+
+    latencies_ms = []
+    unreadable = 0
+    try:
+        while len(latencies_ms) < args.frames:
+            ret, frame = capture.read()
+            if not ret:
+                break
+
+            received_ms = time.time() * 1000
+            timestamp_ms = read_timestamp(frame, args.cell_size)
+            if timestamp_ms is None:
+                unreadable += 1
+                continue
+            latencies_ms.append(received_ms - timestamp_ms)
+    finally:
+        capture.release()
+
+    if not latencies_ms:
+        raise RuntimeError(f"No timestamps found in {unreadable} frames, is TimestampOverlay in the pipeline?")
+
+    latencies_ms = np.array(latencies_ms)
+    print(f"Frames: {len(latencies_ms)} ({unreadable} without a readable timestamp)")
+    print(f"Latency: min {latencies_ms.min():.0f}ms, "
+          f"p50 {np.percentile(latencies_ms, 50):.0f}ms, "
+          f"p95 {np.percentile(latencies_ms, 95):.0f}ms, "
+          f"max {latencies_ms.max():.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,11 @@ import numpy as np
 import subprocess
 import argparse
 
+from rtvideo.common.frame_ring import FrameRing
+from rtvideo.common.structs import Frame, PixelArrangement, PixelFormat
+from rtvideo.processors import health
+from rtvideo.sources.replay import NpyReplaySource
+
 HOME_DIR = os.environ["HOME"]
 FFMPEG = f"{HOME_DIR}/code/ffmpeg/bin/ffmpeg"
 
@@ -34,10 +39,8 @@ def read_exact(pipe: subprocess.Popen, size: int) -> bytes:
     return buffer
 
 def is_black_frame(frame):
-    black_channel_rows = np.all(frame == 0, axis=1)
-    black_rows = np.all(black_channel_rows, axis=1)
-    number_of_black_rows = np.sum(black_rows)
-    return number_of_black_rows > frame.shape[0] / 4
+    # Checks a strided sample of the rows rather than comparing every pixel.
+    return health.is_black_frame(Frame(frame, PixelFormat.BGR_uint8, PixelArrangement.HWC, []), black_level=0)
 
 def main():
     parser = argparse.ArgumentParser(description='Video stream display using OpenCV with different backends.')
@@ -87,11 +90,13 @@ def main():
     cv2.setWindowProperty(window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
     
     FRAME_BUFFER_SIZE = args.fps * 5
-    frame_buffer = []
+    frame_buffer = FrameRing(FRAME_BUFFER_SIZE)
     success_message_display_time = 0
 
+    replay = None
     if args.npy_input:
-        frame_buffer = list(np.load(args.npy_input))
+        replay = NpyReplaySource(args.npy_input)
+        replay.open()
 
     try:
         frame_count = 0
@@ -101,9 +106,8 @@ def main():
                 if frame is None:
                     print("Failed to read frame from FFmpeg. Exiting...")
                     break
-            elif args.npy_input:
-                frame = frame_buffer[0]
-                frame_buffer.pop(0)
+            elif replay is not None:
+                frame = next(replay).pixels
             else:
                 ret, frame = cap.read()
                 if not ret:
@@ -114,7 +118,7 @@ def main():
                 print("Black frame detected. Skipping...")
                 continue
 
-            frame_buffer.append(frame.copy())
+            frame_buffer.append(frame)
 
             if frame_count % 100 == 0:
                 print(f"Rendered {frame_count} frames")
@@ -127,9 +131,6 @@ def main():
             color = (255, 255, 255)  # Text color in BGR
             thickness = 2  # Thickness of the lines used to draw the text
 
-            if len(frame_buffer) > FRAME_BUFFER_SIZE:
-                frame_buffer.pop(0)
-
             # Use cv2.putText() to add text to the frame
             cv2.putText(frame, text, org, font, fontScale, color, thickness, cv2.LINE_AA)
 
@@ -144,14 +145,16 @@ def main():
             key = cv2.waitKey(1) & 0xFF
 
             is_manual_save = args.frame_buffer_out and key == ord('s')
-            is_auto_save = args.autosave and len(frame_buffer) == FRAME_BUFFER_SIZE and success_message_display_time == 0
+            is_auto_save = args.autosave and frame_buffer.is_full and success_message_display_time == 0
             if key == ord('q'):
                 break
             elif is_manual_save or is_auto_save:
-                np.save(args.frame_buffer_out, np.array(frame_buffer))
+                frame_buffer.save(args.frame_buffer_out)
                 success_message_display_time = 60
 
     finally:
+        if frame_buffer.save_thread is not None:
+            frame_buffer.save_thread.join()
         if cap is not None:
             cap.release()
         if args.source_type == 'ffmpeg':
@@ -0,0 +1,46 @@
+"""
+Synthetic input shared by the benchmark scripts.
+"""
+import time
+from typing import Optional
+
+import numpy as np
+
+from rtvideo.common.structs import Frame, FrameSource, PixelArrangement, PixelFormat
+from rtvideo.common.timer import NoopTimerSpan
+
+
+class SyntheticSource(FrameSource):
+    """
+    Repeats `pixels` (black 640x360 by default) paced like a camera at `fps`, numbered and timestamped like a
+    real source, for `max_frames` frames or until stopped.
+    """
+    def __init__(self, fps: int, max_frames: Optional[int] = None, pixels: Optional[np.ndarray] = None):
+        self.fps = fps
+        self.max_frames = max_frames
+        self.pixels = pixels if pixels is not None else np.zeros((360, 640, 3), dtype=np.uint8)
+        self.frame_count = 0
+
+    def open(self):
+        self.start = time.perf_counter()
+
+    def __next__(self) -> Frame:
+        if self.max_frames is not None and self.frame_count >= self.max_frames:
+            raise StopIteration
+        time.sleep(max(0.0, self.start + self.frame_count / self.fps - time.perf_counter()))
+        self.frame_count += 1
+        now = time.time()
+        return Frame(self.pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, [], span=NoopTimerSpan(), sequence=self.frame_count - 1, capture_ts=now, arrival_ts=now)
+
+
+def make_test_frames(width: int, height: int, count: int = 30):
+    """
+    BGR frames of moving noise over a gradient, so resizing, conversion and encoding do real work.
+    """
+    xs = np.linspace(0, 255, width, dtype=np.float32)
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.dstack([np.broadcast_to(xs, (height, width)), np.broadcast_to(ys, (height, width)), (xs + ys) / 2])
+    return [
+        (np.roll(base, i * 8, axis=1) + np.random.normal(0, 4, base.shape)).clip(0, 255).astype(np.uint8)
+        for i in range(count)
+    ]
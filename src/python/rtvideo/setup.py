@@ -17,5 +17,12 @@ setup(
         'opencv-python',
         'cupy',
         'onnxruntime-gpu',
+        'pyyaml',
+        'tomli; python_version < "3.11"',
     ],
+    entry_points={
+        'console_scripts': [
+            'rtvideo=rtvideo.bin.cli:main',
+        ],
+    },
 )
\ No newline at end of file
@@ -0,0 +1,118 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.chunked_pipeline import ChunkedPipeline
+from rtvideo.pipelines.spec import build_multi_stream, build_offline_pipeline, build_pipeline, load_spec
+
+log = logging.getLogger('rtvideo')
+
+VIDEO_EXTENSIONS = ('.avi', '.mkv', '.mov', '.mp4', '.webm')
+
+
+def run(args: argparse.Namespace):
+    spec = load_spec(args.spec)
+    timer = Timer()
+    built = build_pipeline(spec, log, timer, bench_frames=args.bench)
+
+    start_ts = time.time()
+    built.run()
+    duration = time.time() - start_ts
+
+    if args.bench is not None:
+        frame_count = max(sink.frame_count for sink in built.sinks)
+        print(f"Processed {frame_count}/{args.bench} frames in {duration:.2f}s ({frame_count / duration:.1f} fps)")
+        print(timer)
+        print(built.pipeline.stats)
+        if getattr(built.pipeline, 'cpu_budget', None) is not None:
+            print(built.pipeline.cpu_budget.report())
+
+
+def serve(args: argparse.Namespace):
+    spec = load_spec(args.spec)
+    server = build_multi_stream(spec, log, bench_frames=args.bench)
+    server.run()
+
+    if args.bench is not None:
+        total_frames = 0
+        for name, built in server.streams.items():
+            frame_count = max(sink.frame_count for sink in built.sinks)
+            total_frames += frame_count
+            print(f"{name}: {frame_count}/{args.bench} frames ({frame_count / server.duration:.1f} fps)")
+            print(built.pipeline.stats)
+        print(f"Processed {total_frames} frames from {len(server.streams)} streams in {server.duration:.2f}s ({total_frames / server.duration:.1f} fps)")
+        for session in server.sessions:
+            print(session.summary())
+
+
+def batch(args: argparse.Namespace):
+    spec = load_spec(args.spec)
+    if 'processors' not in spec:
+        raise ValueError("Spec needs 'processors' to run offline")
+    if os.path.isdir(args.input):
+        inputs = sorted(
+            os.path.join(args.input, name) for name in os.listdir(args.input)
+            if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS
+        )
+        if not inputs:
+            raise ValueError(f"No video files found in {args.input}")
+        jobs = [(path, os.path.join(args.output, os.path.splitext(os.path.basename(path))[0] + '.mp4')) for path in inputs]
+    else:
+        jobs = [(args.input, args.output)]
+
+    total_frames = 0
+    failures = 0
+    start_ts = time.time()
+    for input_path, output_path in jobs:
+        try:
+            if args.chunks is not None:
+                pipeline = ChunkedPipeline(spec, input_path, output_path, log, chunks=args.chunks, workers=args.workers or 1)
+            else:
+                pipeline = build_offline_pipeline(spec, input_path, output_path, log, Timer(), workers=args.workers)
+            pipeline.run()
+        except (RuntimeError, ValueError) as e:
+            log.error(f"Failed to process {input_path}: {e}")
+            failures += 1
+            continue
+        total_frames += pipeline.frame_count
+        print(f"{input_path} -> {output_path}: {pipeline.frame_count} frames in {pipeline.duration:.2f}s ({pipeline.fps:.1f} fps)")
+
+    duration = time.time() - start_ts
+    print(f"Processed {total_frames} frames from {len(jobs) - failures}/{len(jobs)} files in {duration:.2f}s ({total_frames / duration:.1f} fps)")
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='rtvideo', description='Real-time video processing pipelines.')
+    parser.add_argument('--log-level', default='INFO', help='Logging level. Default is INFO.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Build and run a pipeline from a YAML or TOML spec.')
+    run_parser.add_argument('spec', help='Path to the pipeline spec (.yml, .yaml or .toml).')
+    run_parser.add_argument('--bench', type=int, metavar='FRAMES', help='Run headless for this many frames and print the timer summary.')
+    run_parser.set_defaults(handler=run)
+
+    serve_parser = subparsers.add_parser('serve', help="Run a spec's processors for each of its streams, sharing one batched copy of each model.")
+    serve_parser.add_argument('spec', help='Path to the multi-stream spec (.yml, .yaml or .toml).')
+    serve_parser.add_argument('--bench', type=int, metavar='FRAMES', help='Run every stream headless for this many frames and print the results.')
+    serve_parser.set_defaults(handler=serve)
+
+    batch_parser = subparsers.add_parser('batch', help="Render video files offline with a spec's processors, as fast as possible and without dropping frames.")
+    batch_parser.add_argument('spec', help='Path to the pipeline spec (.yml, .yaml or .toml).')
+    batch_parser.add_argument('input', help='Video file, or a directory of them.')
+    batch_parser.add_argument('output', help='Output video file (.mp4 or .mkv), or a directory when the input is one.')
+    batch_parser.add_argument('--workers', type=int, help='Frames processed in parallel. Default is one per CPU core, or one per chunk with --chunks.')
+    batch_parser.add_argument('--chunks', type=int, help='Split each file into this many keyframe-aligned chunks rendered by separate processes (one per CPU core).')
+    batch_parser.set_defaults(handler=batch)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import logging
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Streams that haven't asked for inference this long are left out of the wait for a full batch, e.g. ended files.
+ACTIVE_STREAM_TIMEOUT = 1.0
+
+
+@dataclass
+class InferenceRequest:
+    stream: str
+    output_names: List[str]
+    input_feed: Dict[str, np.ndarray]
+    rows: int
+    # Requests only share a batch when everything but the batch dimension matches.
+    signature: Tuple
+    submitted_ts: float = field(default_factory=time.perf_counter)
+    future: Future = field(default_factory=Future)
+
+
+class StreamSession:
+    """
+    One stream's handle on a BatchedSession, usable wherever an onnxruntime.InferenceSession is.
+    """
+    def __init__(self, batched: 'BatchedSession', stream: str):
+        self.batched = batched
+        self.stream = stream
+
+    def __str__(self) -> str:
+        return f"StreamSession(stream={self.stream}, {self.batched})"
+
+    def get_inputs(self):
+        return self.batched.session.get_inputs()
+
+    def get_outputs(self):
+        return self.batched.session.get_outputs()
+
+    def run(self, output_names: Optional[List[str]], input_feed: Dict[str, np.ndarray], run_options=None) -> List[np.ndarray]:
+        return self.batched.run(output_names, input_feed, stream=self.stream)
+
+
+class BatchedSession:
+    """
+    Shares one ONNX Runtime session between streams, so N streams load the model once and run it from one thread
+    pool. Requests from the streams are batched along the first dimension, up to `max_batch_size` rows, waiting at
+    most `max_wait_ms` for the other active streams to send theirs. Batches take one request per stream in turn,
+    starting from a different stream each time, so a stream sending faster than the others can't crowd them out.
+
+    Outputs are split back into requests by their share of the first dimension, so outputs that flatten the batch
+    into it, like SCRFD's (anchors * N, 1), split per image too. Models whose inputs or outputs have a fixed first
+    dimension, or whose outputs turn out not to split evenly, can't be batched and run a request at a time, still
+    from the one session.
+    """
+    def __init__(self, session, max_batch_size: int = 8, max_wait_ms: float = 2.0, name: str = 'model'):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+
+        self.session = session
+        self.name = name
+        self.max_wait = max_wait_ms / 1000
+        self.output_names = [output.name for output in session.get_outputs()]
+        self.batchable = all(
+            not isinstance(node.shape[0], int) for node in list(session.get_inputs()) + list(session.get_outputs())
+        )
+        if not self.batchable and max_batch_size > 1:
+            log.info(f"{name} has a fixed batch size, its requests run one at a time")
+        self.max_batch_size = max_batch_size if self.batchable else 1
+
+        # Requests waiting per stream, in the order the streams take turns.
+        self.pending: Dict[str, Deque[InferenceRequest]] = {}
+        self.last_request_ts: Dict[str, float] = {}
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.batches = 0
+        self.requests = 0
+        self.requests_by_stream: Dict[str, int] = {}
+        self.wait_time = 0.0
+
+        self.thread = threading.Thread(target=self._serve, name=f"{name} batching", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def load(model_path: str, threads: Optional[int] = None, max_batch_size: int = 8, max_wait_ms: float = 2.0) -> 'BatchedSession':
+        import onnxruntime
+
+        from rtvideo.common.cpu_budget import ort_session_options
+
+        session = onnxruntime.InferenceSession(
+            model_path,
+            sess_options=ort_session_options(threads),
+            providers=['CUDAExecutionProvider', 'CPUExecutionProvider'],
+        )
+        return BatchedSession(session, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name=model_path)
+
+    def __str__(self) -> str:
+        return f"BatchedSession(name={self.name}, max_batch_size={self.max_batch_size})"
+
+    def for_stream(self, stream: str) -> StreamSession:
+        with self.condition:
+            self.pending.setdefault(stream, deque())
+        return StreamSession(self, stream)
+
+    def run(self, output_names: Optional[List[str]], input_feed: Dict[str, np.ndarray], stream: str = 'default') -> List[np.ndarray]:
+        """
+        Runs like onnxruntime.InferenceSession.run, blocking until the batch holding the request is done.
+        """
+        output_names = list(output_names or self.output_names)
+        input_feed = {name: np.asarray(value) for name, value in input_feed.items()}
+        rows = next(iter(input_feed.values())).shape[0]
+        signature = (tuple(output_names), tuple((name, value.shape[1:], value.dtype.str) for name, value in sorted(input_feed.items())))
+        request = InferenceRequest(stream, output_names, input_feed, rows, signature)
+
+        with self.condition:
+            if self.closed:
+                raise RuntimeError(f"{self} is closed")
+            self.pending.setdefault(stream, deque()).append(request)
+            self.last_request_ts[stream] = request.submitted_ts
+            self.condition.notify_all()
+        return request.future.result()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        for queued in self.pending.values():
+            for request in queued:
+                request.future.set_exception(RuntimeError(f"{self} closed"))
+            queued.clear()
+
+    def _is_batch_ready(self, now: float) -> bool:
+        waiting = [stream for stream, queued in self.pending.items() if queued]
+        rows = sum(request.rows for queued in self.pending.values() for request in queued)
+        active = [stream for stream, ts in self.last_request_ts.items() if now - ts < ACTIVE_STREAM_TIMEOUT]
+        return rows >= self.max_batch_size or len(waiting) >= len(active)
+
+    def _take_batch(self) -> List[InferenceRequest]:
+        streams = [stream for stream, queued in self.pending.items() if queued]
+        first = self.pending[streams[0]].popleft()
+        batch, rows = [first], first.rows
+        # A request per stream per round, only from the front of each stream's queue so its order holds.
+        taken = True
+        while taken and rows < self.max_batch_size:
+            taken = False
+            for stream in streams:
+                queued = self.pending[stream]
+                if queued and queued[0].signature == first.signature and rows + queued[0].rows <= self.max_batch_size:
+                    request = queued.popleft()
+                    batch.append(request)
+                    rows += request.rows
+                    taken = True
+        # The stream served first goes to the back of the line.
+        self.pending[first.stream] = self.pending.pop(first.stream)
+        return batch
+
+    def _serve(self):
+        while True:
+            with self.condition:
+                while not self.closed and not any(self.pending.values()):
+                    self.condition.wait()
+                if self.closed:
+                    return
+                deadline = time.perf_counter() + self.max_wait
+                while not self.closed and not self._is_batch_ready(time.perf_counter()):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = self._take_batch()
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[InferenceRequest]):
+        start = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                outputs = [self.session.run(batch[0].output_names, batch[0].input_feed)]
+            else:
+                input_feed = {name: np.concatenate([request.input_feed[name] for request in batch]) for name in batch[0].input_feed}
+                outputs = self._split_outputs(batch, self.session.run(batch[0].output_names, input_feed))
+                if outputs is None:
+                    self.batchable = False
+                    self.max_batch_size = 1
+                    log.warn(f"{self.name} outputs don't split evenly between the requests in a batch, running them one at a time")
+                    outputs = [self.session.run(request.output_names, request.input_feed) for request in batch]
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        self.batches += 1
+        for request, request_outputs in zip(batch, outputs):
+            self.requests += 1
+            self.requests_by_stream[request.stream] = self.requests_by_stream.get(request.stream, 0) + 1
+            self.wait_time += start - request.submitted_ts
+            request.future.set_result(request_outputs)
+
+    def _split_outputs(self, batch: List[InferenceRequest], batched_outputs: List[np.ndarray]) -> Optional[List[List[np.ndarray]]]:
+        """
+        Each request's part of the batch's outputs, or None if an output's first dimension isn't a whole number of
+        entries per input row.
+        """
+        total_rows = sum(request.rows for request in batch)
+        outputs: List[List[np.ndarray]] = [[] for _ in batch]
+        for output in batched_outputs:
+            if output.ndim == 0 or output.shape[0] % total_rows:
+                return None
+            per_row = output.shape[0] // total_rows
+            offset = 0
+            for request_outputs, request in zip(outputs, batch):
+                request_outputs.append(output[offset:offset + request.rows * per_row])
+                offset += request.rows * per_row
+        return outputs
+
+    def summary(self) -> str:
+        if not self.batches:
+            return f"{self.name}: no requests"
+        streams = ', '.join(f"{stream}={count}" for stream, count in self.requests_by_stream.items())
+        return (f"{self.name}: {self.requests} requests in {self.batches} batches "
+                f"({self.requests / self.batches:.2f} per batch), waited {self.wait_time / self.requests * 1000:.2f}ms "
+                f"on average, by stream {streams}")
@@ -0,0 +1,242 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import cv2
+
+from rtvideo.common.structs import FrameProcessor
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+log = logging.getLogger(__name__)
+
+SHARED = 'shared'
+# Read by OpenMP and the BLAS libraries when they load, so they only reach libraries loaded after the budget applies.
+BLAS_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpus(cpus: Union[str, int, List[int], None]) -> List[int]:
+    """
+    Accepts a list of CPUs, a count of the first available ones, a string like '0-3,6', or None for all available.
+    """
+    if cpus is None:
+        return available_cpus()
+    if isinstance(cpus, int):
+        available = available_cpus()
+        if not 0 < cpus <= len(available):
+            raise ValueError(f"Budget of {cpus} CPUs doesn't fit the {len(available)} available")
+        return available[:cpus]
+    if isinstance(cpus, str):
+        parsed = []
+        for part in cpus.split(','):
+            first, _, last = part.strip().partition('-')
+            parsed.extend(range(int(first), int(last or first) + 1))
+        return sorted(set(parsed))
+    return sorted(set(cpus))
+
+
+def format_cpus(cpus: List[int]) -> str:
+    ranges = []
+    for cpu in cpus:
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def task_cpu_times() -> Dict[int, float]:
+    """
+    CPU seconds (user and system) used so far by each thread of this process, by native thread id. Linux only.
+    """
+    ticks = os.sysconf('SC_CLK_TCK')
+    times = {}
+    for tid in os.listdir('/proc/self/task'):
+        try:
+            with open(f'/proc/self/task/{tid}/stat') as f:
+                stat = f.read()
+        except FileNotFoundError:
+            # Exited since listing.
+            continue
+        # The thread name is in parentheses and may contain spaces, the fields after it start with the state.
+        fields = stat[stat.rindex(')') + 2:].split()
+        times[int(tid)] = (int(fields[11]) + int(fields[12])) / ticks
+    return times
+
+
+def ort_session_options(threads: Optional[int]):
+    """
+    ONNX Runtime session options running inference on `threads` threads, or ONNX Runtime's defaults for None.
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if threads is not None:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        # Idle pool threads spin waiting for work by default, burning CPU budgeted for other stages.
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+    return options
+
+
+def children_cpu_time() -> float:
+    """
+    CPU seconds used by child processes that have exited, e.g. ffmpeg encoders once closed. Unix only.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+
+class CpuBudget:
+    """
+    Splits `cpus` between pipeline stages so ONNX Runtime, OpenCV, BLAS and the encoders don't each size their
+    thread pools for the whole machine and fight over it.
+
+    `stages` gives the number of CPUs for each stage by name. Stages get their own CPUs, in order, and everything
+    else (the source, stages not listed, their helper threads) shares what's left, or all of `cpus` if nothing is
+    left. Every stage thread pins itself to its CPUs before opening its processor, so the pools and ffmpeg processes
+    it starts inherit them, and the processor gets `cpu_threads` set to its CPU count (the shared count for the
+    rest) to size its own pools with. OpenCV and BLAS pools are shared by the whole process and limited to
+    `library_threads`.
+
+    Pinning needs `os.sched_setaffinity` (Linux), elsewhere only thread counts are set. `report()` breaks the CPU
+    actually used down by stage.
+    """
+    def __init__(
+        self,
+        cpus: Union[str, int, List[int], None] = None,
+        stages: Optional[Dict[str, int]] = None,
+        library_threads: int = 1,
+    ):
+        if library_threads < 1:
+            raise ValueError(f"library_threads must be at least 1, got {library_threads}")
+
+        self.cpus = parse_cpus(cpus)
+        self.library_threads = library_threads
+        self.stage_cpus: Dict[str, List[int]] = {}
+        remaining = list(self.cpus)
+        for stage, count in (stages or {}).items():
+            if stage == SHARED:
+                raise ValueError(f"'{SHARED}' is reserved for the CPUs left over after the stages")
+            if count < 1:
+                raise ValueError(f"Stage '{stage}' needs at least 1 CPU, got {count}")
+            if count > len(remaining):
+                raise ValueError(f"CPU budget of {len(self.cpus)} CPUs runs out at stage '{stage}' ({stages})")
+            self.stage_cpus[stage], remaining = remaining[:count], remaining[count:]
+        self.stage_cpus[SHARED] = remaining or list(self.cpus)
+
+        self.processor_stages: Dict[int, str] = {}
+        self.thread_stages: Dict[int, str] = {}
+        # Last seen CPU seconds of every thread, kept after the thread exits.
+        self.thread_cpu: Dict[int, Tuple[str, float]] = {}
+        self.lock = threading.Lock()
+        self.start: Optional[float] = None
+        self.children_start = 0.0
+        # CPU seconds of threads that already existed at apply(), which don't count against the budget.
+        self.thread_cpu_start: Dict[int, float] = {}
+        self.can_pin = hasattr(os, 'sched_setaffinity')
+
+    def __str__(self) -> str:
+        stages = ', '.join(f"{stage} {format_cpus(cpus)}" for stage, cpus in self.stage_cpus.items())
+        return f"CpuBudget({stages}, library_threads={self.library_threads})"
+
+    def assign(self, processor: FrameProcessor, stage: Optional[str] = None) -> None:
+        """
+        Runs `processor` within the CPUs of `stage`, or the shared ones if it has none.
+        """
+        stage = stage if stage in self.stage_cpus else SHARED
+        self.processor_stages[id(processor)] = stage
+        processor.cpu_threads = len(self.stage_cpus[stage])
+
+    def apply(self) -> None:
+        """
+        Limits the process-wide OpenCV and BLAS pools, called once before the pipeline starts its threads.
+        """
+        self.start = time.perf_counter()
+        self.children_start = children_cpu_time()
+        self.thread_cpu_start = task_cpu_times() if os.path.isdir('/proc/self/task') else {}
+        cv2.setNumThreads(self.library_threads)
+        for variable in BLAS_THREAD_VARIABLES:
+            os.environ[variable] = str(self.library_threads)
+        if threadpool_limits is not None:
+            threadpool_limits(self.library_threads)
+        else:
+            log.info("threadpoolctl isn't installed, BLAS libraries already loaded keep their thread counts")
+        if not self.can_pin:
+            log.warn("CPU affinity isn't supported on this platform, only thread counts are budgeted")
+        log.info(f"Applying {self}")
+
+    def enter(self, processor: Optional[FrameProcessor] = None) -> None:
+        """
+        Pins the calling thread to the CPUs of `processor`'s stage, or the shared ones for None (the source).
+        """
+        stage = self.processor_stages.get(id(processor), SHARED) if processor is not None else SHARED
+        with self.lock:
+            self.thread_stages[threading.get_native_id()] = stage
+        if self.can_pin:
+            os.sched_setaffinity(0, self.stage_cpus[stage])
+
+    def leave(self) -> None:
+        """
+        Records the CPU used by the calling stage thread as it exits, so its time isn't lost, and stops tracking it.
+        """
+        self.sample()
+        with self.lock:
+            self.thread_stages.pop(threading.get_native_id(), None)
+
+    def sample(self) -> None:
+        """
+        Records the CPU used so far by every thread.
+        """
+        if not os.path.isdir('/proc/self/task'):
+            return
+        cpu_stages = {tuple(cpus): stage for stage, cpus in reversed(self.stage_cpus.items())}
+        with self.lock:
+            for tid, cpu in task_cpu_times().items():
+                stage = self.thread_stages.get(tid)
+                if stage is None:
+                    # Helper threads (ONNX Runtime pools, encoder writers) inherit the affinity of the stage that
+                    # started them.
+                    try:
+                        stage = cpu_stages.get(tuple(sorted(os.sched_getaffinity(tid))), 'unbudgeted')
+                    except OSError:
+                        continue
+                self.thread_cpu[tid] = (stage, cpu - self.thread_cpu_start.get(tid, 0.0))
+
+    def report(self) -> str:
+        """
+        CPU time used by each stage's threads, and the average number of CPUs that kept busy, since `apply()`.
+        """
+        if not os.path.isdir('/proc/self/task'):
+            return f"process: {time.process_time():.2f}s CPU (per-thread CPU time isn't available on this platform)"
+
+        self.sample()
+        wall = time.perf_counter() - self.start if self.start is not None else 0.0
+        lines = []
+        with self.lock:
+            for stage in list(self.stage_cpus) + ['unbudgeted']:
+                cpus = [cpu for tid_stage, cpu in self.thread_cpu.values() if tid_stage == stage]
+                if not cpus:
+                    continue
+                budget = f"CPUs {format_cpus(self.stage_cpus[stage])}" if stage in self.stage_cpus else "no budget"
+                line = f"{stage} ({budget}): {len(cpus)} threads, {sum(cpus):.2f}s CPU"
+                lines.append(f"{line}, {sum(cpus) / wall:.2f} CPUs busy" if wall else line)
+        children = children_cpu_time() - self.children_start
+        if children:
+            lines.append(f"child processes (encoders): {children:.2f}s CPU")
+        return "\n".join(lines)
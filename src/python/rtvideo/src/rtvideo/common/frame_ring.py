@@ -0,0 +1,102 @@
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+# Frames copied to disk between checks for appends waiting on the saver.
+SAVE_CHUNK_FRAMES = 8
+
+
+class FrameRing:
+    """
+    Keeps the last `capacity` frames in a circular buffer that is allocated once, on the first frame, so
+    storing a frame is a single copy into place with no per-frame allocation.
+
+    `save` writes the frames held at that moment to a `.npy` file (oldest first, the layout NpyReplaySource and
+    play_opencv.py read) from a background thread, streaming straight from the ring into the file rather than
+    building a second array. Appends carry on meanwhile and only wait if they are about to overwrite
+    a frame that hasn't been written yet, which the saver normally stays well ahead of.
+    """
+    buffer: Optional[np.ndarray]
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"FrameRing capacity must be at least 1, got {capacity}")
+
+        self.capacity = capacity
+        self.buffer = None
+        # Frames appended so far, the next frame goes to slot `appended % capacity`.
+        self.appended = 0
+        self.condition = threading.Condition()
+        # Oldest frame the running save still has to write, and the frame it stops before.
+        self.save_position: Optional[int] = None
+        self.save_end = 0
+        self.save_thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return min(self.appended, self.capacity)
+
+    @property
+    def is_full(self) -> bool:
+        return self.appended >= self.capacity
+
+    def append(self, pixels: np.ndarray) -> None:
+        if self.buffer is None:
+            self.buffer = np.empty((self.capacity, *pixels.shape), dtype=pixels.dtype)
+        elif pixels.shape != self.buffer.shape[1:] or pixels.dtype != self.buffer.dtype:
+            raise ValueError(f"Frame of {pixels.dtype}{pixels.shape} doesn't match the ring's {self.buffer.dtype}{self.buffer.shape[1:]}")
+
+        with self.condition:
+            # The slot holds frame `appended - capacity`, don't overwrite it while a save still needs it.
+            overwritten = self.appended - self.capacity
+            while self.save_position is not None and self.save_position <= overwritten < self.save_end:
+                self.condition.wait()
+            np.copyto(self.buffer[self.appended % self.capacity], pixels)
+            self.appended += 1
+
+    def save(self, path: str) -> threading.Thread:
+        """
+        Starts writing the buffered frames to `path` (`.npy` is added if missing) and returns the thread doing
+        it. The file only appears under its name once it's complete. Waits for any earlier save to finish first.
+        """
+        if self.save_thread is not None:
+            self.save_thread.join()
+        if self.buffer is None:
+            raise RuntimeError("No frames to save")
+        if not path.endswith('.npy'):
+            path = f'{path}.npy'
+
+        with self.condition:
+            self.save_end = self.appended
+            self.save_position = self.appended - len(self)
+
+        self.save_thread = threading.Thread(target=self._write, args=(path,), name='frame ring save')
+        self.save_thread.start()
+        return self.save_thread
+
+    def _write(self, path: str) -> None:
+        start = self.save_position
+        partial_path = f'{path}.partial'
+        try:
+            # Plain writes rather than a memory-mapped output, so the written pages don't count against this process.
+            with open(partial_path, 'wb') as f:
+                np.lib.format.write_array_header_1_0(f, {
+                    'descr': np.lib.format.dtype_to_descr(self.buffer.dtype),
+                    'fortran_order': False,
+                    'shape': (self.save_end - start, *self.buffer.shape[1:]),
+                })
+                for chunk_start in range(start, self.save_end, SAVE_CHUNK_FRAMES):
+                    chunk_end = min(chunk_start + SAVE_CHUNK_FRAMES, self.save_end)
+                    for index in range(chunk_start, chunk_end):
+                        f.write(self.buffer[index % self.capacity].data)
+                    with self.condition:
+                        self.save_position = chunk_end
+                        self.condition.notify_all()
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            with self.condition:
+                self.save_position = None
+                self.condition.notify_all()
@@ -0,0 +1,83 @@
+from collections import deque
+import statistics
+import threading
+import time
+from typing import Dict, Optional
+
+
+class OutputStats:
+    def __init__(self, maxlen: int):
+        self.frames = 0
+        self.lost = 0
+        self.latencies = deque(maxlen=maxlen)
+        self.capture_intervals = deque(maxlen=maxlen)
+        self.output_intervals = deque(maxlen=maxlen)
+        self.last_sequence: Optional[int] = None
+        self.last_capture_ts: Optional[float] = None
+        self.last_output_ts: Optional[float] = None
+
+
+def interval_summary(name: str, intervals) -> str:
+    if len(intervals) < 2:
+        return f"\t{name}: not enough frames"
+    return f"\t{name}: mean={statistics.fmean(intervals) * 1000:.2f}ms\tjitter={statistics.pstdev(intervals) * 1000:.2f}ms"
+
+
+class FrameStats:
+    """
+    Timing of the frames leaving a pipeline, per output (a sink, or the display itself):
+
+    - capture to output: from the frame's `capture_ts` to when it got there, the latency a viewer sees
+    - capture interval: between frames as the source captured them, its jitter is the device's or the source's
+    - output interval: between frames as they got there, its jitter is what the pipeline adds
+    - lost: frames that never got there, from gaps in `sequence`
+
+    Jitter is the standard deviation of the intervals. Safe to record from several threads.
+    """
+    def __init__(self, maxlen: int = 10000):
+        self.maxlen = maxlen
+        self.outputs: Dict[str, OutputStats] = {}
+        self.lock = threading.Lock()
+
+    def record(self, frame, output: str = 'output', now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self.lock:
+            stats = self.outputs.get(output)
+            if stats is None:
+                stats = self.outputs[output] = OutputStats(self.maxlen)
+
+            stats.frames += 1
+            consecutive = False
+            if stats.last_sequence is not None:
+                if frame.sequence <= stats.last_sequence:
+                    # A source that restarted numbering, e.g. reopened.
+                    stats.last_capture_ts = None
+                else:
+                    stats.lost += frame.sequence - stats.last_sequence - 1
+                    consecutive = frame.sequence == stats.last_sequence + 1
+            if frame.capture_ts is not None:
+                stats.latencies.append(now - frame.capture_ts)
+                if consecutive and stats.last_capture_ts is not None:
+                    stats.capture_intervals.append(frame.capture_ts - stats.last_capture_ts)
+            if stats.last_output_ts is not None:
+                stats.output_intervals.append(now - stats.last_output_ts)
+
+            stats.last_sequence = frame.sequence
+            stats.last_capture_ts = frame.capture_ts
+            stats.last_output_ts = now
+
+    def __str__(self) -> str:
+        with self.lock:
+            summaries = []
+            for output, stats in self.outputs.items():
+                lines = [f"{output}: {stats.frames} frames, {stats.lost} lost"]
+                if stats.latencies:
+                    latencies = sorted(latency * 1000 for latency in stats.latencies)
+                    p50 = latencies[int(len(latencies) * 0.5)]
+                    p95 = latencies[int(len(latencies) * 0.95)]
+                    p99 = latencies[int(len(latencies) * 0.99)]
+                    lines.append(f"\tcapture to output: p50={p50:.2f}ms\tp95={p95:.2f}ms\tp99={p99:.2f}ms")
+                lines.append(interval_summary("capture interval", stats.capture_intervals))
+                lines.append(interval_summary("output interval", stats.output_intervals))
+                summaries.append("\n".join(lines))
+            return "\n".join(summaries)
@@ -1,8 +1,10 @@
 from collections.abc import Iterator
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import List, Optional, TypeVar, Generic
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, TypeVar, Generic, Union
 from rtvideo.common.errors import assert_hwc
+from rtvideo.common.frame_stats import FrameStats
 
 import cv2
 import numpy as np
@@ -18,6 +20,26 @@ class PixelFormat(Enum):
     RGBA_float32 = 'RGBA_float32'
     BGR_uint8 = 'BGR_uint8'
     BGRA_uint8 = 'BGRA_uint8'
+    # Packed 4:2:2, HWC with 2 channels (Y0 U Y1 V interleaved).
+    YUYV422_uint8 = 'YUYV422_uint8'
+    # Planar 4:2:0, a single (H * 3 / 2, W) plane with the chroma stacked below the luma.
+    NV12_uint8 = 'NV12_uint8'
+    I420_uint8 = 'I420_uint8'
+
+
+PLANAR_YUV_FORMATS = (PixelFormat.NV12_uint8, PixelFormat.I420_uint8)
+
+YUV_TO_RGB = {
+    PixelFormat.YUYV422_uint8: cv2.COLOR_YUV2RGB_YUYV,
+    PixelFormat.NV12_uint8: cv2.COLOR_YUV2RGB_NV12,
+    PixelFormat.I420_uint8: cv2.COLOR_YUV2RGB_I420,
+}
+
+YUV_TO_BGR = {
+    PixelFormat.YUYV422_uint8: cv2.COLOR_YUV2BGR_YUYV,
+    PixelFormat.NV12_uint8: cv2.COLOR_YUV2BGR_NV12,
+    PixelFormat.I420_uint8: cv2.COLOR_YUV2BGR_I420,
+}
 
 
 class PixelArrangement(Enum):
@@ -36,13 +58,102 @@ class BoundingBox:
     def __iter__(self):
         return iter([self.left, self.top, self.width, self.height])
 
+class Detections:
+    """
+    Detected objects stored as contiguous arrays instead of one BoundingBox per object.
+
+    boxes are (N, 4) left/top/width/height, scores (N,), keypoints (N, K, 2) and track_ids (N,) with -1 for untracked.
+    The arrays are read-only so frames can share them freely; iterating yields BoundingBox values for
+    processors that work one object at a time.
+    """
+    __slots__ = ('boxes', 'scores', 'keypoints', 'track_ids')
+
+    boxes: np.ndarray
+    scores: np.ndarray
+    keypoints: np.ndarray
+    track_ids: np.ndarray
+
+    def __init__(
+        self,
+        boxes: np.ndarray,
+        scores: Optional[np.ndarray] = None,
+        keypoints: Optional[np.ndarray] = None,
+        track_ids: Optional[np.ndarray] = None,
+    ):
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        count = len(boxes)
+        self.boxes = Detections._readonly(boxes)
+        self.scores = Detections._readonly(np.ones(count, dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32).reshape(count))
+        keypoints = np.zeros((count, 0, 2), dtype=np.float32) if keypoints is None else np.asarray(keypoints, dtype=np.float32)
+        self.keypoints = Detections._readonly(keypoints.reshape(count, -1, 2) if count else keypoints.reshape(0, 0, 2))
+        self.track_ids = Detections._readonly(np.full(count, -1, dtype=np.int64) if track_ids is None else np.asarray(track_ids, dtype=np.int64).reshape(count))
+
+    @staticmethod
+    def _readonly(array: np.ndarray) -> np.ndarray:
+        array = np.ascontiguousarray(array)
+        if array.flags.writeable:
+            array = array.view()
+            array.flags.writeable = False
+        return array
+
+    @staticmethod
+    def empty() -> 'Detections':
+        return Detections(np.zeros((0, 4), dtype=np.int32))
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __iter__(self) -> Iterator[BoundingBox]:
+        return (BoundingBox(*(int(v) for v in box)) for box in self.boxes)
+
+    def __getitem__(self, index):
+        """
+        An integer index returns a BoundingBox, anything else (slices, masks, index arrays) returns a Detections.
+        """
+        if isinstance(index, (int, np.integer)):
+            return BoundingBox(*(int(v) for v in self.boxes[index]))
+
+        return Detections(self.boxes[index], self.scores[index], self.keypoints[index], self.track_ids[index])
+
+    def __repr__(self) -> str:
+        return f"Detections(count={len(self)})"
+
+    def copy(self) -> 'Detections':
+        # The arrays are read-only, so a copy only needs to be a new container.
+        return Detections(self.boxes, self.scores, self.keypoints, self.track_ids)
+
+    def expand(self, scale: float, max_width: int, max_height: int) -> 'Detections':
+        """
+        Grow each box into a square `scale` times its largest side around the same center, clipped to the frame.
+        """
+        boxes = self.boxes.astype(np.float64)
+        centers = boxes[:, 0:2] + boxes[:, 2:4] / 2
+        new_dims = np.floor(boxes[:, 2:4].max(axis=1) * scale)
+        new_origins = np.floor(np.maximum(0, centers - new_dims[:, None] / 2))
+        new_sizes = np.minimum(np.array([max_width, max_height]) - new_origins, new_dims[:, None])
+        expanded = np.concatenate([new_origins, new_sizes], axis=1).astype(np.int32)
+        return Detections(expanded, self.scores, self.keypoints, self.track_ids)
+
 @dataclass
 class Frame(Generic[TObject]):
     pixels: np.ndarray
     pixel_format: PixelFormat
     pixel_arrangement: PixelArrangement
-    objects: List[TObject]
+    objects: Union[List[TObject], Detections]
     span: TimerSpan = NoopTimerSpan()
+    # Position of the frame in its stream, numbered by the source and only ever increasing, used to line up frames
+    # that took different paths through a pipeline and to count the ones lost along the way.
+    sequence: int = 0
+    # Markers processors leave for later stages, e.g. 'black' from FrameHealthFilter.
+    flags: Set[str] = field(default_factory=set)
+    # When the image was captured (the device's own timestamp where there is one) and when the source received
+    # it, on the `time.time()` clock.
+    capture_ts: Optional[float] = None
+    arrival_ts: Optional[float] = None
+    # Memoized conversions of `pixels` by target format, shared by copies that share the same pixels.
+    conversions: Dict[PixelFormat, np.ndarray] = field(default_factory=dict, repr=False, compare=False)
+    # Memoized downscaled images and their scale by (target format, max size), shared the same way.
+    downscales: Dict[Tuple[PixelFormat, int], Tuple[np.ndarray, float]] = field(default_factory=dict, repr=False, compare=False)
 
     def copy(self):
         return Frame(
@@ -50,7 +161,13 @@ class Frame(Generic[TObject]):
             pixel_format=self.pixel_format,
             pixel_arrangement=self.pixel_arrangement,
             objects=self.objects.copy(),
-            span=self.span
+            span=self.span,
+            sequence=self.sequence,
+            flags=set(self.flags),
+            capture_ts=self.capture_ts,
+            arrival_ts=self.arrival_ts,
+            conversions=self.conversions,
+            downscales=self.downscales,
         )
 
     @property
@@ -64,7 +181,10 @@ class Frame(Generic[TObject]):
 
     @property
     def height(self):
-        if self.pixel_arrangement == PixelArrangement.CHW:
+        if self.pixel_format in PLANAR_YUV_FORMATS:
+            # The chroma planes are stacked below the full-height luma plane.
+            return self.pixels.shape[0] * 2 // 3
+        elif self.pixel_arrangement == PixelArrangement.CHW:
             return self.pixels.shape[1]
         elif self.pixel_arrangement == PixelArrangement.HWC:
             return self.pixels.shape[0]
@@ -73,17 +193,51 @@ class Frame(Generic[TObject]):
 
     @property
     def channels(self):
-        if self.pixel_arrangement == PixelArrangement.CHW:
+        if self.pixel_format in PLANAR_YUV_FORMATS:
+            return 1
+        elif self.pixel_arrangement == PixelArrangement.CHW:
             return self.pixels.shape[0]
         elif self.pixel_arrangement == PixelArrangement.HWC:
             return self.pixels.shape[2]
 
         raise ValueError(f"Unsupported pixel arrangement: {self.pixel_arrangement}")
 
-    def as_rgb(self) -> np.ndarray:
-        if self.pixel_format == PixelFormat.RGB_uint8:
+    def convert(self, pixel_format: PixelFormat) -> np.ndarray:
+        """
+        Returns the pixels in `pixel_format`, converting at most once per format for this frame and its copies.
+        """
+        if pixel_format == self.pixel_format:
             return self.pixels
-        elif self.pixel_format == PixelFormat.RGB_float32:
+
+        pixels = self.conversions.get(pixel_format)
+        if pixels is None:
+            pixels = self._convert(pixel_format)
+            self.conversions[pixel_format] = pixels
+        return pixels
+
+    def invalidate_conversions(self):
+        """
+        Drops memoized conversions, must be called after modifying `pixels` in place.
+        """
+        self.conversions.clear()
+        self.downscales.clear()
+
+    def _convert(self, pixel_format: PixelFormat) -> np.ndarray:
+        if pixel_format == PixelFormat.RGB_uint8:
+            return self._to_rgb()
+        elif pixel_format == PixelFormat.RGBA_uint8:
+            return self._to_rgba()
+        elif pixel_format == PixelFormat.BGR_uint8:
+            return self._to_bgr()
+        elif pixel_format == PixelFormat.BGRA_uint8:
+            return self._to_bgra()
+        elif pixel_format == PixelFormat.I420_uint8:
+            return self._to_i420()
+
+        raise ValueError(f"Unsupported conversion from {self.pixel_format} to {pixel_format}")
+
+    def _to_rgb(self) -> np.ndarray:
+        if self.pixel_format == PixelFormat.RGB_float32:
             return (self.pixels.clip(0, 1) * 255).astype(np.uint8)
         elif self.pixel_format == PixelFormat.BGR_uint8:
             assert_hwc(self.pixels)
@@ -91,13 +245,16 @@ class Frame(Generic[TObject]):
         elif self.pixel_format == PixelFormat.RGBA_uint8:
             assert_hwc(self.pixels)
             return cv2.cvtColor(self.pixels, cv2.COLOR_RGBA2RGB)
+        elif self.pixel_format == PixelFormat.BGRA_uint8:
+            assert_hwc(self.pixels)
+            return cv2.cvtColor(self.pixels, cv2.COLOR_BGRA2RGB)
+        elif self.pixel_format in YUV_TO_RGB:
+            return cv2.cvtColor(self.pixels, YUV_TO_RGB[self.pixel_format])
 
         raise ValueError(f"Unsupported pixel format: {self.pixel_format}")
 
-    def as_rgba(self) -> np.ndarray:
-        if self.pixel_format == PixelFormat.RGBA_uint8:
-            return self.pixels
-        elif self.pixel_format == PixelFormat.RGBA_float32:
+    def _to_rgba(self) -> np.ndarray:
+        if self.pixel_format == PixelFormat.RGBA_float32:
             return (self.pixels.clip(0, 1) * 255).astype(np.uint8)
         elif self.pixel_format == PixelFormat.BGRA_uint8:
             assert_hwc(self.pixels)
@@ -105,25 +262,105 @@ class Frame(Generic[TObject]):
         elif self.pixel_format == PixelFormat.RGB_uint8:
             assert_hwc(self.pixels)
             return np.dstack([self.pixels, np.full((self.height, self.width), 255, dtype=np.uint8)])
+        elif self.pixel_format in YUV_TO_RGB:
+            return cv2.cvtColor(self.as_rgb(), cv2.COLOR_RGB2RGBA)
 
         raise ValueError(f"Unsupported pixel format: {self.pixel_format}")
 
-    def as_bgr(self) -> np.ndarray:
-        if self.pixel_format == PixelFormat.BGR_uint8:
-            return self.pixels
-        
+    def _to_bgr(self) -> np.ndarray:
+        if self.pixel_format in YUV_TO_BGR:
+            return cv2.cvtColor(self.pixels, YUV_TO_BGR[self.pixel_format])
+        elif self.pixel_format == PixelFormat.BGRA_uint8:
+            assert_hwc(self.pixels)
+            return cv2.cvtColor(self.pixels, cv2.COLOR_BGRA2BGR)
+
         rgb_pixels = self.as_rgb()
         assert_hwc(rgb_pixels)
         return cv2.cvtColor(rgb_pixels, cv2.COLOR_RGB2BGR)
-    
-    def as_bgra(self) -> np.ndarray:
-        if self.pixel_format == PixelFormat.BGRA_uint8:
-            return self.pixels
-        
+
+    def _to_bgra(self) -> np.ndarray:
         rgba_pixels = self.as_rgba()
         assert_hwc(rgba_pixels)
         return cv2.cvtColor(rgba_pixels, cv2.COLOR_RGBA2BGRA)
 
+    def _to_i420(self) -> np.ndarray:
+        if self.pixel_format == PixelFormat.BGR_uint8:
+            return cv2.cvtColor(self.pixels, cv2.COLOR_BGR2YUV_I420)
+
+        return cv2.cvtColor(self.as_rgb(), cv2.COLOR_RGB2YUV_I420)
+
+    def downscaled(self, pixel_format: PixelFormat, max_size: int) -> Tuple[np.ndarray, float]:
+        """
+        Returns the frame in `pixel_format` with its longest side at most `max_size` along with the scale applied.
+        The resize happens before the color conversion so only the small image is converted, and the result is
+        memoized like `convert`, leaving the full-resolution pixels untouched in their native format.
+        """
+        key = (pixel_format, max_size)
+        downscale = self.downscales.get(key)
+        if downscale is None:
+            downscale = self._downscale(pixel_format, max_size)
+            self.downscales[key] = downscale
+        return downscale
+
+    def _downscale(self, pixel_format: PixelFormat, max_size: int) -> Tuple[np.ndarray, float]:
+        width, height = self.width, self.height
+        if max(width, height) <= max_size:
+            return self.convert(pixel_format), 1.0
+
+        scale = max_size / max(width, height)
+        new_width, new_height = int(width * scale), int(height * scale)
+
+        if pixel_format in self.conversions:
+            # Someone already paid for the full-resolution conversion, just shrink it.
+            pixels = cv2.resize(self.conversions[pixel_format], (new_width, new_height))
+            return pixels, new_height / height
+
+        if self.pixel_format in YUV_TO_RGB:
+            # Chroma is subsampled 2x horizontally (and vertically for 4:2:0), so keep dimensions even.
+            new_width, new_height = new_width // 2 * 2, new_height // 2 * 2
+            small_format, small_pixels = self.pixel_format, self._resize_yuv(new_width, new_height)
+        elif self.pixel_format in (PixelFormat.RGB_uint8, PixelFormat.BGR_uint8, PixelFormat.RGBA_uint8, PixelFormat.BGRA_uint8):
+            small_format, small_pixels = self.pixel_format, cv2.resize(self.pixels, (new_width, new_height))
+        else:
+            small_format, small_pixels = pixel_format, cv2.resize(self.convert(pixel_format), (new_width, new_height))
+
+        small_frame = Frame(small_pixels, small_format, PixelArrangement.HWC, [])
+        return small_frame.convert(pixel_format), new_height / height
+
+    def _resize_yuv(self, new_width: int, new_height: int) -> np.ndarray:
+        """
+        Resizes the luma and chroma planes separately, staying in the frame's own YUV layout.
+        """
+        width, height = self.width, self.height
+        if self.pixel_format == PixelFormat.YUYV422_uint8:
+            luma = cv2.resize(self.pixels[:, :, 0], (new_width, new_height))
+            chroma = cv2.resize(self.pixels[:, :, 1].reshape(height, width // 2, 2), (new_width // 2, new_height))
+            return np.dstack([luma, chroma.reshape(new_height, new_width)])
+
+        luma = cv2.resize(self.pixels[:height], (new_width, new_height))
+        if self.pixel_format == PixelFormat.NV12_uint8:
+            chroma = self.pixels[height:].reshape(height // 2, width // 2, 2)
+            chroma = cv2.resize(chroma, (new_width // 2, new_height // 2))
+            return np.vstack([luma, chroma.reshape(new_height // 2, new_width)])
+
+        # The U and V planes follow the luma back to back, a plane only fills whole rows when the height is a
+        # multiple of 4, so they're laid out flat.
+        planes = self.pixels[height:].reshape(2, height // 2, width // 2)
+        chroma = [cv2.resize(plane, (new_width // 2, new_height // 2)).ravel() for plane in planes]
+        return np.concatenate([luma.ravel(), *chroma]).reshape(new_height * 3 // 2, new_width)
+
+    def as_rgb(self) -> np.ndarray:
+        return self.convert(PixelFormat.RGB_uint8)
+
+    def as_rgba(self) -> np.ndarray:
+        return self.convert(PixelFormat.RGBA_uint8)
+
+    def as_bgr(self) -> np.ndarray:
+        return self.convert(PixelFormat.BGR_uint8)
+
+    def as_bgra(self) -> np.ndarray:
+        return self.convert(PixelFormat.BGRA_uint8)
+
 class FrameSource:
     timer: Optional[Timer] = None
 
@@ -139,8 +376,61 @@ class FrameSource:
     def __next__(self) -> Frame:
         raise NotImplementedError
 
+
+class QualityKnob:
+    """
+    A setting a processor can turn down to keep up, with `levels` ordered from best quality to fastest. The
+    processor reads `value` on every frame, so changes made from another thread land between frames.
+    """
+    def __init__(self, name: str, levels: Sequence[Any], level: int = 0):
+        if not 0 <= level < len(levels):
+            raise ValueError(f"Level {level} out of range for {name} levels {list(levels)}")
+
+        self.name = name
+        self.levels = list(levels)
+        self.level = level
+
+    def __str__(self) -> str:
+        return f"{self.name}={self.value}"
+
+    @property
+    def value(self) -> Any:
+        return self.levels[self.level]
+
+    @property
+    def can_degrade(self) -> bool:
+        return self.level < len(self.levels) - 1
+
+    @property
+    def can_improve(self) -> bool:
+        return self.level > 0
+
+    def degrade(self) -> None:
+        self.level = min(self.level + 1, len(self.levels) - 1)
+
+    def improve(self) -> None:
+        self.level = max(self.level - 1, 0)
+
 class FrameProcessor:
-    active_span: TimerSpan = NoopTimerSpan()
+    _span_local: Optional[threading.local] = None
+    # Threads for the processor's own pools (ONNX Runtime, encoders), set by a CpuBudget before open().
+    # None leaves them to the libraries, which size them for the whole machine.
+    cpu_threads: Optional[int] = None
+
+    @property
+    def active_span(self) -> TimerSpan:
+        """
+        The span of the frame currently being processed by the calling thread.
+        Kept per-thread so a processor can safely be called from several threads at once.
+        """
+        if self._span_local is None:
+            return NoopTimerSpan()
+        return getattr(self._span_local, 'span', NoopTimerSpan())
+
+    @active_span.setter
+    def active_span(self, span: TimerSpan):
+        # setdefault is atomic, so concurrent first calls still share a single local.
+        self.__dict__.setdefault('_span_local', threading.local()).span = span
 
     def open(self):
         pass
@@ -148,5 +438,56 @@ class FrameProcessor:
     def close(self):
         pass
 
-    def __call__(self, frame: Frame) -> Frame:
-        raise NotImplementedError
\ No newline at end of file
+    def quality_knobs(self) -> List[QualityKnob]:
+        """
+        Settings an AdaptiveQualityController may turn down when the pipeline can't keep up, most preferred first.
+        """
+        return []
+
+    def __call__(self, frame: Frame) -> Optional[Frame]:
+        """
+        Process a frame, or return None to drop it so later stages never see it.
+        """
+        raise NotImplementedError
+
+class AsyncFrameProcessor(FrameProcessor):
+    """
+    A processor that accepts frames with `submit` and hands them back in submission order with `poll`,
+    keeping up to `max_in_flight` frames in progress at once.
+    """
+    timer: Optional[Timer] = None
+    max_in_flight: int = 1
+
+    @property
+    def in_flight(self) -> int:
+        raise NotImplementedError
+
+    def submit(self, frame: Frame) -> None:
+        raise NotImplementedError
+
+    def poll(self, timeout: Optional[float] = 0) -> Optional[Frame]:
+        """
+        Return the oldest submitted frame once it has finished processing, or None if it isn't ready within `timeout`.
+        """
+        raise NotImplementedError
+
+
+class MainThreadRenderer(FrameProcessor):
+    """
+    A sink that has to draw from the main thread (e.g. OpenCV windows). `__call__` only hands the frame over and
+    returns, the pipeline's main thread then calls `render` in a loop for as long as the pipeline runs.
+    Pipelines set `stats` so `render` can record when frames actually reach the screen.
+    """
+    stats: Optional[FrameStats] = None
+
+    def render(self, timeout: float) -> None:
+        """
+        Draw the latest frame, waiting up to `timeout` for a new one. Raises KeyboardInterrupt to stop the pipeline.
+        """
+        raise NotImplementedError
+
+    def stop_rendering(self) -> None:
+        """
+        Called from the main thread once the pipeline is done, to tear down anything `render` created.
+        """
+        pass
@@ -3,7 +3,7 @@ from collections import deque
 from typing import Any, Optional
 
 class NoopTimerSpan:
-    def start(self):
+    def start(self, start_ts: Optional[float] = None):
         pass
 
     def stop(self):
@@ -24,8 +24,9 @@ class TimerSpan:
         self.timer = timer
         self.parent = parent
 
-    def start(self):
-        self.start_ts = time.time()
+    def start(self, start_ts: Optional[float] = None):
+        # An earlier `start_ts` backdates the span, e.g. to when a camera captured the frame.
+        self.start_ts = time.time() if start_ts is None else start_ts
 
     def stop(self):
         self.end_ts = time.time()
@@ -0,0 +1,198 @@
+from dataclasses import dataclass
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from rtvideo.common.frame_stats import FrameStats
+from rtvideo.common.structs import FrameProcessor, QualityKnob
+from rtvideo.common.timer import Timer
+from rtvideo.processors.concurrent_processor import ConcurrentProcessor
+
+log = logging.getLogger(__name__)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+@dataclass
+class Measurement:
+    # Frames per second the source produced and the pipeline delivered, at the output losing the most.
+    source_fps: float
+    output_fps: float
+    # p95 capture to output.
+    latency_ms: float
+    # p50 time per frame of each stage, by processor.
+    stage_ms: Dict[str, float]
+
+    def __str__(self) -> str:
+        slowest = max(self.stage_ms.items(), key=lambda item: item[1], default=('none', 0.0))
+        return (f"{self.output_fps:.1f}/{self.source_fps:.1f} fps, p95 latency {self.latency_ms:.0f}ms, "
+                f"slowest stage {slowest[0]} {slowest[1]:.1f}ms")
+
+
+@dataclass
+class Adjustment:
+    timestamp: float
+    processor: str
+    knob: str
+    old_value: object
+    new_value: object
+    reason: str
+
+
+class AdaptiveQualityController:
+    """
+    Holds a pipeline at `target_fps`, and within `latency_budget_ms` if given, by turning down the processors'
+    quality knobs (see `FrameProcessor.quality_knobs`) while it can't keep up and back up once it can.
+
+    Every `interval` seconds it looks at the frames since the last check: from the pipeline's FrameStats, the rate
+    frames reach each output against the rate the source produced them (capped at `target_fps`) and the p95 latency,
+    and from its Timer each stage's median time. If frames are being lost or latency is over budget it turns down
+    one knob, the slowest stage's own first. Once the slowest stage and latency have been under `headroom` of their
+    budgets for `improve_after` checks in a row, the most recently turned down knob goes back up. The check right
+    after a change is skipped since its frames straddle both settings. Every change is logged and kept in
+    `adjustments`.
+    """
+    def __init__(
+        self,
+        target_fps: float = 30,
+        latency_budget_ms: Optional[float] = None,
+        interval: float = 2.0,
+        tolerance: float = 0.1,
+        headroom: float = 0.7,
+        improve_after: int = 3,
+    ):
+        if not 0 < headroom < 1:
+            raise ValueError(f"headroom must be between 0 and 1, got {headroom}")
+
+        self.target_fps = target_fps
+        self.latency_budget_ms = latency_budget_ms
+        self.interval = interval
+        self.tolerance = tolerance
+        self.headroom = headroom
+        self.improve_after = improve_after
+        self.processors: List[FrameProcessor] = []
+        self.timer: Optional[Timer] = None
+        self.stats: Optional[FrameStats] = None
+        # Frames and lost frames per output at the last check.
+        self.last_counts: Dict[str, Tuple[int, int]] = {}
+        # Knobs turned down so far, the last one goes back up first.
+        self.degraded: List[Tuple[FrameProcessor, QualityKnob]] = []
+        self.adjustments: List[Adjustment] = []
+        self.last_check = 0.0
+        self.skip_next = False
+        self.checks_with_headroom = 0
+
+    def attach(self, processors: List[FrameProcessor], timer: Timer, stats: FrameStats) -> None:
+        """
+        Starts watching `processors` through the spans they record in `timer` and the frames recorded in `stats`,
+        called once the pipeline runs.
+        """
+        self.processors = processors
+        self.timer = timer
+        self.stats = stats
+        self.last_counts = self.output_counts()
+        self.last_check = time.time()
+        knobs = [f"{processor}: {', '.join(str(knob) for knob in processor.quality_knobs())}" for processor in processors if processor.quality_knobs()]
+        if knobs:
+            log.info(f"Adaptive quality targeting {self.target_fps} fps with knobs {knobs}")
+        else:
+            log.warn("Adaptive quality is on but no processor has knobs to turn")
+
+    def update(self, now: Optional[float] = None) -> Optional[Measurement]:
+        """
+        Checks the pipeline and adjusts a knob if `interval` has passed since the last check. Cheap to call often.
+        """
+        now = time.time() if now is None else now
+        if self.timer is None or now - self.last_check < self.interval:
+            return None
+
+        measurement = self.measure(self.last_check, now)
+        self.last_check = now
+        if measurement is None:
+            return None
+        if self.skip_next:
+            self.skip_next = False
+            return measurement
+
+        expected_fps = min(self.target_fps, measurement.source_fps)
+        losing_frames = measurement.output_fps < expected_fps * (1 - self.tolerance)
+        over_budget = self.latency_budget_ms is not None and measurement.latency_ms > self.latency_budget_ms
+        if losing_frames or over_budget:
+            self.checks_with_headroom = 0
+            self.degrade(measurement, 'losing frames' if losing_frames else 'over latency budget')
+            return measurement
+
+        slowest_ms = max(measurement.stage_ms.values(), default=0.0)
+        has_headroom = slowest_ms < self.headroom * 1000 / self.target_fps and (
+            self.latency_budget_ms is None or measurement.latency_ms < self.headroom * self.latency_budget_ms)
+        self.checks_with_headroom = self.checks_with_headroom + 1 if has_headroom else 0
+        if self.checks_with_headroom >= self.improve_after and self.degraded:
+            self.checks_with_headroom = 0
+            self.improve(measurement)
+        return measurement
+
+    def output_counts(self) -> Dict[str, Tuple[int, int]]:
+        with self.stats.lock:
+            return {output: (stats.frames, stats.lost) for output, stats in self.stats.outputs.items()}
+
+    def measure(self, since: float, until: float) -> Optional[Measurement]:
+        window = until - since
+        counts = self.output_counts()
+        worst = None
+        for output, (frames, lost) in counts.items():
+            last_frames, last_lost = self.last_counts.get(output, (0, 0))
+            delivered, produced = frames - last_frames, frames - last_frames + lost - last_lost
+            if produced and (worst is None or delivered / produced < worst[1] / worst[2]):
+                worst = (output, delivered, produced)
+        self.last_counts = counts
+        if worst is None:
+            return None
+
+        output, delivered, produced = worst
+        with self.stats.lock:
+            latencies = list(self.stats.outputs[output].latencies)[-delivered:] if delivered else []
+
+        stage_ms = {}
+        spans = [span for span in list(self.timer.spans) if 'duration' in span.__dict__ and since < span.end_ts <= until]
+        for processor in self.processors:
+            name, overlap = f"{processor}(frame)", 1
+            if isinstance(processor, ConcurrentProcessor):
+                # Timed per frame inside the pool, with frames overlapping.
+                name, overlap = f"{processor.processor}(frame)", processor.max_in_flight
+            durations = [span.duration * 1000 for span in spans if span.name == name]
+            if durations:
+                stage_ms[str(processor)] = percentile(durations, 0.5) / overlap
+
+        return Measurement(
+            source_fps=produced / window,
+            output_fps=delivered / window,
+            latency_ms=percentile([latency * 1000 for latency in latencies], 0.95) if latencies else 0.0,
+            stage_ms=stage_ms,
+        )
+
+    def degrade(self, measurement: Measurement, reason: str) -> None:
+        # The slowest stage first, then the others from slowest to fastest.
+        by_time = sorted(self.processors, key=lambda processor: measurement.stage_ms.get(str(processor), 0.0), reverse=True)
+        for processor in by_time:
+            for knob in processor.quality_knobs():
+                if knob.can_degrade:
+                    old_value = knob.value
+                    knob.degrade()
+                    self.degraded.append((processor, knob))
+                    self.record(processor, knob, old_value, f"{reason}: {measurement}")
+                    return
+        log.warn(f"Pipeline is {reason} with every quality knob already at its lowest: {measurement}")
+
+    def improve(self, measurement: Measurement) -> None:
+        processor, knob = self.degraded.pop()
+        old_value = knob.value
+        knob.improve()
+        self.record(processor, knob, old_value, f"headroom: {measurement}")
+
+    def record(self, processor: FrameProcessor, knob: QualityKnob, old_value: object, reason: str) -> None:
+        log.info(f"{processor} {knob.name} {old_value} -> {knob.value} ({reason})")
+        self.adjustments.append(Adjustment(time.time(), str(processor), knob.name, old_value, knob.value, reason))
+        self.skip_next = True
@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import subprocess as sp
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.spec import build_offline_pipeline
+
+# Set in each chunk process by `_init_chunk_process`.
+_abort_event = None
+
+
+def probe_keyframes(file_path: str) -> Tuple[List[int], int]:
+    """
+    Returns the indexes of the keyframes in the first video stream of `file_path` and its frame count. Only
+    reads packet headers, nothing is decoded.
+    """
+    command = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', file_path,
+    ]
+    result = sp.run(command, stdout=sp.PIPE, stderr=sp.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {file_path}: {result.stderr.strip()}")
+
+    packets = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if pts_time and pts_time != 'N/A':
+            packets.append((float(pts_time), 'K' in flags))
+    # Packets come in decode order, frames are numbered in presentation order.
+    packets.sort()
+    keyframes = [index for index, (_, is_keyframe) in enumerate(packets) if is_keyframe]
+    if not keyframes:
+        raise RuntimeError(f"No keyframes found in {file_path}")
+    return keyframes, len(packets)
+
+
+def plan_chunks(keyframes: List[int], frame_count: int, chunks: int) -> List[Tuple[int, int]]:
+    """
+    Splits frames [0, `frame_count`) into up to `chunks` ranges of similar length, each starting on a keyframe.
+    There are fewer when the keyframes are too far apart.
+    """
+    starts = [0]
+    for i in range(1, chunks):
+        target = frame_count * i / chunks
+        nearest = min(keyframes, key=lambda keyframe: abs(keyframe - target))
+        if nearest > starts[-1]:
+            starts.append(nearest)
+    return list(zip(starts, starts[1:] + [frame_count]))
+
+
+def concat_videos(paths: List[str], output_path: str) -> None:
+    """
+    Joins videos with identical encoding settings into one without re-encoding.
+    """
+    list_path = f'{output_path}.concat.txt'
+    with open(list_path, 'w') as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-c', 'copy', output_path,
+    ]
+    try:
+        result = sp.run(command, stdout=sp.DEVNULL, stderr=sp.PIPE, text=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to concatenate chunks into {output_path}: {result.stderr.strip()}")
+
+
+def _render_chunk(
+    spec: Dict[str, Any],
+    input_path: str,
+    output_path: str,
+    start_frame: int,
+    end_frame: int,
+    workers: int,
+    log_level: int,
+) -> Tuple[int, float]:
+    # Chunks the executor already handed to this process still arrive after an abort.
+    if _abort_event.is_set():
+        return 0, 0.0
+    # Runs in a fresh process, so logging has to be set up again.
+    logging.basicConfig(level=log_level)
+    logger = logging.getLogger('rtvideo').getChild(f'chunk[{start_frame}:{end_frame}]')
+    pipeline = build_offline_pipeline(
+        spec, input_path, output_path, logger, Timer(), workers=workers, start_frame=start_frame, end_frame=end_frame,
+    )
+    pipeline.run()
+    return pipeline.frame_count, pipeline.duration
+
+
+def _init_chunk_process(pids: multiprocessing.Queue, abort_event):
+    global _abort_event
+    _abort_event = abort_event
+    pids.put(os.getpid())
+
+
+def _abort_executor(executor: ProcessPoolExecutor, pids: multiprocessing.Queue, abort_event):
+    abort_event.set()
+    executor.shutdown(wait=False, cancel_futures=True)
+    # Chunks already running would otherwise render to the end in the background. The executor has no public way
+    # to stop its processes before Python 3.14, so each one reports its PID when it starts.
+    while True:
+        try:
+            pid = pids.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            # Already exited.
+            pass
+
+
+class ChunkedPipeline:
+    """
+    Renders a long video file offline by splitting it into keyframe-aligned chunks and running a separate
+    OfflinePipeline process on each, so decoding and encoding scale with cores instead of being limited to one
+    stream. Every chunk is encoded with the same settings, which lets the results be joined losslessly.
+
+    With `processes` defaulting to one per core, keep `workers` (threads per chunk) and the encoder's thread
+    count low or the processes will compete for the same cores.
+    """
+    def __init__(
+        self,
+        spec: Dict[str, Any],
+        input_path: str,
+        output_path: str,
+        logger: logging.Logger,
+        chunks: Optional[int] = None,
+        processes: Optional[int] = None,
+        workers: int = 1,
+    ):
+        recording_entry = next((entry for entry in spec.get('sinks', []) if entry.get('type') == 'recording'), {})
+        if recording_entry.get('segment_time') is not None:
+            raise ValueError("Chunked rendering writes a single file, remove segment_time from the recording sink")
+
+        self.spec = spec
+        self.input_path = input_path
+        self.output_path = output_path
+        self.logger = logger
+        self.processes = processes or os.cpu_count() or 1
+        self.chunks = chunks or self.processes
+        self.workers = workers
+        self.frame_count = 0
+        self.duration = 0.0
+
+    @property
+    def fps(self) -> float:
+        return self.frame_count / self.duration if self.duration > 0 else 0.0
+
+    def run(self):
+        log = self.logger
+        start_ts = time.time()
+        keyframes, expected_frames = probe_keyframes(self.input_path)
+        ranges = plan_chunks(keyframes, expected_frames, self.chunks)
+        log.info(f"Rendering {expected_frames} frames in {len(ranges)} chunks on {min(len(ranges), self.processes)} processes")
+
+        output_dir = os.path.dirname(os.path.abspath(self.output_path))
+        os.makedirs(output_dir, exist_ok=True)
+        # Next to the output so the chunks land on the same disk.
+        chunk_dir = tempfile.mkdtemp(prefix='.chunks-', dir=output_dir)
+        extension = os.path.splitext(self.output_path)[1]
+        chunk_paths = [os.path.join(chunk_dir, f'chunk_{i:05d}{extension}') for i in range(len(ranges))]
+
+        try:
+            # Spawned rather than forked, forking a process that already runs threads (or holds a GPU) isn't safe.
+            context = multiprocessing.get_context('spawn')
+            pids = context.Queue()
+            abort_event = context.Event()
+            executor = ProcessPoolExecutor(
+                max_workers=min(len(ranges), self.processes), mp_context=context,
+                initializer=_init_chunk_process, initargs=(pids, abort_event),
+            )
+            try:
+                futures = {
+                    executor.submit(
+                        _render_chunk, self.spec, self.input_path, chunk_path, start_frame, end_frame,
+                        self.workers, log.getEffectiveLevel(),
+                    ): (start_frame, end_frame)
+                    for chunk_path, (start_frame, end_frame) in zip(chunk_paths, ranges)
+                }
+                # In completion order, so the first failing chunk aborts the rest however far along they are.
+                for future in as_completed(futures):
+                    start_frame, end_frame = futures[future]
+                    try:
+                        frame_count, duration = future.result()
+                    except Exception as e:
+                        raise RuntimeError(f"Chunk [{start_frame}:{end_frame}] failed: {e}") from e
+                    self.frame_count += frame_count
+                    log.info(f"Chunk [{start_frame}:{end_frame}] done: {frame_count} frames in {duration:.2f}s")
+            except BaseException:
+                # Fail right away instead of waiting for the chunks still rendering, their output is thrown out.
+                _abort_executor(executor, pids, abort_event)
+                raise
+            executor.shutdown(wait=True)
+
+            if self.frame_count != expected_frames:
+                log.warn(f"Rendered {self.frame_count} frames but {self.input_path} has {expected_frames}")
+            concat_videos(chunk_paths, self.output_path)
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+            self.duration = time.time() - start_ts
@@ -0,0 +1,362 @@
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+import logging
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rtvideo.common.cpu_budget import CpuBudget
+from rtvideo.common.frame_stats import FrameStats
+from rtvideo.common.structs import Frame, FrameProcessor, FrameSource, MainThreadRenderer
+from rtvideo.common.timer import Timer
+
+SOURCE = 'source'
+
+
+class QueuePolicy(Enum):
+    # Wait for room, never drop. Use for offline jobs where every frame matters.
+    BLOCK = 'block'
+    # Drop the incoming frame if there's no room within a frame interval (the MultiThreadPipeline behavior).
+    DROP_NEWEST = 'drop_newest'
+    # Evict the oldest queued frame so the node always works on the freshest one. Use for slow sinks.
+    DROP_OLDEST = 'drop_oldest'
+
+
+def merge_frames(frames: List[Frame]) -> Frame:
+    """
+    Default join: pixels from the first input, objects from the first input that has any.
+    This lets a full-resolution branch pick up detections made on a low-resolution branch.
+    """
+    merged = frames[0].copy()
+    for frame in frames:
+        if len(frame.objects) > 0:
+            merged.objects = frame.objects.copy()
+            break
+    return merged
+
+
+@dataclass
+class PipelineNode:
+    name: str
+    processor: FrameProcessor
+    inputs: List[str]
+    queue_size: int = 1
+    queue_policy: QueuePolicy = QueuePolicy.DROP_NEWEST
+    merge: Callable[[List[Frame]], Frame] = merge_frames
+    main_thread: bool = False
+    outputs: List[str] = field(default_factory=list)
+
+
+class PipelineGraph:
+    """
+    A DAG of processors fed by a single source. A node listing several inputs waits for the frame with the
+    same sequence number from each of them and merges them before processing. A node with no outputs is a sink.
+
+        graph = PipelineGraph()
+        graph.add('detect', FaceDetector('scrfd.onnx'))
+        graph.add('swap', FaceSwapper('faceswap.onnx'), inputs=['detect'])
+        graph.add('display', DisplaySink('Preview'), inputs=['swap'])
+        graph.add('hls', HlsSink('.data/hls'), inputs=['swap'], queue_policy=QueuePolicy.DROP_OLDEST)
+
+    Branches share pixel buffers, so processors that draw in place should sit after the fan-out point
+    only when no sibling branch reads the same pixels.
+    """
+    nodes: Dict[str, PipelineNode]
+
+    def __init__(self):
+        self.nodes = {}
+
+    def add(
+        self,
+        name: str,
+        processor: FrameProcessor,
+        inputs: Optional[List[str]] = None,
+        queue_size: int = 1,
+        queue_policy: QueuePolicy = QueuePolicy.DROP_NEWEST,
+        merge: Callable[[List[Frame]], Frame] = merge_frames,
+        main_thread: bool = False,
+    ) -> 'PipelineGraph':
+        inputs = [SOURCE] if inputs is None else list(inputs)
+        if name == SOURCE or name in self.nodes:
+            raise ValueError(f"Node name '{name}' is already taken")
+        if not inputs:
+            raise ValueError(f"Node '{name}' needs at least one input")
+        if len(set(inputs)) != len(inputs):
+            raise ValueError(f"Node '{name}' lists the same input more than once")
+        for input_name in inputs:
+            # Inputs must already exist, which also guarantees the graph has no cycles.
+            if input_name != SOURCE and input_name not in self.nodes:
+                raise ValueError(f"Node '{name}' depends on unknown node '{input_name}'")
+        if main_thread and any(node.main_thread for node in self.nodes.values()):
+            raise ValueError("Only one node can run on the main thread")
+        if main_thread and isinstance(processor, MainThreadRenderer):
+            raise ValueError(f"Node '{name}' already renders from the main thread, it can't also process there")
+
+        self.nodes[name] = PipelineNode(name, processor, inputs, queue_size, queue_policy, merge, main_thread)
+        for input_name in inputs:
+            if input_name != SOURCE:
+                self.nodes[input_name].outputs.append(name)
+        return self
+
+    @property
+    def source_outputs(self) -> List[str]:
+        return [node.name for node in self.nodes.values() if SOURCE in node.inputs]
+
+    @property
+    def sinks(self) -> List[str]:
+        return [node.name for node in self.nodes.values() if not node.outputs]
+
+
+class GraphPipeline:
+    def __init__(
+        self,
+        source: FrameSource,
+        graph: PipelineGraph,
+        logger: logging.Logger,
+        timer: Timer,
+        target_fps: int = 30,
+        cpu_budget: Optional[CpuBudget] = None,
+    ):
+        if not graph.nodes:
+            raise ValueError("Pipeline graph has no nodes")
+
+        self.source = source
+        self.graph = graph
+        self.logger = logger
+        self.timer = timer
+        self.fps = target_fps
+        self.cpu_budget = cpu_budget
+        # Each node has a single input queue of (input name, frame) pairs.
+        self.queues: Dict[str, queue.Queue] = {
+            name: queue.Queue(maxsize=node.queue_size) for name, node in graph.nodes.items()
+        }
+        # Inputs that have reached the end of their stream, tracked outside the queues so eviction can't lose them.
+        self.finished_inputs: Dict[str, set] = {name: set() for name in graph.nodes}
+        self.exit_event = threading.Event()
+
+        self.source.timer = timer
+        self.stats = FrameStats()
+
+    def _put(self, node_name: str, input_name: str, frame: Frame, log: logging.Logger) -> None:
+        target_queue = self.queues[node_name]
+        policy = self.graph.nodes[node_name].queue_policy
+        item = (input_name, frame)
+
+        if policy == QueuePolicy.BLOCK:
+            while not self.exit_event.is_set():
+                try:
+                    target_queue.put(item, timeout=1.0/self.fps)
+                    return
+                except queue.Full:
+                    continue
+            return
+
+        if policy == QueuePolicy.DROP_OLDEST:
+            while True:
+                try:
+                    target_queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        target_queue.get_nowait()
+                        log.debug(f"Evicted oldest queued frame for {node_name}")
+                    except queue.Empty:
+                        pass
+
+        try:
+            target_queue.put(item, timeout=1.0/self.fps)
+        except queue.Full:
+            log.warn(f"Dropping put frame for {node_name} due to FPS timeout")
+
+    def _fan_out(self, outputs: List[str], input_name: str, frame: Optional[Frame], log: logging.Logger) -> None:
+        """
+        Sends a frame to every output, or marks the end of the stream when frame is None.
+        """
+        for i, output in enumerate(outputs):
+            if frame is None:
+                self.finished_inputs[output].add(input_name)
+                continue
+            # Every branch gets its own frame so object lists can diverge, the pixels stay shared.
+            self._put(output, input_name, frame if i == 0 else frame.copy(), log)
+
+    def run(self):
+        source = self.source
+        graph = self.graph
+        parent_log = self.logger
+        timer = self.timer
+        fps = self.fps
+        exit_event = self.exit_event
+        sink_timestamps = {name: deque(maxlen=1000) for name in graph.sinks}
+
+        def source_thread():
+            log = parent_log.getChild("source")
+            outputs = graph.source_outputs
+            try:
+                if self.cpu_budget is not None:
+                    self.cpu_budget.enter()
+                log.info("Opening source...")
+                with timer.span("source.open()"):
+                    source.open()
+
+                log.info("Processing frames...")
+                # Joins match frames on their sequence numbers. The source's own numbers are kept so frames it
+                # dropped still show up as lost, but a source that doesn't advance them gets numbered here.
+                last_sequence = None
+                for frame in source:
+                    if exit_event.is_set():
+                        break
+                    if last_sequence is not None and frame.sequence <= last_sequence:
+                        if frame.sequence == 0 and last_sequence == 0:
+                            log.warn(f"{source} doesn't number its frames, numbering them in order")
+                        frame.sequence = last_sequence + 1
+                    last_sequence = frame.sequence
+                    self._fan_out(outputs, SOURCE, frame, log)
+            except KeyboardInterrupt:
+                log.warn("User interrupted, exiting gracefully...")
+                exit_event.set()
+            except Exception as e:
+                log.error(f"Error in source: {e}")
+                traceback.print_exc()
+                exit_event.set()
+            finally:
+                self._fan_out(outputs, SOURCE, None, log)
+                try:
+                    source.close()
+                except Exception as e:
+                    log.error(f"Error closing source: {e}")
+                if self.cpu_budget is not None:
+                    self.cpu_budget.leave()
+
+        def node_thread(node: PipelineNode):
+            log = parent_log.getChild(node.name)
+            processor = node.processor
+            in_queue = self.queues[node.name]
+            # Partially joined frames by sequence number, only used by nodes with several inputs.
+            pending: Dict[int, Dict[str, Frame]] = {}
+            finished_inputs = self.finished_inputs[node.name]
+
+            def next_frame() -> Tuple[bool, Optional[Frame]]:
+                """
+                Returns (is_done, frame) where frame is None while still waiting on a complete set of inputs.
+                """
+                # Inputs finish before their last frames are consumed, so only stop once the queue is drained too.
+                is_finished = len(finished_inputs) == len(node.inputs)
+                try:
+                    input_name, frame = in_queue.get(timeout=1.0/fps)
+                except queue.Empty:
+                    return is_finished, None
+
+                if len(node.inputs) == 1:
+                    return False, frame
+
+                pending.setdefault(frame.sequence, {})[input_name] = frame
+                if len(pending[frame.sequence]) < len(node.inputs):
+                    return False, None
+
+                frames_by_input = pending.pop(frame.sequence)
+                # Anything older can never complete now that a newer frame has, its partners were dropped upstream.
+                for stale_sequence in [sequence for sequence in pending if sequence < frame.sequence]:
+                    del pending[stale_sequence]
+                return False, node.merge([frames_by_input[name] for name in node.inputs])
+
+            try:
+                if self.cpu_budget is not None:
+                    self.cpu_budget.enter(processor)
+                log.info(f"Opening processor {processor}...")
+                with timer.span(f"{processor}.open()"):
+                    processor.open()
+
+                while not exit_event.is_set():
+                    is_done, frame = next_frame()
+                    if is_done:
+                        break
+                    if frame is None:
+                        continue
+
+                    log.debug(f"Processing frame with {processor}")
+                    with timer.span(f"{node.name}(frame)") as frame_span:
+                        processor.active_span = frame_span
+                        frame = processor(frame)
+                    if frame is None:
+                        # Dropped, nodes joining this branch with others clear out the partners on a later frame.
+                        continue
+
+                    if node.outputs:
+                        self._fan_out(node.outputs, node.name, frame, log)
+                    else:
+                        frame.span.stop()
+                        now = time.time()
+                        self.stats.record(frame, node.name, now)
+                        timestamps = sink_timestamps[node.name]
+                        timestamps.append(now)
+                        fps_last_1s = len([ts for ts in timestamps if ts > now - 1])
+                        fps_last_5s = len([ts for ts in timestamps if ts > now - 5]) / 5.0
+                        log.debug(f"FPS: {fps_last_1s:.2f} (current) {fps_last_5s:.2f} (avg)")
+            except KeyboardInterrupt:
+                log.warn("User interrupted, exiting gracefully...")
+                exit_event.set()
+            except Exception as e:
+                log.error(f"Error in processor {processor}: {e}")
+                traceback.print_exc()
+                exit_event.set()
+            finally:
+                self._fan_out(node.outputs, node.name, None, log)
+                try:
+                    log.info(f"Closing processor {processor}...")
+                    processor.close()
+                    log.info(f"Processor {processor} closed")
+                except Exception as e:
+                    log.error(f"Error closing processor {processor}: {e}")
+                if self.cpu_budget is not None:
+                    self.cpu_budget.leave()
+
+        main_node = next((node for node in graph.nodes.values() if node.main_thread), None)
+        renderers = [node.processor for node in graph.nodes.values() if isinstance(node.processor, MainThreadRenderer)]
+        for renderer in renderers:
+            renderer.stats = self.stats
+        if self.cpu_budget is not None:
+            self.cpu_budget.apply()
+        threads = [threading.Thread(target=source_thread, name=SOURCE)]
+        for node in graph.nodes.values():
+            if node is not main_node:
+                threads.append(threading.Thread(target=node_thread, args=(node,), name=node.name))
+
+        try:
+            for thread in threads:
+                thread.start()
+
+            if main_node is not None:
+                node_thread(main_node)
+            alive = threads
+            while alive:
+                # Join with a timeout so Ctrl+C still reaches the main thread, or draw for renderers meanwhile.
+                if not renderers:
+                    alive[0].join(timeout=0.1)
+                for renderer in renderers:
+                    renderer.render(timeout=1.0/fps)
+                alive = [thread for thread in alive if thread.is_alive()]
+        except KeyboardInterrupt:
+            parent_log.warn("User interrupted, exiting gracefully...")
+            exit_event.set()
+        except Exception as e:
+            parent_log.error(f"Error rendering: {e}")
+            traceback.print_exc()
+            exit_event.set()
+        finally:
+            for renderer in renderers:
+                try:
+                    renderer.stop_rendering()
+                except Exception as e:
+                    parent_log.error(f"Error stopping {renderer}: {e}")
+
+            for thread in threads:
+                parent_log.info(f"Awaiting {thread.name} thread...")
+                thread.join()
+
+            parent_log.info(f"timer results:\n{timer}")
+            parent_log.info(f"frame stats:\n{self.stats}")
+            if self.cpu_budget is not None:
+                parent_log.info(f"cpu usage:\n{self.cpu_budget.report()}")
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+import traceback
+from typing import TYPE_CHECKING, Dict, List
+
+from rtvideo.common.batched_session import BatchedSession
+
+if TYPE_CHECKING:
+    from rtvideo.pipelines.spec import BuiltPipeline
+
+
+class MultiStreamServer:
+    """
+    Runs a pipeline per stream side by side, each with its own source and sinks, while their model processors run
+    on shared BatchedSessions: one copy of each model and one inference pool however many streams there are, with
+    requests from the streams batched together.
+    """
+    def __init__(self, streams: Dict[str, 'BuiltPipeline'], sessions: List[BatchedSession], logger: logging.Logger):
+        if not streams:
+            raise ValueError("A multi-stream server needs at least one stream")
+
+        self.streams = streams
+        self.sessions = sessions
+        self.logger = logger
+        self.duration = 0.0
+
+    def stop(self):
+        for built in self.streams.values():
+            stop = getattr(built.pipeline, 'stop', None)
+            if stop is not None:
+                stop()
+            else:
+                built.pipeline.exit_event.set()
+
+    def run(self):
+        log = self.logger
+
+        def stream_thread(name: str, built: 'BuiltPipeline'):
+            try:
+                built.run()
+            except Exception as e:
+                log.error(f"Error in stream {name}: {e}")
+                traceback.print_exc()
+
+        threads = [
+            threading.Thread(target=stream_thread, args=(name, built), name=f"stream {name}")
+            for name, built in self.streams.items()
+        ]
+        start_ts = time.time()
+        try:
+            log.info(f"Serving {len(threads)} streams on {len(self.sessions)} shared models...")
+            for thread in threads:
+                thread.start()
+            alive = threads
+            while alive:
+                # Join with a timeout so Ctrl+C still reaches the main thread.
+                alive[0].join(timeout=0.1)
+                alive = [thread for thread in alive if thread.is_alive()]
+        except KeyboardInterrupt:
+            log.warn("User interrupted, stopping every stream...")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.duration = time.time() - start_ts
+            for session in self.sessions:
+                session.close()
+
+            for name, built in self.streams.items():
+                log.info(f"stream {name} frame stats:\n{built.pipeline.stats}")
+            for session in self.sessions:
+                log.info(f"batching: {session.summary()}")
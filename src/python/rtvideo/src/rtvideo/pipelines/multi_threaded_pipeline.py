@@ -2,25 +2,83 @@ from collections import deque
 import logging
 import queue
 import threading
+import time
 import traceback 
-from typing import List
+from typing import List, Optional
 
-from rtvideo.common.structs import FrameProcessor, FrameSource
+from rtvideo.common.cpu_budget import CpuBudget
+from rtvideo.common.frame_stats import FrameStats
+from rtvideo.common.structs import AsyncFrameProcessor, FrameProcessor, FrameSource, MainThreadRenderer
 from rtvideo.common.timer import Timer
+from rtvideo.pipelines.adaptive_quality import AdaptiveQualityController
 
 
 class MultiThreadPipeline:
-    def __init__(self, source: FrameSource, processors: List[FrameProcessor], logger: logging.Logger, timer: Timer, target_fps: int = 30):
+    """
+    Runs the source and every processor on its own thread, connected by small queues.
+
+    The stream ends with a None sentinel that each stage passes on once its in-flight frames are done, so a
+    finite source (or `stop()`) shuts the pipeline down without losing queued frames. By default a stage that
+    can't hand a frame on within a frame interval drops it, to keep live latency down. With `drain` every frame
+    waits for room instead, for offline jobs where the last frames must be encoded.
+
+    Once a stop is requested (`stop()`, Ctrl+C or quitting a display), the pipeline gets `shutdown_timeout` seconds
+    to drain before in-flight frames are abandoned. A second Ctrl+C abandons them right away.
+
+    With a `controller` (see AdaptiveQualityController) the main thread checks the stage timings regularly and
+    turns processors' quality knobs down when frames start dropping, rather than dropping them indefinitely.
+
+    With a `cpu_budget` (see CpuBudget) every stage thread runs on the CPUs budgeted for its processor.
+    """
+    def __init__(
+        self,
+        source: FrameSource,
+        processors: List[FrameProcessor],
+        logger: logging.Logger,
+        timer: Timer,
+        target_fps: int = 30,
+        drain: bool = False,
+        shutdown_timeout: Optional[float] = 10.0,
+        controller: Optional[AdaptiveQualityController] = None,
+        cpu_budget: Optional[CpuBudget] = None,
+    ):
         self.source = source
         self.processors = processors
         self.logger = logger
         self.timer = timer
         self.fps = target_fps
+        self.drain = drain
+        self.shutdown_timeout = shutdown_timeout
+        self.controller = controller
+        self.cpu_budget = cpu_budget
         self.queues = [queue.Queue(maxsize=1) for _ in range(len(processors) + 1)]
         self.queues[-1] = queue.Queue(maxsize=5)
+        # Set to stop reading from the source and let the stages finish what they have.
+        self.stop_event = threading.Event()
+        # Set to abandon in-flight frames and exit as soon as possible.
         self.exit_event = threading.Event()
 
         self.source.timer = timer
+        self.stats = FrameStats()
+
+    def stop(self):
+        """
+        Stops reading from the source and shuts down once in-flight frames are done. Safe to call from any thread.
+        """
+        self.stop_event.set()
+
+    def abort(self):
+        """
+        Shuts down immediately, dropping in-flight frames.
+        """
+        self.stop_event.set()
+        self.exit_event.set()
+        for stage_queue in self.queues:
+            # Wake any stage blocked on an empty queue instead of waiting out its get timeout.
+            try:
+                stage_queue.put_nowait(None)
+            except queue.Full:
+                pass
 
     def run(self):
         source = self.source
@@ -29,78 +87,125 @@ class MultiThreadPipeline:
         timer = self.timer
         fps = self.fps
         queues = self.queues
+        stop_event = self.stop_event
         exit_event = self.exit_event
         frame_timestamps = deque(maxlen=1000)
 
+        def put_blocking(out_queue, item):
+            # Waits for room, checking in every frame interval so an abort still gets through.
+            while not exit_event.is_set():
+                try:
+                    out_queue.put(item, timeout=1.0/fps)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def put(out_queue, item, log, label):
+            if self.drain:
+                put_blocking(out_queue, item)
+                return
+            try:
+                out_queue.put(item, timeout=1.0/fps)
+            except queue.Full:
+                log.warn(f"Dropping {label} due to FPS timeout")
+
         def source_thread():
             log = parent_log.getChild("source")
             try:
+                if self.cpu_budget is not None:
+                    self.cpu_budget.enter()
                 log.info("Opening source...")
                 with timer.span("source.open()"):
                     source.open()
 
                 log.info("Processing frames...")
                 for frame in source:
-                    if exit_event.is_set():
-                        source.close()
+                    put(queues[0], frame, log, "frame")
+                    if stop_event.is_set():
                         break
-                    try:
-                        queues[0].put(frame, timeout=1.0/fps)
-                    except queue.Full:
-                        log.warn("Dropping frame due to FPS timeout")
-            except KeyboardInterrupt:
-                log.warn("User interrupted, exiting gracefully...")
-                exit_event.set()
             except Exception as e:
                 log.error(f"Error in source: {e}")
                 traceback.print_exc()
-                exit_event.set()
+                self.abort()
             finally:
+                # The None sentinel tells the next stage the stream is over, so it must not be dropped.
+                put_blocking(queues[0], None)
                 try:
                     source.close()
                 except Exception as e:
                     log.error(f"Error closing source: {e}")
+                if self.cpu_budget is not None:
+                    self.cpu_budget.leave()
 
         def processor_thread(processor, in_queue, out_queue):
             log = parent_log.getChild(processor.__class__.__name__)
+            is_async = isinstance(processor, AsyncFrameProcessor)
+
+            def emit(frame):
+                if frame is None:
+                    # Dropped by the processor.
+                    return
+                if out_queue is None:
+                    frame.span.stop()
+                    now = time.time()
+                    self.stats.record(frame, now=now)
+                    frame_timestamps.append(now)
+                    fps_last_1s = len([ts for ts in frame_timestamps if ts > now - 1])
+                    fps_last_5s = len([ts for ts in frame_timestamps if ts > now - 5]) / 5.0
+                    log.debug(f"FPS: {fps_last_1s:.2f} (current) {fps_last_5s:.2f} (avg)")
+                else:
+                    put(out_queue, frame, log, f"put frame in {processor}")
 
             try:
+                if self.cpu_budget is not None:
+                    self.cpu_budget.enter(processor)
                 log.info(f"Opening processor {processor}...")
+                if is_async:
+                    processor.timer = timer
                 with timer.span(f"{processor}.open()"):
                     processor.open()
 
-                while True:
-                    if exit_event.is_set():
-                        processor.close()
-                        break
+                while not exit_event.is_set():
+                    if is_async and processor.in_flight > 0:
+                        # Hand back finished frames in order, only blocking on the oldest when there's no room for more.
+                        is_full = processor.in_flight >= processor.max_in_flight
+                        frame = processor.poll(timeout=1.0/fps if is_full else 0)
+                        while frame is not None:
+                            emit(frame)
+                            frame = processor.poll()
+                        if processor.in_flight >= processor.max_in_flight:
+                            continue
 
+                    # Keep the wait short while frames are in flight so finished ones aren't held back by an idle input.
+                    is_waiting_on_frames = is_async and processor.in_flight > 0
                     try:
-                        frame = in_queue.get(timeout=1.0/fps)
+                        frame = in_queue.get(timeout=0.001 if is_waiting_on_frames else 1.0/fps)
                     except queue.Empty:
-                        log.warn(f"Dropping get frame in {processor} due to FPS timeout")
+                        if not is_waiting_on_frames and not stop_event.is_set():
+                            log.warn(f"Dropping get frame in {processor} due to FPS timeout")
                         continue
 
                     if frame is None:
+                        # End of stream, finish what's in flight and pass the sentinel along.
+                        while is_async and processor.in_flight > 0 and not exit_event.is_set():
+                            emit(processor.poll(timeout=None))
+                        if out_queue is not None:
+                            put_blocking(out_queue, None)
                         break
                     log.debug(f"Processing frame with {processor}")
+                    if is_async:
+                        processor.submit(frame)
+                        continue
+
                     with timer.span(f"{processor}(frame)") as frame_span:
                         processor.active_span = frame_span
                         frame = processor(frame)
-                    try:
-                        if out_queue is None:
-                            frame.span.stop()
-                            frame_timestamps.append(frame_span.end_ts)
-                            fps_last_1s = len([ts for ts in frame_timestamps if ts > frame_span.end_ts - 1])
-                            fps_last_5s = len([ts for ts in frame_timestamps if ts > frame_span.end_ts - 5]) / 5.0
-                            log.debug(f"FPS: {fps_last_1s:.2f} (current) {fps_last_5s:.2f} (avg)")
-                        else:
-                            out_queue.put(frame, timeout=1.0/fps)
-                    except queue.Full:
-                        log.warn(f"Dropping put frame in {processor} due to FPS timeout")
+                    emit(frame)
             except Exception as e:
                 log.error(f"Error in processor {processor}: {e}")
                 traceback.print_exc()
-                exit_event.set()
+                self.abort()
             finally:
                 try:
                     log.info(f"Closing processor {processor}...")
@@ -108,30 +213,72 @@ class MultiThreadPipeline:
                     log.info(f"Processor {processor} closed")
                 except Exception as e:
                     log.error(f"Error closing processor {processor}: {e}")
+                if self.cpu_budget is not None:
+                    self.cpu_budget.leave()
 
+        if self.cpu_budget is not None:
+            self.cpu_budget.apply()
         threads = []
         threads.append(threading.Thread(target=source_thread))
-        
-        sink = processors[-1]
-        processors = processors[:-1]
+        renderers = [processor for processor in processors if isinstance(processor, MainThreadRenderer)]
+        for renderer in renderers:
+            renderer.stats = self.stats
 
         try:
             for i, processor in enumerate(processors):
-                threads.append(threading.Thread(target=processor_thread, args=(processor, queues[i], queues[i+1],)))
+                # The last processor is the sink, it reports FPS instead of passing frames on.
+                out_queue = queues[i+1] if i < len(processors) - 1 else None
+                threads.append(threading.Thread(target=processor_thread, args=(processor, queues[i], out_queue,)))
 
             for thread in threads:
                 thread.start()
-            
-            # Sink runs in main thread (in case it's display).
-            processor_thread(sink, queues[-2], None)
-        except KeyboardInterrupt:
-            parent_log.warn("User interrupted, exiting gracefully...")
-            exit_event.set()
+            if self.controller is not None:
+                self.controller.attach(processors, timer, self.stats)
+
+            # The main thread draws for renderers (display windows) at their own pace, or just waits on the threads,
+            # waking up regularly so Ctrl+C still gets through.
+            alive = threads
+            shutdown_deadline = None
+            while alive:
+                try:
+                    if not renderers:
+                        alive[0].join(timeout=0.1)
+                    for renderer in renderers:
+                        renderer.render(timeout=1.0/fps)
+                    if self.controller is not None and not stop_event.is_set():
+                        self.controller.update()
+                except KeyboardInterrupt:
+                    if stop_event.is_set():
+                        parent_log.warn("Interrupted again, abandoning in-flight frames...")
+                        self.abort()
+                    else:
+                        parent_log.warn("User interrupted, finishing in-flight frames (interrupt again to exit now)...")
+                        self.stop()
+
+                if stop_event.is_set() and shutdown_deadline is None and self.shutdown_timeout is not None:
+                    shutdown_deadline = time.time() + self.shutdown_timeout
+                if shutdown_deadline is not None and time.time() > shutdown_deadline and not exit_event.is_set():
+                    parent_log.warn(f"Pipeline didn't drain within {self.shutdown_timeout}s, abandoning in-flight frames...")
+                    self.abort()
+                alive = [thread for thread in alive if thread.is_alive()]
+        except Exception as e:
+            parent_log.error(f"Error rendering: {e}")
+            traceback.print_exc()
+            self.abort()
         finally:
+            for renderer in renderers:
+                try:
+                    renderer.stop_rendering()
+                except Exception as e:
+                    parent_log.error(f"Error stopping {renderer}: {e}")
+
             for i, thread in enumerate(threads):
                 label = 'source' if i == 0 else processors[i - 1].__class__.__name__
                 print(f"Awaiting {label} thread#{i}...")
                 thread.join()
                 print(f"Thread#{i} done!")
 
-            parent_log.info(f"timer results:\n{timer}")
\ No newline at end of file
+            parent_log.info(f"timer results:\n{timer}")
+            parent_log.info(f"frame stats:\n{self.stats}")
+            if self.cpu_budget is not None:
+                parent_log.info(f"cpu usage:\n{self.cpu_budget.report()}")
\ No newline at end of file
@@ -0,0 +1,211 @@
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from rtvideo.common.frame_stats import FrameStats
+from rtvideo.common.structs import AsyncFrameProcessor, Frame, FrameProcessor, FrameSource
+from rtvideo.common.timer import Timer
+
+
+class OfflinePipeline:
+    """
+    Processes a finite source as fast as possible without dropping frames, e.g. to render a video file.
+
+    Frames are spread over `workers` threads, each running its own chain of processors built by
+    `processor_factory` so models and other per-instance state aren't shared between threads. The sink gets
+    the frames one at a time in source order. Nothing is timed against a frame rate, every stage simply waits
+    for the next, and at most `max_in_flight` frames are read ahead of the sink so a worker that falls behind
+    can't make the others buffer the whole video. The cores are split between the chains through `cpu_threads`,
+    so N workers don't each start inference pools sized for the whole machine.
+    """
+    def __init__(
+        self,
+        source: FrameSource,
+        processor_factory: Callable[[], List[FrameProcessor]],
+        sink: FrameProcessor,
+        logger: logging.Logger,
+        timer: Timer,
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        self.source = source
+        self.processor_factory = processor_factory
+        self.sink = sink
+        self.logger = logger
+        self.timer = timer
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 2
+        if self.workers < 1 or self.max_in_flight < self.workers:
+            raise ValueError(f"Need at least 1 worker and as many frames in flight as workers, got {self.workers} and {self.max_in_flight}")
+
+        self.exit_event = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.frame_count = 0
+        self.duration = 0.0
+
+        self.source.timer = timer
+        self.stats = FrameStats()
+
+    @property
+    def fps(self) -> float:
+        return self.frame_count / self.duration if self.duration > 0 else 0.0
+
+    def abort(self, error: Optional[BaseException] = None):
+        """
+        Stops every stage as soon as possible. `run` raises a RuntimeError for `error` once the threads are done.
+        """
+        if error is not None and self.error is None:
+            self.error = error
+        self.exit_event.set()
+
+    def run(self):
+        source = self.source
+        sink = self.sink
+        parent_log = self.logger
+        timer = self.timer
+        exit_event = self.exit_event
+        # Frames read but not yet handed to the sink, released in order so read-ahead stays bounded.
+        slots = threading.Semaphore(self.max_in_flight)
+        work_queue: queue.Queue = queue.Queue()
+        done_queue: queue.Queue = queue.Queue()
+        chains = [self.processor_factory() for _ in range(self.workers)]
+        worker_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        for processors in chains:
+            for processor in processors:
+                if processor.cpu_threads is None:
+                    processor.cpu_threads = worker_threads
+
+        def source_thread():
+            log = parent_log.getChild("source")
+            try:
+                log.info("Opening source...")
+                with timer.span("source.open()"):
+                    source.open()
+
+                log.info("Processing frames...")
+                for sequence, frame in enumerate(source):
+                    # Wait for the sink to catch up, checking in regularly so an abort still gets through.
+                    while not slots.acquire(timeout=0.1):
+                        if exit_event.is_set():
+                            return
+                    if exit_event.is_set():
+                        return
+                    frame.sequence = sequence
+                    work_queue.put(frame)
+            except Exception as e:
+                log.error(f"Error in source: {e}")
+                traceback.print_exc()
+                self.abort(e)
+            finally:
+                for _ in chains:
+                    work_queue.put(None)
+                try:
+                    source.close()
+                except Exception as e:
+                    log.error(f"Error closing source: {e}")
+
+        def worker_thread(index: int, processors: List[FrameProcessor]):
+            log = parent_log.getChild(f"worker{index}")
+            try:
+                for processor in processors:
+                    if isinstance(processor, AsyncFrameProcessor):
+                        processor.timer = timer
+                    with timer.span(f"{processor}.open()"):
+                        processor.open()
+
+                while not exit_event.is_set():
+                    frame = work_queue.get()
+                    if frame is None:
+                        break
+
+                    sequence = frame.sequence
+                    for processor in processors:
+                        if isinstance(processor, AsyncFrameProcessor):
+                            processor.submit(frame)
+                            frame = processor.poll(timeout=None)
+                        else:
+                            with timer.span(f"{processor}(frame)") as frame_span:
+                                processor.active_span = frame_span
+                                frame = processor(frame)
+                        if frame is None:
+                            break
+                    # Dropped frames still report their sequence so the sink doesn't wait on them.
+                    done_queue.put((sequence, frame))
+            except Exception as e:
+                log.error(f"Error in worker: {e}")
+                traceback.print_exc()
+                self.abort(e)
+            finally:
+                done_queue.put(None)
+                for processor in processors:
+                    try:
+                        processor.close()
+                    except Exception as e:
+                        log.error(f"Error closing processor {processor}: {e}")
+
+        threads = [threading.Thread(target=source_thread, name="source")]
+        for i, processors in enumerate(chains):
+            threads.append(threading.Thread(target=worker_thread, args=(i, processors), name=f"worker{i}"))
+
+        log = parent_log.getChild("sink")
+        start_ts = time.time()
+        try:
+            with timer.span(f"{sink}.open()"):
+                sink.open()
+            for thread in threads:
+                thread.start()
+
+            # Workers finish frames out of order, hold them back until every earlier frame has reached the sink.
+            pending: Dict[int, Optional[Frame]] = {}
+            next_sequence = 0
+            running_workers = len(chains)
+            while running_workers > 0 and not exit_event.is_set():
+                try:
+                    # Time out regularly so Ctrl+C still reaches the main thread.
+                    item = done_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    running_workers -= 1
+                    continue
+
+                sequence, frame = item
+                pending[sequence] = frame
+                while next_sequence in pending:
+                    frame = pending.pop(next_sequence)
+                    if frame is not None:
+                        with timer.span(f"{sink}(frame)") as frame_span:
+                            sink.active_span = frame_span
+                            sink(frame)
+                        frame.span.stop()
+                        self.stats.record(frame)
+                        self.frame_count += 1
+                    next_sequence += 1
+                    slots.release()
+        except KeyboardInterrupt:
+            log.warn("User interrupted, exiting...")
+            self.abort()
+            raise
+        except Exception as e:
+            log.error(f"Error in sink {sink}: {e}")
+            traceback.print_exc()
+            self.abort(e)
+        finally:
+            for thread in threads:
+                if thread.ident is not None:
+                    thread.join()
+            try:
+                sink.close()
+            except Exception as e:
+                log.error(f"Error closing sink {sink}: {e}")
+            self.duration = time.time() - start_ts
+
+            parent_log.info(f"timer results:\n{timer}")
+            parent_log.info(f"frame stats:\n{self.stats}")
+
+        if self.error is not None:
+            raise RuntimeError(f"Offline pipeline failed: {self.error}") from self.error
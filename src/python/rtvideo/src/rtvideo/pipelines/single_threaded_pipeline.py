@@ -1,7 +1,8 @@
 import logging
 from typing import List
 
-from rtvideo.common.structs import FrameProcessor, FrameSource
+from rtvideo.common.frame_stats import FrameStats
+from rtvideo.common.structs import FrameProcessor, FrameSource, MainThreadRenderer
 from rtvideo.common.timer import Timer
 
 
@@ -11,12 +12,16 @@ class SingleThreadPipeline:
         self.processors = processors
         self.logger = logger
         self.timer = timer
+        self.stats = FrameStats()
 
     def run(self):
         source = self.source
         processors = self.processors
         log = self.logger
         timer = self.timer
+        renderers = [processor for processor in processors if isinstance(processor, MainThreadRenderer)]
+        for renderer in renderers:
+            renderer.stats = self.stats
 
         try:
             log.info("Opening source, sink, and processors...")
@@ -34,9 +39,22 @@ class SingleThreadPipeline:
                         with timer.span(f"{processor}(frame)") as frame_span:
                             processor.active_span = frame_span
                             frame = processor(frame)
+                        if frame is None:
+                            # Dropped, skip the rest of the chain.
+                            break
+                    else:
+                        self.stats.record(frame)
+                for renderer in renderers:
+                    renderer.render(timeout=0)
         except KeyboardInterrupt:
             log.warn("User interrupted, exiting gracefully...")
         finally:
+            for renderer in renderers:
+                try:
+                    renderer.stop_rendering()
+                except Exception as e:
+                    log.error(f"Error stopping {renderer}: {e}")
+
             try:
                 source.close()
             except Exception as e:
@@ -48,4 +66,5 @@ class SingleThreadPipeline:
                 except Exception as e:
                     log.error(f"Error closing processor {processor}: {e}")
             
-            log.info(f"timer results:\n{timer}")
\ No newline at end of file
+            log.info(f"timer results:\n{timer}")
+            log.info(f"frame stats:\n{self.stats}")
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""
+Declarative pipeline specs (YAML or TOML) and the builder that turns them into runnable pipelines.
+
+    pipeline:
+      type: multi_thread        # multi_thread, single_thread or graph
+      target_fps: 30
+      drain: false              # multi_thread only: wait for room instead of dropping frames (offline jobs)
+      adaptive_quality:         # multi_thread only: turn processors' quality knobs down to keep up
+        latency_budget_ms: 150
+      cpu_budget:               # give stages their own CPUs, by component name or type (not single_thread)
+        cpus: 0-7
+        stages: {face_detector: 2, face_swapper: 3, hls: 2}
+    source:
+      type: file
+      file_path: .data/input.mp4
+    processors:
+      - type: face_detector
+        model_path: .data/models/scrfd_2.5g.onnx
+      - type: face_swapper
+        model_path: .data/models/faceswap.onnx
+        max_in_flight: 2        # keep 2 frames in flight with a ConcurrentProcessor
+    sinks:
+      - type: hls
+        output_dir: .data/hls
+
+Every other key on a component is passed to its constructor. Graph pipelines also accept `name`, `inputs`,
+`queue_size`, `queue_policy` and `main_thread` on processors and sinks; by default processors form a chain
+and every sink branches off the last processor.
+
+The same spec can render files offline with `build_offline_pipeline`, which keeps the processors but reads
+from the given file and records to the given output instead.
+
+With `streams` in place of `source` and `sinks`, `build_multi_stream` runs the processors for every stream
+while SCRFD face detectors and ONNX face swappers share one batched session per model across the streams:
+
+    batching:
+      max_batch_size: 8
+      max_wait_ms: 2
+    streams:
+      - name: lobby
+        source: {type: webcam, device: 0}
+        sinks: [{type: hls, port: 8888}]
+      - name: door
+        source: {type: file, file_path: .data/door.mp4}
+        sinks: [{type: recording, output_path: .data/door_out.mp4}]
+"""
+from dataclasses import dataclass
+import importlib
+import logging
+import os
+from typing import Any, Dict, List, Optional, Union
+
+from rtvideo.common.batched_session import BatchedSession
+from rtvideo.common.cpu_budget import SHARED as SHARED_CPUS, CpuBudget
+from rtvideo.common.structs import FrameProcessor, FrameSource, PixelFormat
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.adaptive_quality import AdaptiveQualityController
+from rtvideo.pipelines.graph_pipeline import SOURCE, GraphPipeline, PipelineGraph, QueuePolicy
+from rtvideo.pipelines.multi_stream import MultiStreamServer
+from rtvideo.pipelines.multi_threaded_pipeline import MultiThreadPipeline
+from rtvideo.pipelines.offline_pipeline import OfflinePipeline
+from rtvideo.pipelines.single_threaded_pipeline import SingleThreadPipeline
+from rtvideo.processors.concurrent_processor import ConcurrentProcessor
+from rtvideo.sinks.null import NullSink
+from rtvideo.sources.file import FileSource, video_fps
+from rtvideo.sources.limit import LimitSource
+
+# Components are imported lazily so a spec only needs the dependencies it actually uses.
+SOURCES = {
+    'file': 'rtvideo.sources.file:FileSource',
+    'replay': 'rtvideo.sources.replay:NpyReplaySource',
+    'webcam': 'rtvideo.sources.webcam:WebcamSource',
+}
+
+PROCESSORS = {
+    'face_detector': 'rtvideo.processors.face_detector:FaceDetector',
+    'face_swapper': 'rtvideo.processors.face_swapper:FaceSwapper',
+    'frame_health': 'rtvideo.processors.health:FrameHealthFilter',
+    'object_marker': 'rtvideo.processors.object_marker:ObjectMarker',
+    'pixel_format': 'rtvideo.processors.transforms:PixelFormatTransformer',
+    'timestamp_overlay': 'rtvideo.processors.timestamp_overlay:TimestampOverlay',
+}
+
+SINKS = {
+    'capture': 'rtvideo.sinks.capture:CaptureSink',
+    'display': 'rtvideo.sinks.display:DisplaySink',
+    'hls': 'rtvideo.sinks.hls:HlsSink',
+    'preview': 'rtvideo.sinks.preview:PreviewSink',
+    'recording': 'rtvideo.sinks.recording:RecordingSink',
+    'discard': 'rtvideo.sinks.null:NullSink',
+}
+
+PIPELINE_TYPES = ('multi_thread', 'single_thread', 'graph')
+# Pipeline options only MultiThreadPipeline understands.
+MULTI_THREAD_KEYS = ('drain', 'shutdown_timeout', 'adaptive_quality')
+
+# Pipeline types a multi-stream server can run streams on, they need to be stoppable from another thread.
+MULTI_STREAM_PIPELINE_TYPES = ('multi_thread', 'graph')
+STREAM_KEYS = ('name', 'source', 'sinks')
+
+# Keys that configure how a component sits in the pipeline rather than the component itself.
+PLACEMENT_KEYS = ('type', 'name', 'inputs', 'queue_size', 'queue_policy', 'main_thread', 'max_in_flight')
+GRAPH_ONLY_KEYS = ('name', 'inputs', 'queue_size', 'queue_policy', 'main_thread')
+
+
+@dataclass
+class BuiltPipeline:
+    pipeline: Union[MultiThreadPipeline, SingleThreadPipeline, GraphPipeline]
+    source: FrameSource
+    sinks: List[FrameProcessor]
+
+    def run(self):
+        self.pipeline.run()
+
+
+def load_spec(path: str) -> Dict[str, Any]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.yml', '.yaml'):
+        import yaml
+        with open(path) as f:
+            spec = yaml.safe_load(f)
+    elif extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            # Python 3.10 doesn't ship tomllib, tomli is the same parser.
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            spec = tomllib.load(f)
+    else:
+        raise ValueError(f"Unsupported spec format: {path} (expected .yml, .yaml or .toml)")
+
+    if not isinstance(spec, dict):
+        raise ValueError(f"Spec {path} must be a mapping at the top level")
+    return spec
+
+
+def _import_component(registry: Dict[str, str], kind: str, component_type: str):
+    if component_type not in registry:
+        raise ValueError(f"Unknown {kind} type '{component_type}', expected one of {sorted(registry)}")
+
+    module_name, class_name = registry[component_type].split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _build_component(registry: Dict[str, str], kind: str, entry: Dict[str, Any]):
+    if 'type' not in entry:
+        raise ValueError(f"Every {kind} needs a 'type', got {entry}")
+
+    kwargs = {key: value for key, value in entry.items() if key not in PLACEMENT_KEYS}
+    for key, value in kwargs.items():
+        if key.endswith('pixel_format'):
+            kwargs[key] = PixelFormat(value)
+
+    component = _import_component(registry, kind, entry['type'])(**kwargs)
+    if entry.get('max_in_flight', 1) > 1:
+        component = ConcurrentProcessor(component, max_in_flight=entry['max_in_flight'])
+    return component
+
+
+def _add_graph_node(graph: PipelineGraph, entry: Dict[str, Any], processor: FrameProcessor, name: str, inputs: List[str]):
+    graph.add(
+        entry.get('name', name),
+        processor,
+        inputs=entry.get('inputs', inputs),
+        queue_size=entry.get('queue_size', 1),
+        queue_policy=QueuePolicy(entry.get('queue_policy', QueuePolicy.DROP_NEWEST.value)),
+        main_thread=entry.get('main_thread', False),
+    )
+
+
+def _build_controller(config: Union[Dict[str, Any], bool, None], target_fps: float) -> Optional[AdaptiveQualityController]:
+    if not config:
+        return None
+    return AdaptiveQualityController(target_fps=target_fps, **({} if config is True else config))
+
+
+def _build_cpu_budget(
+    config: Optional[Dict[str, Any]],
+    entries: List[Dict[str, Any]],
+    components: List[FrameProcessor],
+) -> Optional[CpuBudget]:
+    if not config:
+        return None
+    budget = CpuBudget(**config)
+    stage_names = set(budget.stage_cpus)
+    for entry, component in zip(entries, components):
+        stage = entry.get('name') if entry.get('name') in stage_names else entry['type']
+        stage_names.discard(stage)
+        budget.assign(component, stage)
+    unknown = stage_names - {SHARED_CPUS}
+    if unknown:
+        raise ValueError(f"cpu_budget has stages {sorted(unknown)} that match no processor or sink")
+    return budget
+
+
+def build_pipeline(spec: Dict[str, Any], logger: logging.Logger, timer: Timer, bench_frames: Optional[int] = None) -> BuiltPipeline:
+    """
+    Builds the pipeline described by `spec`. With `bench_frames` the source stops after that many frames and
+    every sink is replaced by a NullSink so the pipeline runs headless.
+    """
+    pipeline_spec = spec.get('pipeline', {})
+    pipeline_type = pipeline_spec.get('type', 'multi_thread')
+    target_fps = pipeline_spec.get('target_fps', 30)
+    if pipeline_type not in PIPELINE_TYPES:
+        raise ValueError(f"Unknown pipeline type '{pipeline_type}', expected one of {PIPELINE_TYPES}")
+    if 'source' not in spec:
+        raise ValueError("Spec is missing a 'source'")
+    if 'cpu_budget' in pipeline_spec and pipeline_type == 'single_thread':
+        raise ValueError("cpu_budget needs a thread per stage, which pipeline type 'single_thread' doesn't have")
+    multi_thread_keys = [key for key in MULTI_THREAD_KEYS if key in pipeline_spec]
+    if multi_thread_keys and pipeline_type != 'multi_thread':
+        raise ValueError(f"{multi_thread_keys} are only supported by pipeline type 'multi_thread'")
+
+    processor_entries = spec.get('processors', [])
+    sink_entries = spec.get('sinks', [])
+    if not sink_entries:
+        raise ValueError("Spec needs at least one sink")
+
+    if pipeline_type != 'graph':
+        if len(sink_entries) > 1:
+            raise ValueError(f"Multiple sinks need pipeline type 'graph', not '{pipeline_type}'")
+        for entry in processor_entries + sink_entries:
+            graph_keys = [key for key in GRAPH_ONLY_KEYS if key in entry]
+            if graph_keys:
+                raise ValueError(f"{graph_keys} are only supported by pipeline type 'graph' ({entry['type']})")
+
+    source = _build_component(SOURCES, 'source', spec['source'])
+    if bench_frames is not None:
+        source = LimitSource(source, bench_frames)
+
+    processors = [_build_component(PROCESSORS, 'processor', entry) for entry in processor_entries]
+    if bench_frames is not None:
+        sinks = [NullSink() for _ in sink_entries]
+    else:
+        sinks = [_build_component(SINKS, 'sink', entry) for entry in sink_entries]
+    cpu_budget = _build_cpu_budget(pipeline_spec.get('cpu_budget'), processor_entries + sink_entries, processors + sinks)
+
+    if pipeline_type == 'multi_thread':
+        pipeline = MultiThreadPipeline(
+            source,
+            processors + sinks,
+            logger,
+            timer,
+            target_fps=target_fps,
+            drain=pipeline_spec.get('drain', False),
+            shutdown_timeout=pipeline_spec.get('shutdown_timeout', 10.0),
+            controller=_build_controller(pipeline_spec.get('adaptive_quality'), target_fps),
+            cpu_budget=cpu_budget,
+        )
+    elif pipeline_type == 'single_thread':
+        pipeline = SingleThreadPipeline(source, processors + sinks, logger, timer)
+    else:
+        graph = PipelineGraph()
+        previous = SOURCE
+        for i, (entry, processor) in enumerate(zip(processor_entries, processors)):
+            _add_graph_node(graph, entry, processor, f"{entry['type']}_{i}", [previous])
+            previous = list(graph.nodes)[-1]
+        for i, (entry, sink) in enumerate(zip(sink_entries, sinks)):
+            _add_graph_node(graph, entry, sink, f"{entry['type']}_sink_{i}", [previous])
+        pipeline = GraphPipeline(source, graph, logger, timer, target_fps=target_fps, cpu_budget=cpu_budget)
+
+    return BuiltPipeline(pipeline, source, sinks)
+
+
+def build_offline_pipeline(
+    spec: Dict[str, Any],
+    input_path: str,
+    output_path: str,
+    logger: logging.Logger,
+    timer: Timer,
+    workers: Optional[int] = None,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+) -> OfflinePipeline:
+    """
+    Builds an OfflinePipeline that runs the spec's processors over the video at `input_path` (or frames
+    [`start_frame`, `end_frame`) of it) and records the result to `output_path` at the input's frame rate.
+    The spec's source and sinks are ignored, except that the settings of a `recording` sink (encoder, pixel
+    format, segments) carry over to the output.
+    """
+    if 'processors' not in spec:
+        raise ValueError("Spec needs 'processors' to run offline")
+
+    # Every worker gets its own chain, so max_in_flight would only add threads on top of the workers.
+    processor_entries = [
+        {key: value for key, value in entry.items() if key != 'max_in_flight'} for entry in spec['processors']
+    ]
+
+    def processor_factory() -> List[FrameProcessor]:
+        return [_build_component(PROCESSORS, 'processor', entry) for entry in processor_entries]
+
+    recording_entry = next((entry for entry in spec.get('sinks', []) if entry.get('type') == 'recording'), {})
+    sink_entry = {
+        **{key: value for key, value in recording_entry.items() if key not in PLACEMENT_KEYS},
+        'type': 'recording',
+        'output_path': output_path,
+        'fps': video_fps(input_path),
+        'drop_frames': False,
+    }
+    sink = _build_component(SINKS, 'sink', sink_entry)
+
+    source = FileSource(input_path, loop=False, start_frame=start_frame, end_frame=end_frame)
+    return OfflinePipeline(source, processor_factory, sink, logger, timer, workers=workers)
+
+
+def _shares_session(entry: Dict[str, Any]) -> bool:
+    model_path = entry.get('model_path', '')
+    if entry['type'] == 'face_detector':
+        return model_path.endswith('.onnx') and 'scrfd' in model_path
+    return entry['type'] == 'face_swapper' and model_path.endswith('.onnx')
+
+
+def build_multi_stream(spec: Dict[str, Any], logger: logging.Logger, bench_frames: Optional[int] = None) -> MultiStreamServer:
+    """
+    Builds a MultiStreamServer running the spec's processors for each of its `streams`, with their models loaded
+    once and shared. With `bench_frames` every stream stops after that many frames and runs headless.
+    """
+    streams = spec.get('streams')
+    if not streams:
+        raise ValueError("Spec needs 'streams' to serve several streams")
+    if 'source' in spec or 'sinks' in spec:
+        raise ValueError("Multi-stream specs give each stream its own 'source' and 'sinks' instead of top-level ones")
+    pipeline_type = spec.get('pipeline', {}).get('type', 'multi_thread')
+    if pipeline_type not in MULTI_STREAM_PIPELINE_TYPES:
+        raise ValueError(f"Streams need pipeline type {MULTI_STREAM_PIPELINE_TYPES}, not '{pipeline_type}'")
+    names = [stream.get('name') for stream in streams]
+    if None in names or len(set(names)) != len(names):
+        raise ValueError(f"Every stream needs a unique 'name', got {names}")
+    for stream in streams:
+        unknown = [key for key in stream if key not in STREAM_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown keys {unknown} in stream '{stream['name']}', expected {STREAM_KEYS}")
+        if bench_frames is None and any(sink.get('type') == 'display' for sink in stream.get('sinks', [])):
+            raise ValueError(f"Stream '{stream['name']}' has a display sink, which needs the main thread to itself")
+
+    batching = spec.get('batching', {})
+    sessions: Dict[str, BatchedSession] = {}
+    for entry in spec.get('processors', []):
+        if _shares_session(entry) and entry['model_path'] not in sessions:
+            sessions[entry['model_path']] = BatchedSession.load(entry['model_path'], **batching)
+
+    pipeline_spec = {key: value for key, value in spec.items() if key not in ('streams', 'batching')}
+    built_streams = {}
+    for stream in streams:
+        processors = [
+            {**entry, 'session': sessions[entry['model_path']].for_stream(stream['name'])} if _shares_session(entry) else entry
+            for entry in spec.get('processors', [])
+        ]
+        stream_spec = {**pipeline_spec, 'source': stream['source'], 'sinks': stream.get('sinks', []), 'processors': processors}
+        built_streams[stream['name']] = build_pipeline(stream_spec, logger.getChild(stream['name']), Timer(), bench_frames=bench_frames)
+    return MultiStreamServer(built_streams, list(sessions.values()), logger)
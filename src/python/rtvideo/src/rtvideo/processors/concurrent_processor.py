@@ -0,0 +1,84 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Deque, List, Optional
+
+from rtvideo.common.structs import AsyncFrameProcessor, Frame, FrameProcessor, QualityKnob
+
+
+class ConcurrentProcessor(AsyncFrameProcessor):
+    """
+    Runs a regular processor on a pool of `max_in_flight` worker threads so that the pre-processing,
+    inference and post-processing of consecutive frames overlap. Frames are handed back in submission order.
+
+    The wrapped processor must be safe to call from several threads at once (ONNX Runtime sessions,
+    OpenCV and NumPy all release the GIL for the heavy lifting, which is where the overlap comes from).
+    """
+    processor: FrameProcessor
+    executor: Optional[ThreadPoolExecutor]
+    futures: Deque[Future]
+
+    def __init__(self, processor: FrameProcessor, max_in_flight: int = 2):
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+        self.processor = processor
+        self.max_in_flight = max_in_flight
+        self.executor = None
+        self.futures = deque()
+
+    def __str__(self) -> str:
+        return f"ConcurrentProcessor({self.processor}, max_in_flight={self.max_in_flight})"
+
+    def open(self):
+        if self.cpu_threads is not None:
+            # Frames in flight run side by side, each with its share of the stage's threads.
+            self.processor.cpu_threads = max(1, self.cpu_threads // self.max_in_flight)
+        self.processor.open()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix=str(self.processor))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.futures.clear()
+        self.processor.close()
+
+    def quality_knobs(self) -> List[QualityKnob]:
+        return self.processor.quality_knobs()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.futures)
+
+    def _process(self, frame: Frame) -> Frame:
+        if self.timer is None:
+            return self.processor(frame)
+
+        with self.timer.span(f"{self.processor}(frame)") as frame_span:
+            self.processor.active_span = frame_span
+            return self.processor(frame)
+
+    def submit(self, frame: Frame) -> None:
+        if self.in_flight >= self.max_in_flight:
+            raise RuntimeError(f"{self} already has {self.in_flight} frames in flight")
+
+        self.futures.append(self.executor.submit(self._process, frame))
+
+    def poll(self, timeout: Optional[float] = 0) -> Optional[Frame]:
+        if not self.futures:
+            return None
+
+        try:
+            self.futures[0].result(timeout=timeout)
+        except FutureTimeoutError:
+            return None
+        except Exception:
+            self.futures.popleft()
+            raise
+
+        return self.futures.popleft().result()
+
+    def __call__(self, frame: Frame) -> Frame:
+        # Synchronous fallback for pipelines that don't know about in-flight frames.
+        self.submit(frame)
+        return self.poll(timeout=None)
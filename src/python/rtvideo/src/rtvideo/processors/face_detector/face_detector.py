@@ -1,12 +1,36 @@
+import threading
+from typing import Any, List, Optional
+
 import numpy as np
-from rtvideo.common.structs import BoundingBox, Frame, FrameProcessor, PixelArrangement, PixelFormat
+from rtvideo.common.structs import Detections, Frame, FrameProcessor, PixelArrangement, PixelFormat, QualityKnob
 from rtvideo.processors.face_detector.scrfd import SCRFD
 from rtvideo.processors.face_detector.yolov8_face import YOLOv8Face
 
+# Input sizes an adaptive controller steps SCRFD down through, for models that accept any size.
+SCRFD_INPUT_SIZES = (640, 512, 416, 320)
+DETECTION_INTERVALS = (1, 2, 3, 4)
+
 
 class FaceDetector(FrameProcessor):
-    def __init__(self, model_path: str):
+    """
+    Finds faces every `detection_interval` frames, frames in between reuse the last detections. SCRFD models can
+    run on a given `session` instead of loading their own, e.g. one shared between streams (see BatchedSession).
+    Safe to call from several threads at once (see ConcurrentProcessor), knobs included.
+    """
+    def __init__(self, model_path: str, detection_interval: int = 1, session: Optional[Any] = None):
+        if detection_interval not in DETECTION_INTERVALS:
+            raise ValueError(f"detection_interval must be one of {DETECTION_INTERVALS}, got {detection_interval}")
+        if session is not None and 'scrfd' not in model_path:
+            raise ValueError(f"Only SCRFD detectors can run on a shared session, not {model_path}")
+
         self.model_path = model_path
+        self.session = session
+        self.interval_knob = QualityKnob('detection_interval', DETECTION_INTERVALS, DETECTION_INTERVALS.index(detection_interval))
+        self.input_size_knob: Optional[QualityKnob] = None
+        # Guards the interval state, frames may be in flight on several threads.
+        self.lock = threading.Lock()
+        self.frames_since_detection = 0
+        self.last_detections: Optional[Detections] = None
 
     def __str__(self) -> str:
         return f"FaceDetector(model_path={self.model_path})"
@@ -15,29 +39,51 @@ class FaceDetector(FrameProcessor):
         if 'yolov8' in self.model_path:
             self.detector = YOLOv8Face(self.model_path)
         elif 'scrfd' in self.model_path:
-            self.detector = SCRFD(self.model_path)
+            self.detector = SCRFD(self.model_path, threads=self.cpu_threads, session=self.session)
             self.detector.detect(np.zeros((640, 640, 3), dtype=np.uint8))
+            if self.detector.dynamic_input:
+                self.input_size_knob = QualityKnob('input_size', SCRFD_INPUT_SIZES)
         else:
             raise ValueError(f"Unidentified face detector: {self.model_path}")
 
-    def _expand_bounding_box(self, frame: Frame, bbox: BoundingBox, scale: float = 1.5) -> BoundingBox:
-        x, y, w, h = bbox
-        center_x, center_y = x + w / 2, y + h / 2
-        max_dim = max(w, h)
-        new_dim = int(max_dim * scale)
-        new_x = int(max(0, center_x - new_dim / 2))
-        new_y = int(max(0, center_y - new_dim / 2))
-        new_w = min(frame.width - new_x, new_dim)
-        new_h = min(frame.height - new_y, new_dim)
-        return BoundingBox(new_x, new_y, new_w, new_h)
+    def quality_knobs(self) -> List[QualityKnob]:
+        knobs = [self.interval_knob]
+        if self.input_size_knob is not None:
+            knobs.insert(0, self.input_size_knob)
+        return knobs
+
+    def _detect(self, frame: Frame) -> Detections:
+        # The detectors only look at a 640px image, so hand them one that was shrunk before color conversion.
+        if isinstance(self.detector, SCRFD):
+            # Read once, the knob can change while this frame is in flight.
+            input_size = self.input_size_knob.value if self.input_size_knob is not None else self.detector.input_size
+            image, scale = frame.downscaled(PixelFormat.RGB_uint8, input_size)
+            detections, keypoints = self.detector.detect(image, input_size=input_size)
+            return Detections(detections[:, 0:4] / scale, detections[:, 4], keypoints / scale)
+
+        # YOLOv8Face does its own BGR to RGB conversion.
+        image, scale = frame.downscaled(PixelFormat.BGR_uint8, self.detector.input_width)
+        bboxes, scores, _, landmarks = self.detector.detect(image)
+        if len(bboxes) == 0:
+            return Detections.empty()
+        # YOLOv8 landmarks are (x, y, score) triplets, keep just the coordinates.
+        return Detections(bboxes / scale, scores, landmarks.reshape(len(bboxes), -1, 3)[:, :, 0:2] / scale)
 
     def __call__(self, frame: Frame) -> Frame:
         assert frame.pixel_arrangement == PixelArrangement.HWC
-        assert frame.pixel_format == PixelFormat.RGB_uint8
-        
+
         output_frame = frame.copy()
-        detections = self.detector.detect(frame.pixels)[0]
-        for detection in detections:
-            bbox = self._expand_bounding_box(frame, detection)
-            output_frame.objects.append(bbox)
-        return output_frame
\ No newline at end of file
+        with self.lock:
+            detect = self.last_detections is None or self.frames_since_detection + 1 >= self.interval_knob.value
+            if detect:
+                self.frames_since_detection = 0
+            else:
+                self.frames_since_detection += 1
+                detections = self.last_detections
+        if detect:
+            # Outside the lock so frames in flight on other threads detect concurrently.
+            detections = self._detect(frame).expand(1.5, frame.width, frame.height)
+            with self.lock:
+                self.last_detections = detections
+        output_frame.objects = detections.copy()
+        return output_frame
@@ -1,25 +1,49 @@
 import os
-from typing import Tuple
+from typing import Optional, Tuple
 import numpy as np
 import onnxruntime
 import cv2
 
+from rtvideo.common.cpu_budget import ort_session_options
+
 class SCRFD:
-    def __init__(self, model_file):
-        assert os.path.isfile(model_file)
-        self.session = onnxruntime.InferenceSession(
-            model_file,
-            providers=["CUDAExecutionProvider", "CPUExecutionProvider"],
-        )
+    def __init__(self, model_file, threads=None, session=None):
+        # A session can be shared between detectors, e.g. a StreamSession of a BatchedSession.
+        if session is None:
+            assert os.path.isfile(model_file)
+            session = onnxruntime.InferenceSession(
+                model_file,
+                sess_options=ort_session_options(threads),
+                providers=["CUDAExecutionProvider", "CPUExecutionProvider"],
+            )
+        self.session = session
 
         self.input_name = self.session.get_inputs()[0].name
+        # Models exported with symbolic height and width run at any multiple of the largest stride.
+        self.dynamic_input = not all(isinstance(dim, int) for dim in self.session.get_inputs()[0].shape[2:])
         self.output_names = [o.name for o in self.session.get_outputs()]
 
         self.nms_thresh = 0.4
         self.features_per_stride = 3
         self.input_size = 640
         self.strides = [8, 16, 32]
-        self.anchor_centers = SCRFD.build_anchor_centers(640, [8, 16, 32], 2)
+        # By input size, never replaced once built so detections in flight keep the anchors of their size.
+        self.anchor_centers = {640: SCRFD.build_anchor_centers(640, self.strides, 2)}
+
+    def set_input_size(self, size: int):
+        """
+        Runs the model at `size` x `size` from now on. Smaller is faster but misses small faces.
+        """
+        self.check_input_size(size)
+        self.input_size = size
+
+    def check_input_size(self, size: int):
+        if not self.dynamic_input and size != self.input_size:
+            raise ValueError(f"This SCRFD model only runs at {self.input_size}x{self.input_size}")
+        if size % max(self.strides) != 0:
+            raise ValueError(f"SCRFD input size must be a multiple of {max(self.strides)}, got {size}")
+        if size not in self.anchor_centers:
+            self.anchor_centers[size] = SCRFD.build_anchor_centers(size, self.strides, 2)
 
     def forward(self, img: np.ndarray, thresh: float) -> Tuple[list[np.ndarray], list[np.ndarray], list[np.ndarray]]:
         scores_list = []
@@ -27,8 +51,8 @@ class SCRFD:
         keypoints_list = []
 
         _, input_height, input_width = img.shape
-        assert input_height == self.input_size
-        assert input_width == self.input_size
+        assert input_height == input_width
+        anchor_centers_by_stride = self.anchor_centers[input_height]
 
         img = np.expand_dims(img, axis=0).astype(np.float32) * 2 - 1
         net_outs = self.session.run(self.output_names, {self.input_name: img})
@@ -41,7 +65,7 @@ class SCRFD:
             scores = net_outs[idx]
             bbox_preds = net_outs[idx + self.features_per_stride] * stride
             kps_preds = net_outs[idx + self.features_per_stride * 2] * stride
-            anchor_centers = self.anchor_centers[stride]
+            anchor_centers = anchor_centers_by_stride[stride]
 
             bboxes = bboxes_from_anchor_distances(anchor_centers, bbox_preds)
             keypoints = keypoints_from_anchor_distances(anchor_centers, kps_preds)
@@ -72,27 +96,38 @@ class SCRFD:
             anchor_centers_by_stride[stride] = anchor_centers
         return anchor_centers_by_stride
 
-    def detect(self, img: np.ndarray, thresh: float = 0.3):
-        detection_scale, detection_image = self.preprocess(img)
+    def detect(self, img: np.ndarray, thresh: float = 0.3, input_size: Optional[int] = None):
+        """
+        Runs at `input_size` if given, otherwise the size set with `set_input_size`. Passing the size per call lets
+        detections run concurrently at different sizes.
+        """
+        if input_size is None:
+            input_size = self.input_size
+        else:
+            self.check_input_size(input_size)
+        detection_scale, detection_image = self.preprocess(img, input_size)
         scores_list, bboxes_list, keypoints_list = self.forward(detection_image, thresh)
         return self.postprocess(detection_scale, scores_list, bboxes_list, keypoints_list)
 
-    def preprocess(self, img: np.ndarray) -> Tuple[float, np.ndarray]:
+    def preprocess(self, img: np.ndarray, input_size: int) -> Tuple[float, np.ndarray]:
         orig_height, orig_width, _ = img.shape
         aspect_ratio = orig_height / orig_width
-        if orig_height > orig_width:
-            new_height = self.input_size
+        if max(orig_height, orig_width) == input_size:
+            # Already downscaled by the caller (see Frame.downscaled), skip the redundant resize.
+            new_height, new_width = orig_height, orig_width
+        elif orig_height > orig_width:
+            new_height = input_size
             new_width = int(new_height / aspect_ratio)
         else:
-            new_width = self.input_size
+            new_width = input_size
             new_height = int(new_width * aspect_ratio)
         detection_scale = float(new_height) / orig_height
 
-        resized_img = cv2.resize(img, (new_width, new_height))
+        resized_img = img if (new_width, new_height) == (orig_width, orig_height) else cv2.resize(img, (new_width, new_height))
         resized_img = resized_img.transpose(2, 0, 1)
         resized_img = resized_img.astype(np.float32) / 127.5 - 1
 
-        detection_image = np.zeros((3, self.input_size, self.input_size), dtype=np.float32)
+        detection_image = np.zeros((3, input_size, input_size), dtype=np.float32)
         detection_image[:, :new_height, :new_width] = resized_img
         return detection_scale, detection_image
 
@@ -106,16 +141,17 @@ class SCRFD:
         keypoints = keypoints[order]
 
         indices_to_keep = self.nms(detections)
-        detections = [self.ltrb2ltwh(x) for x in detections[indices_to_keep]]
+        detections = self.ltrb2ltwh(detections[indices_to_keep])
         keypoints = keypoints[indices_to_keep]
         return detections, keypoints
 
-    def ltrb2ltwh(self, ltrb):
+    def ltrb2ltwh(self, ltrb: np.ndarray) -> np.ndarray:
         """
-        Converts a bounding box from (left, top, right, bottom) to (left, top, width, height) format.
+        Converts (N, 5) detections from (left, top, right, bottom, score) to (left, top, width, height, score) format.
         """
-        l, t, r, b, _ = ltrb
-        return [l, t, r - l, b - t]
+        ltwh = ltrb.copy()
+        ltwh[:, 2:4] -= ltwh[:, 0:2]
+        return ltwh
 
     def nms(self, detections: np.ndarray):
         """
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 import cv2
 import logging
 
@@ -7,6 +7,7 @@ import cupy as cp
 import onnxruntime as ort
 import cupyx.scipy.ndimage
 
+from rtvideo.common.cpu_budget import ort_session_options
 from rtvideo.common.structs import BoundingBox, Frame, FrameProcessor, PixelArrangement, PixelFormat
 
 log = logging.getLogger(__name__)
@@ -17,18 +18,23 @@ class FaceSwapper(FrameProcessor):
     tensorrt: Any
     onnx: ort.InferenceSession
 
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, session: Optional[Any] = None):
+        """
+        ONNX models can run on a given `session` instead of loading their own, e.g. one shared between streams
+        (see BatchedSession).
+        """
         self.model_path = model_path
         self.tensorrt = None
         self.onnx = None
+        self.session = session
 
         if model_path.endswith('.engine'):
             from rtvideo.common.tensorrt_context import TensorRTContext
             self.tensorrt = TensorRTContext(model_path)
-        elif model_path.endswith('.onnx'):
-            self.onnx = ort.InferenceSession(model_path, providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
-        else:
+        elif not model_path.endswith('.onnx'):
             raise ValueError(f"Unidentified model: {model_path}")
+        if session is not None and not model_path.endswith('.onnx'):
+            raise ValueError(f"Only ONNX models can run on a shared session, not {model_path}")
 
     def __str__(self) -> str:
         return f"FaceSwapperTensorRT(model_path={self.model_path})"
@@ -37,6 +43,15 @@ class FaceSwapper(FrameProcessor):
         if self.tensorrt is not None:
             self.tensorrt.open()
 
+        if self.session is not None:
+            self.onnx = self.session
+        elif self.model_path.endswith('.onnx'):
+            # Created here rather than in __init__ so it gets the thread count and CPUs of a CpuBudget.
+            self.onnx = ort.InferenceSession(
+                self.model_path,
+                sess_options=ort_session_options(self.cpu_threads),
+                providers=['CUDAExecutionProvider', 'CPUExecutionProvider'],
+            )
         if self.onnx is not None:
             self._run_model(np.zeros((1, 3, 512, 512), dtype=np.float32))
 
@@ -63,6 +78,7 @@ class FaceSwapper(FrameProcessor):
         Composite a foreground image (HWC, RGBA, uint8)
         onto the background image (HWC, RGB, uint8)
         at the specified position using Cupy and GPU acceleration.
+        BGRA onto BGR works the same way, only the channel order has to match.
         """
         x, y, w, h = position
         background = cp.asarray(background)
@@ -88,6 +104,7 @@ class FaceSwapper(FrameProcessor):
         Composite a foreground image (HWC, RGBA, uint8)
         onto the background image (HWC, RGB, uint8)
         at the specified position.
+        BGRA onto BGR works the same way, only the channel order has to match.
         """
         if cp.cuda.is_available():
             return self._composite_images_gpu(background, foreground, position)
@@ -110,19 +127,23 @@ class FaceSwapper(FrameProcessor):
 
     def __call__(self, frame: Frame) -> Frame:
         assert frame.pixel_arrangement == PixelArrangement.HWC
-        assert frame.pixel_format == PixelFormat.RGB_uint8
 
         if len(frame.objects) == 0:
             return frame
 
+        # Composite in the frame's native channel order when we can so only the face crop needs converting.
+        is_bgr = frame.pixel_format == PixelFormat.BGR_uint8
+        frame_hwc_uint8 = frame.pixels if is_bgr else frame.as_rgb()
         face = frame.objects[0]
-        face_input_rgb_hwc_uint8 = frame.pixels[
+        face_input_hwc_uint8 = frame_hwc_uint8[
             face.top : face.top + face.height,
             face.left : face.left + face.width,
         ]
 
         with self.active_span.child('preprocess_frame'):
-            face_input_rgb_hwc_uint8 = cv2.resize(face_input_rgb_hwc_uint8, (512, 512))
+            face_input_rgb_hwc_uint8 = cv2.resize(face_input_hwc_uint8, (512, 512))
+            if is_bgr:
+                face_input_rgb_hwc_uint8 = cv2.cvtColor(face_input_rgb_hwc_uint8, cv2.COLOR_BGR2RGB)
             face_input_rgb_chw_float32 = face_input_rgb_hwc_uint8.transpose((2, 0, 1)).astype(np.float32) / 255.0
             face_input_rgb_chw_float32 = np.expand_dims(face_input_rgb_chw_float32, axis=0)
 
@@ -131,17 +152,22 @@ class FaceSwapper(FrameProcessor):
 
         with self.active_span.child('postprocess_frame'):
             face_rgba_hwc_uint8 = (face_rgba_chw_float32.clip(0, 1) * 255).astype(np.uint8).transpose((1, 2, 0))
+            if is_bgr:
+                face_rgba_hwc_uint8 = cv2.cvtColor(face_rgba_hwc_uint8, cv2.COLOR_RGBA2BGRA)
 
         with self.active_span.child('composite_images'):
-            frame_rgb_hwc_uint8 = frame.pixels
-            frame_rgba_hwc_uint8 = self._composite_images(frame_rgb_hwc_uint8, face_rgba_hwc_uint8, face)
+            frame_rgba_hwc_uint8 = self._composite_images(frame_hwc_uint8, face_rgba_hwc_uint8, face)
 
         output_frame = Frame(
             pixels=frame_rgba_hwc_uint8,
-            pixel_format=PixelFormat.RGBA_uint8,
+            pixel_format=PixelFormat.BGRA_uint8 if is_bgr else PixelFormat.RGBA_uint8,
             pixel_arrangement=PixelArrangement.HWC,
             objects=frame.objects,
-            span=frame.span
+            span=frame.span,
+            sequence=frame.sequence,
+            flags=frame.flags,
+            capture_ts=frame.capture_ts,
+            arrival_ts=frame.arrival_ts,
         )
 
         return output_frame
@@ -0,0 +1,126 @@
+from collections import Counter
+import logging
+from typing import Optional
+import zlib
+
+import numpy as np
+
+from rtvideo.common.structs import PLANAR_YUV_FORMATS, Frame, FrameProcessor, PixelArrangement, PixelFormat
+
+log = logging.getLogger(__name__)
+
+ACTIONS = ('drop', 'flag')
+
+
+def brightness_sample(frame: Frame, stride: int) -> np.ndarray:
+    """
+    Every `stride`th pixel of every `stride`th row as a (rows, columns) uint8 array of luma, or of the brightest
+    channel for RGB formats. Strided views keep this to a fraction of the frame's size.
+    """
+    pixels = frame.pixels
+    if frame.pixel_arrangement != PixelArrangement.HWC:
+        pixels = frame.as_bgr()
+    elif frame.pixel_format in PLANAR_YUV_FORMATS:
+        return pixels[:frame.height:stride, ::stride]
+    elif frame.pixel_format == PixelFormat.YUYV422_uint8:
+        return pixels[::stride, ::stride, 0]
+
+    strided = pixels[::stride, ::stride]
+    # Elementwise maximum of the channel planes, far faster than reducing over the channel axis.
+    sample = np.maximum(np.maximum(strided[:, :, 0], strided[:, :, 1]), strided[:, :, 2])
+    if sample.dtype == np.float32:
+        sample = (sample * 255).astype(np.uint8)
+    return sample
+
+
+def black_row_fraction(sample: np.ndarray, black_level: int) -> float:
+    return float(np.count_nonzero(sample.max(axis=1) <= black_level)) / len(sample)
+
+
+def is_black_frame(frame: Frame, black_level: int = 0, black_fraction: float = 0.25, stride: int = 4) -> bool:
+    """
+    Whether more than `black_fraction` of the rows are black, i.e. no brighter than `black_level`.
+    """
+    return black_row_fraction(brightness_sample(frame, stride), black_level) > black_fraction
+
+
+class FrameHealthFilter(FrameProcessor):
+    """
+    Catches broken frames from capture devices and decoders before they reach expensive stages:
+
+    - black: more than `black_fraction` of the rows no brighter than `black_level` (dropped or blank input), the default
+      is high enough that letterboxed content passes (2.39:1 in 16:9 is about 26% black rows)
+    - corrupted: more than `corrupt_fraction` of the rows a single flat value that isn't black, which is how
+      truncated or half-decoded frames usually look (a gray or green band filling the rest of the frame)
+    - frozen: the same pixels `frozen_frames` times in a row (a stalled device repeating its last buffer),
+      a single repeat is allowed since frame rate conversion produces those
+
+    Every check runs on a strided sample of the frame, and frozen frames are found with a checksum of the
+    sample, so the cost is a small fraction of touching every pixel. With `action='drop'` broken frames are
+    dropped, with `action='flag'` they're passed on with 'black', 'corrupted' or 'frozen' in `frame.flags`.
+    Set a threshold to None to skip that check.
+    """
+    def __init__(
+        self,
+        action: str = 'drop',
+        stride: int = 4,
+        black_level: int = 16,
+        black_fraction: Optional[float] = 0.9,
+        corrupt_fraction: Optional[float] = 0.25,
+        frozen_frames: Optional[int] = 3,
+    ):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action '{action}', expected one of {ACTIONS}")
+        if frozen_frames is not None and frozen_frames < 2:
+            raise ValueError(f"frozen_frames must be at least 2, got {frozen_frames}")
+
+        self.action = action
+        self.stride = stride
+        self.black_level = black_level
+        self.black_fraction = black_fraction
+        self.corrupt_fraction = corrupt_fraction
+        self.frozen_frames = frozen_frames
+        self.last_checksum = None
+        self.repeats = 0
+        self.counts = Counter()
+
+    def __str__(self) -> str:
+        return f"FrameHealthFilter(action={self.action})"
+
+    def close(self):
+        if self.counts:
+            log.info(f"Broken frames: {dict(self.counts)}")
+
+    def check(self, frame: Frame) -> Optional[str]:
+        """
+        Returns what's wrong with the frame, or None if it looks fine.
+        """
+        sample = brightness_sample(frame, self.stride)
+
+        if self.frozen_frames is not None:
+            checksum = zlib.crc32(np.ascontiguousarray(sample))
+            self.repeats = self.repeats + 1 if checksum == self.last_checksum else 1
+            self.last_checksum = checksum
+
+        if self.black_fraction is not None and black_row_fraction(sample, self.black_level) > self.black_fraction:
+            return 'black'
+        if self.corrupt_fraction is not None:
+            row_max = sample.max(axis=1)
+            flat_rows = (row_max == sample.min(axis=1)) & (row_max > self.black_level)
+            if np.count_nonzero(flat_rows) > self.corrupt_fraction * len(sample):
+                return 'corrupted'
+        if self.frozen_frames is not None and self.repeats >= self.frozen_frames:
+            return 'frozen'
+        return None
+
+    def __call__(self, frame: Frame) -> Optional[Frame]:
+        problem = self.check(frame)
+        if problem is None:
+            return frame
+
+        self.counts[problem] += 1
+        if self.action == 'drop':
+            log.debug(f"Dropping {problem} frame")
+            return None
+        frame.flags.add(problem)
+        return frame
@@ -11,5 +11,6 @@ class ObjectMarker(FrameProcessor):
                 object.top : object.top + 10,
                 object.left : object.left + 10,
             ] = 0
+        frame.invalidate_conversions()
 
         return frame
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from rtvideo.common.structs import PLANAR_YUV_FORMATS, Frame, FrameProcessor, PixelFormat
+
+# The low 32 bits of the ms timestamp wrap every ~50 days, readers recover the rest from their own clock.
+TIMESTAMP_BITS = 32
+# A white then black cell before the bits so a reader can tell a barcode from arbitrary pixels.
+GUARD_BITS = [1, 0]
+
+
+def _luma(frame: Frame) -> np.ndarray:
+    """
+    Returns a writable view of the plane(s) that carry brightness for the frame's pixel format.
+    """
+    if frame.pixel_format in PLANAR_YUV_FORMATS:
+        return frame.pixels[:frame.height]
+    if frame.pixel_format == PixelFormat.YUYV422_uint8:
+        return frame.pixels[:, :, 0]
+    return frame.pixels
+
+
+def _barcode_bits(timestamp_ms: int):
+    return GUARD_BITS + [(timestamp_ms >> shift) & 1 for shift in range(TIMESTAMP_BITS - 1, -1, -1)]
+
+
+class TimestampOverlay(FrameProcessor):
+    """
+    Stamps the current wall-clock time onto each frame as a barcode of black and white cells in the top-left
+    corner, plus a human-readable label under it. `read_timestamp` decodes the barcode from a frame that has
+    been through the rest of the pipeline, an encoder and a player, which gives the end-to-end latency of
+    everything downstream of this processor.
+    """
+    def __init__(self, cell_size: int = 12, show_text: bool = True):
+        self.cell_size = cell_size
+        self.show_text = show_text
+
+    def __str__(self) -> str:
+        return f"TimestampOverlay(cell_size={self.cell_size})"
+
+    def __call__(self, frame: Frame) -> Frame:
+        cells = len(GUARD_BITS) + TIMESTAMP_BITS
+        if (cells + 2) * self.cell_size > frame.width or self.cell_size * 4 > frame.height:
+            raise ValueError(f"Frame {frame.width}x{frame.height} is too small for a {self.cell_size}px barcode")
+        if not frame.pixels.flags.writeable:
+            frame.pixels = frame.pixels.copy()
+
+        timestamp_ms = int(time.time() * 1000)
+        luma = _luma(frame)
+        top, size = self.cell_size, self.cell_size
+        for i, bit in enumerate(_barcode_bits(timestamp_ms)):
+            left = (i + 1) * size
+            luma[top : top + size, left : left + size] = 255 if bit else 0
+
+        if self.show_text:
+            label = time.strftime('%H:%M:%S', time.localtime(timestamp_ms / 1000)) + f'.{timestamp_ms % 1000:03d}'
+            origin = (size, top + size * 3)
+            cv2.putText(luma, label, origin, cv2.FONT_HERSHEY_SIMPLEX, size / 16, 0, thickness=max(1, size // 4))
+            cv2.putText(luma, label, origin, cv2.FONT_HERSHEY_SIMPLEX, size / 16, 255, thickness=max(1, size // 8))
+
+        frame.invalidate_conversions()
+        return frame
+
+
+def read_timestamp(pixels: np.ndarray, cell_size: int = 12) -> Optional[int]:
+    """
+    Decodes the timestamp (ms since the epoch) written by TimestampOverlay from BGR, RGB or grayscale pixels.
+    Returns None if there's no barcode at the expected position.
+    """
+    gray = pixels if pixels.ndim == 2 else cv2.cvtColor(pixels[:, :, :3], cv2.COLOR_BGR2GRAY)
+    cells = len(GUARD_BITS) + TIMESTAMP_BITS
+    if (cells + 1) * cell_size > gray.shape[1] or cell_size * 2 > gray.shape[0]:
+        return None
+
+    # Sample the middle of each cell so compression artifacts at the edges don't matter.
+    margin = cell_size // 4
+    top = cell_size
+    bits = []
+    for i in range(cells):
+        left = (i + 1) * cell_size
+        cell = gray[top + margin : top + cell_size - margin, left + margin : left + cell_size - margin]
+        bits.append(1 if cell.mean() >= 128 else 0)
+
+    if bits[:len(GUARD_BITS)] != GUARD_BITS:
+        return None
+
+    low_bits = 0
+    for bit in bits[len(GUARD_BITS):]:
+        low_bits = (low_bits << 1) | bit
+
+    # Pick the timestamp with those low bits closest to now, the frame can't be more than a wrap old.
+    now_ms = int(time.time() * 1000)
+    wrap = 1 << TIMESTAMP_BITS
+    timestamp_ms = (now_ms & ~(wrap - 1)) | low_bits
+    if timestamp_ms > now_ms + wrap // 2:
+        timestamp_ms -= wrap
+    return timestamp_ms
@@ -12,13 +12,18 @@ class PixelFormatTransformer(FrameProcessor):
         if frame.pixel_format == self.target_pixel_format:
             return frame
 
-        if self.target_pixel_format == PixelFormat.RGB_uint8:
-            rgb_pixels = frame.as_rgb()
-            return Frame(
-                pixels=rgb_pixels,
-                pixel_format=self.target_pixel_format,
-                pixel_arrangement=frame.pixel_arrangement,
-                objects=frame.objects,
-                span=frame.span)
+        try:
+            pixels = frame.convert(self.target_pixel_format)
+        except ValueError:
+            raise NotImplementedError(f"Conversion from {frame.pixel_format} to {self.target_pixel_format} is not supported")
 
-        raise NotImplementedError(f"Conversion from {frame.pixel_format} to {self.target_pixel_format} is not supported")
\ No newline at end of file
+        return Frame(
+            pixels=pixels,
+            pixel_format=self.target_pixel_format,
+            pixel_arrangement=frame.pixel_arrangement,
+            objects=frame.objects,
+            span=frame.span,
+            sequence=frame.sequence,
+            flags=frame.flags,
+            capture_ts=frame.capture_ts,
+            arrival_ts=frame.arrival_ts)
\ No newline at end of file
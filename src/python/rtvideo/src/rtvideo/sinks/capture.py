@@ -0,0 +1,41 @@
+import logging
+import os
+from typing import Optional
+
+from rtvideo.common.frame_ring import FrameRing
+from rtvideo.common.structs import Frame, FrameProcessor, PixelFormat
+
+log = logging.getLogger(__name__)
+
+
+class CaptureSink(FrameProcessor):
+    """
+    Keeps the last `seconds` of frames in a FrameRing and writes them to `output_path` as a `.npy` file that a
+    `replay` source can play back, when the pipeline closes or whenever `save` is called. Frames are stored in
+    `pixel_format`, or as they arrive when it's None.
+    """
+    def __init__(self, output_path: str, seconds: float = 5.0, fps: int = 30, pixel_format: Optional[PixelFormat] = PixelFormat.BGR_uint8):
+        self.output_path = output_path
+        self.pixel_format = pixel_format
+        self.ring = FrameRing(max(1, int(seconds * fps)))
+
+    def __str__(self) -> str:
+        return f"CaptureSink(output_path={self.output_path}, frames={self.ring.capacity})"
+
+    def open(self):
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def save(self):
+        log.info(f"Saving {len(self.ring)} frames to {self.output_path}")
+        return self.ring.save(self.output_path)
+
+    def close(self):
+        if len(self.ring) > 0:
+            self.save().join()
+
+    def __call__(self, frame: Frame) -> Frame:
+        pixels = frame.pixels if self.pixel_format is None else frame.convert(self.pixel_format)
+        self.ring.append(pixels)
+        return frame
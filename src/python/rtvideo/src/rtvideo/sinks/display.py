@@ -1,23 +1,66 @@
-from rtvideo.common.structs import Frame, FrameProcessor
+from collections import deque
+import logging
+import threading
+import time
+from typing import Optional
+
+from rtvideo.common.structs import Frame, MainThreadRenderer
 
 import cv2
 
-class DisplaySink(FrameProcessor):
+log = logging.getLogger(__name__)
+
+class DisplaySink(MainThreadRenderer):
+    """
+    Shows frames in an OpenCV window. The pipeline only drops each frame into a latest-value slot, and the main
+    thread draws whatever is newest at the display's own pace, so a slow window never holds up the pipeline.
+    """
+    latest: Optional[Frame]
+
     def __init__(self, window_name: str):
         self.window_name = window_name
+        self.condition = threading.Condition()
+        self.latest = None
+        self.received_frames = 0
+        self.displayed_frames = 0
+        self.display_timestamps = deque(maxlen=1000)
 
     def __str__(self) -> str:
         return f"DisplaySink(window_name={self.window_name})"
 
+    @property
+    def display_fps(self) -> float:
+        now = time.time()
+        return len([ts for ts in self.display_timestamps if ts > now - 1])
+
     def close(self):
-        cv2.destroyAllWindows()
+        log.info(f"Displayed {self.displayed_frames} of {self.received_frames} frames")
 
-    def __call__(self, frame: Frame):
-        # Display the frame.
-        cv2.imshow(self.window_name, frame.as_bgr())
-        # Quit if the user has pressed 'q'
+    def render(self, timeout: float) -> None:
+        with self.condition:
+            if self.latest is None:
+                self.condition.wait(timeout)
+            frame, self.latest = self.latest, None
+
+        if frame is not None:
+            cv2.imshow(self.window_name, frame.as_bgr())
+            self.displayed_frames += 1
+            now = time.time()
+            if self.stats is not None:
+                self.stats.record(frame, self.window_name, now)
+            self.display_timestamps.append(now)
+            log.debug(f"Display FPS: {self.display_fps:.2f}")
+
+        # Pumps the window's events even when there's no new frame. Quit if the user has pressed 'q'.
         if cv2.waitKey(1) & 0xFF == ord('q'):
             raise KeyboardInterrupt
-        return frame
 
-    
\ No newline at end of file
+    def stop_rendering(self) -> None:
+        cv2.destroyAllWindows()
+
+    def __call__(self, frame: Frame):
+        with self.condition:
+            self.latest = frame
+            self.received_frames += 1
+            self.condition.notify()
+        return frame
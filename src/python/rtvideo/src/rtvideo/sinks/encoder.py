@@ -0,0 +1,321 @@
+from dataclasses import dataclass, replace
+import functools
+import logging
+import os
+import queue
+import subprocess as sp
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from rtvideo.common.structs import Frame, PixelFormat
+
+log = logging.getLogger(__name__)
+
+FFMPEG_PIXEL_FORMATS = {
+    PixelFormat.BGR_uint8: 'bgr24',
+    PixelFormat.RGB_uint8: 'rgb24',
+    PixelFormat.BGRA_uint8: 'bgra',
+    PixelFormat.RGBA_uint8: 'rgba',
+    PixelFormat.YUYV422_uint8: 'yuyv422',
+    PixelFormat.NV12_uint8: 'nv12',
+    PixelFormat.I420_uint8: 'yuv420p',
+}
+
+# Tried in order when the codec is 'auto'. Hardware encoders leave the CPU cores to inference.
+AUTO_CODECS = ('h264_nvenc', 'h264_qsv', 'libx264')
+
+# How often a full queue is checked for a writer that died, so it can't block forever.
+WRITER_POLL_INTERVAL = 0.5
+
+# NVENC has its own preset and tune names, the x264 ones are translated so configs stay portable.
+NVENC_PRESETS = {
+    'ultrafast': 'p1',
+    'superfast': 'p1',
+    'veryfast': 'p2',
+    'faster': 'p3',
+    'fast': 'p3',
+    'medium': 'p4',
+    'slow': 'p5',
+    'slower': 'p6',
+    'veryslow': 'p7',
+}
+NVENC_TUNES = {'zerolatency': 'ull', 'film': 'hq'}
+
+
+@functools.lru_cache(maxsize=None)
+def is_codec_available(codec: str) -> bool:
+    """
+    Whether ffmpeg can actually encode with `codec`. Hardware encoders are often compiled in without the
+    hardware being present, so this encodes a single test frame rather than just checking `ffmpeg -encoders`.
+    """
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'color=size=256x256:rate=1',
+        '-frames:v', '1', '-c:v', codec, '-f', 'null', '-',
+    ]
+    try:
+        return sp.run(command, stdout=sp.DEVNULL, stderr=sp.DEVNULL, timeout=10).returncode == 0
+    except (OSError, sp.TimeoutExpired):
+        return False
+
+
+def select_codec(candidates=AUTO_CODECS) -> str:
+    for codec in candidates:
+        if is_codec_available(codec):
+            return codec
+    raise RuntimeError(f"None of the encoders {list(candidates)} are available in ffmpeg")
+
+
+@dataclass
+class EncoderConfig:
+    """
+    How ffmpeg encodes video. Presets and tunes use the x264 names and are translated for other encoders.
+    """
+    # An ffmpeg encoder name, or 'auto' for the first available of AUTO_CODECS.
+    codec: str = 'libx264'
+    preset: Optional[str] = 'veryfast'
+    tune: Optional[str] = None
+    # Encoder threads, None leaves it to ffmpeg (which uses every core).
+    threads: Optional[int] = None
+    # CPUs the ffmpeg process may run on, e.g. [6, 7] to keep encoding off the cores running inference.
+    cpu_affinity: Optional[List[int]] = None
+    # Keyframe interval in frames, None leaves it to the encoder.
+    gop: Optional[int] = None
+    crf: Optional[int] = None
+    bitrate: Optional[str] = None
+    output_pix_fmt: str = 'yuv420p'
+
+    @staticmethod
+    def of(config: Union['EncoderConfig', Dict[str, Any], None]) -> 'EncoderConfig':
+        """
+        Accepts a config, the dict form used in pipeline specs, or None for the defaults.
+        """
+        if config is None:
+            return EncoderConfig()
+        if isinstance(config, dict):
+            return EncoderConfig(**config)
+        return config
+
+    def resolved_codec(self) -> str:
+        return select_codec() if self.codec == 'auto' else self.codec
+
+    def codec_args(self, codec: str) -> List[str]:
+        args = ['-c:v', codec, '-pix_fmt', self.output_pix_fmt]
+
+        preset, tune = self.preset, self.tune
+        if codec.endswith('_nvenc'):
+            preset = NVENC_PRESETS.get(preset, preset)
+            tune = NVENC_TUNES.get(tune, tune)
+        elif codec.endswith('_qsv'):
+            # QSV has no tunes, low_delay_brc is the closest thing to zerolatency.
+            if tune == 'zerolatency':
+                args += ['-low_delay_brc', '1']
+            tune = None
+
+        if preset is not None:
+            args += ['-preset', preset]
+        if tune is not None:
+            args += ['-tune', tune]
+        if self.threads is not None:
+            args += ['-threads', str(self.threads)]
+        if self.gop is not None:
+            # A fixed GOP, so segments cut on predictable boundaries.
+            args += ['-g', str(self.gop), '-keyint_min', str(self.gop), '-sc_threshold', '0']
+        if self.crf is not None:
+            args += ['-crf', str(self.crf)]
+        if self.bitrate is not None:
+            args += ['-b:v', self.bitrate]
+        return args
+
+    def preexec_fn(self):
+        if self.cpu_affinity is None:
+            return None
+        if not hasattr(os, 'sched_setaffinity'):
+            log.warn("CPU affinity isn't supported on this platform, ignoring it")
+            return None
+
+        cpus = set(self.cpu_affinity)
+        # Runs in the child between fork and exec, so only ffmpeg is pinned.
+        return lambda: os.sched_setaffinity(0, cpus)
+
+
+def build_ffmpeg_command(
+    width: int,
+    height: int,
+    pix_fmt: str,
+    fps: int,
+    codec_args: List[str],
+    output_args: List[str],
+) -> List[str]:
+    """
+    Encodes raw frames read from stdin.
+    """
+    return [
+        'ffmpeg',
+        '-hide_banner',
+        '-y',  # Overwrite output files without asking
+        '-f', 'rawvideo',  # Input format
+        '-vcodec', 'rawvideo',  # Input codec
+        '-pix_fmt', pix_fmt,  # Input pixel format
+        '-s', f'{width}x{height}',  # Input resolution
+        '-framerate', str(fps),  # Frames arrive live, so no -re throttling
+        '-i', '-',  # Input comes from a pipe
+        *codec_args,
+        *output_args,
+    ]
+
+
+class FfmpegEncoder:
+    """
+    An ffmpeg process fed raw frames through stdin. The process starts on the first frame so its resolution and
+    pixel format match what the pipeline actually produces, and frames are written from a separate thread through
+    a bounded queue. With `drop_frames` a stalled encoder drops the oldest queued frame instead of backing up the
+    pipeline, otherwise `write` blocks until there's room. Once ffmpeg dies, `write` raises instead of queueing.
+    """
+    process: Optional[sp.Popen]
+    writer: Optional[threading.Thread]
+
+    def __init__(
+        self,
+        output_args: List[str],
+        config: Union[EncoderConfig, Dict[str, Any], None] = None,
+        fps: int = 30,
+        pixel_format: Optional[PixelFormat] = None,
+        queue_size: int = 2,
+        drop_frames: bool = True,
+        name: str = 'encoder',
+    ):
+        if pixel_format is not None and pixel_format not in FFMPEG_PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format for ffmpeg: {pixel_format}")
+
+        self.output_args = output_args
+        self.config = EncoderConfig.of(config)
+        self.fps = fps
+        # Frames already in this format (e.g. YUV straight from the camera) are piped to ffmpeg without conversion.
+        # Defaults to the format of the first frame.
+        self.pixel_format = pixel_format
+        self.drop_frames = drop_frames
+        self.name = name
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.process = None
+        self.writer = None
+        self.size = None
+        self.dropped_frames = 0
+        # Why the writer stopped early, e.g. ffmpeg exited on a bad codec or a full disk.
+        self.error: Optional[Exception] = None
+
+    def __str__(self) -> str:
+        return f"FfmpegEncoder(name={self.name}, codec={self.config.codec})"
+
+    def budget_threads(self, threads: Optional[int]):
+        """
+        Encodes on `threads` threads unless the config sets its own, see CpuBudget.
+        """
+        if threads is not None and self.config.threads is None:
+            self.config = replace(self.config, threads=threads)
+
+    def start(self, frame: Frame):
+        if self.pixel_format is None:
+            self.pixel_format = frame.pixel_format if frame.pixel_format in FFMPEG_PIXEL_FORMATS else PixelFormat.BGR_uint8
+        self.size = (frame.width, frame.height)
+
+        command = build_ffmpeg_command(
+            frame.width,
+            frame.height,
+            FFMPEG_PIXEL_FORMATS[self.pixel_format],
+            self.fps,
+            self.config.codec_args(self.config.resolved_codec()),
+            self.output_args,
+        )
+        log.info(f"Starting {self.name}: {' '.join(command)}")
+        self.process = sp.Popen(command, stdin=sp.PIPE, preexec_fn=self.config.preexec_fn())
+        self.writer = threading.Thread(target=self._write_frames, name=f"{self.name}.writer", daemon=True)
+        self.writer.start()
+
+    def _write_frames(self):
+        while True:
+            pixels = self.frames.get()
+            if pixels is None:
+                return
+
+            try:
+                # Large writes skip the pipe's buffer, so the frame goes to ffmpeg without an intermediate copy.
+                self.process.stdin.write(pixels.data)
+            except (OSError, ValueError) as e:
+                log.error(f"{self.name} pipe closed: {e}")
+                self.error = e
+                return
+
+    def _check_writer(self):
+        if self.error is not None or not self.writer.is_alive():
+            raise RuntimeError(f"{self.name} stopped writing to ffmpeg: {self.error}")
+
+    def _put(self, item, deadline: Optional[float] = None) -> bool:
+        # Waits for room while the writer is alive, returning False once it's gone and nothing will make room, or
+        # at `deadline` (time.monotonic()).
+        while True:
+            try:
+                self.frames.put(item, timeout=WRITER_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if not self.writer.is_alive() or (deadline is not None and time.monotonic() >= deadline):
+                    return False
+
+    def write(self, frame: Frame):
+        if self.process is None:
+            self.start(frame)
+        if (frame.width, frame.height) != self.size:
+            raise ValueError(f"Frame size changed from {self.size} to {(frame.width, frame.height)}")
+        self._check_writer()
+
+        pixels = np.ascontiguousarray(frame.convert(self.pixel_format))
+        if not self.drop_frames:
+            if not self._put(pixels):
+                self._check_writer()
+            return
+
+        try:
+            self.frames.put_nowait(pixels)
+        except queue.Full:
+            # Keep the freshest frame, the encoder is behind anyway.
+            try:
+                self.frames.get_nowait()
+                self.dropped_frames += 1
+                log.warn(f"Dropping frame, {self.name} is falling behind")
+            except queue.Empty:
+                pass
+            self.frames.put_nowait(pixels)
+
+    def close(self, timeout: float = 10.0):
+        """
+        Flushes the queued frames and waits up to `timeout` seconds in all for ffmpeg to finish, killing it after.
+        """
+        deadline = time.monotonic() + timeout
+        if self.writer is not None:
+            # The writer exits once it sees the sentinel, after flushing what's already queued. A writer that
+            # already died can't take it.
+            self._put(None, deadline)
+            self.writer.join(timeout=max(0.0, deadline - time.monotonic()))
+            if self.writer.is_alive():
+                # Blocked writing to an ffmpeg that stopped reading, killing it breaks the pipe and frees the writer.
+                log.error(f"{self.name} stopped taking frames, killing it")
+                self.process.kill()
+                self.writer.join()
+            self.writer = None
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                # ffmpeg already exited, what was left in the pipe's buffer is lost.
+                pass
+            try:
+                # Closing stdin lets ffmpeg flush the last frames and finalize the output.
+                self.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except sp.TimeoutExpired:
+                log.error(f"{self.name} didn't exit after its input closed, killing it")
+                self.process.kill()
+                self.process.wait()
+            self.process = None
@@ -1,38 +1,44 @@
-import subprocess as sp
-import cv2
-
-from rtvideo.common.structs import Frame
-
-# Define the FFmpeg command. This example encodes the video to H.264, segments it for HLS,
-# and saves the output to the 'output' directory.
-
-ffmpeg_raw_video_input = [
-    '-f', 'rawvideo',  # Input format
-    '-vcodec', 'rawvideo',  # Input codec
-    '-pix_fmt', 'bgr24',  # Input pixel format
-    '-s', '1920x1080',  # Input resolution
-    '-re',  # Read input at native, variable frame rate
-    '-i', '-',  # Input comes from a pipe
-]
-
-ffmpeg_hls_output = [
-    '-c:v', 'libx264',  # Output codec
-    '-pix_fmt', 'yuv420p',  # Output pixel format
-    '-preset', 'veryfast',  # Encoding speed/quality trade-off
-    '-g', '15', # Keyframe interval
-    '-f', 'hls',  # Output format
-    '-flush_packets', '1', # Flush frames immediately
-    '-hls_time', '1',  # Segment length in seconds
-    '-hls_playlist_type', 'event',  # Playlist type
-    'output/stream.m3u8'  # Output HLS playlist and segments
-]
-
-ffmpeg_command = [
-    'ffmpeg',
-    '-y',  # Overwrite output files without asking
-    *ffmpeg_raw_video_input,
-    *ffmpeg_hls_output
-]
+import dataclasses
+import os
+from typing import Any, Dict, List, Optional, Union
+
+from rtvideo.common.structs import Frame, FrameProcessor, PixelFormat
+from rtvideo.sinks.encoder import EncoderConfig, FfmpegEncoder
+from rtvideo.sinks.hls_server import PLAYLIST_NAME, SEGMENT_EXTENSIONS, HlsServer
+
+
+def hls_output_args(
+    output_url: str,
+    segment_time: float,
+    segment_type: str = 'mpegts',
+    low_latency: bool = False,
+    list_size: Optional[int] = None,
+) -> List[str]:
+    """
+    Segments the encoded stream into an HLS playlist and uploads it to `output_url` with HTTP PUT.
+    Without a `list_size` the playlist keeps every segment (an event playlist).
+    """
+    if low_latency:
+        playlist_args = [
+            '-hls_list_size', str(list_size or 6),  # Short sliding window so players join at the live edge
+            '-hls_flags', 'independent_segments+delete_segments+program_date_time',
+        ]
+    elif list_size is not None:
+        playlist_args = ['-hls_list_size', str(list_size), '-hls_flags', 'independent_segments']
+    else:
+        playlist_args = ['-hls_playlist_type', 'event']
+
+    return [
+        *playlist_args,
+        '-f', 'hls',  # Output format
+        '-flush_packets', '1',  # Flush frames immediately
+        '-hls_time', str(segment_time),  # Segment length in seconds
+        '-hls_segment_type', segment_type,  # mpegts or fmp4 (CMAF) segments
+        '-method', 'PUT',  # Upload the playlist and segments to the server
+        '-http_persistent', '1',  # Reuse one connection for every upload
+        output_url,  # Output HLS playlist URL
+    ]
+
 
 HTML_PLAYER = """
 <!DOCTYPE html>
@@ -93,29 +99,72 @@ HTML_PLAYER = """
 </html>
 """
 
-class HlsSink:
-    def __init__(self, output_dir: str):
+class HlsSink(FrameProcessor):
+    """
+    Encodes frames to HLS with a persistent ffmpeg process, see FfmpegEncoder, and serves the stream at
+    http://<host>:<port>/ with HlsServer. A stalled encoder drops frames instead of backing up the pipeline.
+
+    Segments are served from memory. With `output_dir` segments that fall out of memory are written there and
+    the playlist keeps the whole stream, otherwise the playlist is a sliding window over the in-memory segments.
+    """
+    def __init__(
+        self,
+        output_dir: Optional[str] = None,
+        port: int = 8888,
+        host: str = '0.0.0.0',
+        max_segments: int = 12,
+        encoder: Union[EncoderConfig, Dict[str, Any], None] = None,
+        pixel_format: Optional[PixelFormat] = None,
+        fps: int = 30,
+        segment_time: float = 1.0,
+        segment_type: str = 'mpegts',
+        low_latency: bool = False,
+        queue_size: int = 2,
+    ):
+        if segment_type not in ('mpegts', 'fmp4'):
+            raise ValueError(f"Unsupported HLS segment type: {segment_type}")
+
+        config = EncoderConfig.of(encoder)
+        if config.gop is None:
+            # One keyframe per segment so every segment can start playback.
+            config = dataclasses.replace(config, gop=max(1, int(fps * segment_time)))
+        if low_latency and config.tune is None:
+            # No lookahead or B-frames, frames leave the encoder immediately.
+            config = dataclasses.replace(config, tune='zerolatency')
+
         self.output_dir = output_dir
+        self.port = port
+        self.low_latency = low_latency
+        self.server = HlsServer(host, port, max_segments=max_segments, spill_dir=output_dir, index_html=HTML_PLAYER)
+        # Half the ring, so players holding a slightly stale playlist can still fetch every segment in it.
+        list_size = None if output_dir is not None and not low_latency else max(1, max_segments // 2)
+        self.encoder = FfmpegEncoder(
+            hls_output_args(f'http://127.0.0.1:{port}/{PLAYLIST_NAME}', segment_time, segment_type, low_latency, list_size),
+            config,
+            fps=fps,
+            pixel_format=pixel_format,
+            queue_size=queue_size,
+            name='hls encoder',
+        )
 
     def __str__(self) -> str:
-        return f"HlsSink(output_dir={self.output_dir})"
+        return f"HlsSink(port={self.port}, low_latency={self.low_latency})"
     
     def open(self):
-        sp.run(['rm', '-rf', self.output_dir])
-        sp.run(['mkdir', '-p', self.output_dir])
-        with open(f'{self.output_dir}/index.html', 'w') as f:
-            f.write(HTML_PLAYER)
-        ffmpeg_command[-1] = f'{self.output_dir}/stream.m3u8'
-        self.ffmpeg = sp.Popen(ffmpeg_command, stdin=sp.PIPE)
-        self.hls_server = sp.Popen(['python', '-m', 'http.server', '8888'], cwd=self.output_dir)
+        self.encoder.budget_threads(self.cpu_threads)
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            # Segments from a previous run would otherwise be served under the new stream's names.
+            for name in os.listdir(self.output_dir):
+                if name.endswith(SEGMENT_EXTENSIONS):
+                    os.remove(os.path.join(self.output_dir, name))
+        self.server.start()
 
     def close(self):
-        self.hls_server.terminate()
-        self.ffmpeg.stdin.close()
-        self.hls_server.wait()
-        self.ffmpeg.wait()
+        # The encoder goes first so its final uploads still reach the server.
+        self.encoder.close()
+        self.server.stop()
 
     def __call__(self, frame: Frame) -> Frame:
-        self.ffmpeg.stdin.write(frame.as_bgr().tobytes())
-        self.ffmpeg.stdin.flush()
-        return frame
\ No newline at end of file
+        self.encoder.write(frame)
+        return frame
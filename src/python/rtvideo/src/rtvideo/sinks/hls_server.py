@@ -0,0 +1,180 @@
+import asyncio
+from collections import OrderedDict
+import logging
+import os
+import re
+from typing import Dict, Optional
+
+from rtvideo.sinks.http import HttpError, HttpRequest, HttpResponse, HttpServer
+
+log = logging.getLogger(__name__)
+
+PLAYLIST_NAME = 'stream.m3u8'
+SEGMENT_EXTENSIONS = ('.ts', '.m4s')
+
+CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.html': 'text/html',
+}
+
+# Only plain file names, so requests can never reach outside the spill directory.
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+class HlsServer(HttpServer):
+    """
+    Serves an HLS stream that ffmpeg uploads with `-method PUT`. The playlist and the most recent `max_segments`
+    segments are kept in memory, so viewers never touch the disk. Older segments are written to `spill_dir`
+    when it's set and served from there, otherwise they're dropped. Only loopback clients may upload.
+
+    Playlist requests with `_HLS_msn=N` block until segment N is in the playlist (LL-HLS blocking reload), so
+    players pick up new segments as soon as they exist instead of polling.
+    """
+    def __init__(
+        self,
+        host: str = '0.0.0.0',
+        port: int = 8888,
+        max_segments: int = 12,
+        spill_dir: Optional[str] = None,
+        index_html: Optional[str] = None,
+    ):
+        super().__init__(host, port)
+        self.max_segments = max_segments
+        self.spill_dir = spill_dir
+        self.index_html = index_html
+        self.playlist: Optional[bytes] = None
+        # Media sequence number of the last segment in the playlist, -1 until there is one.
+        self.last_sequence = -1
+        self.target_duration = 1.0
+        self.segments: 'OrderedDict[str, bytes]' = OrderedDict()
+        # Init segments and anything else that isn't a media segment, never evicted.
+        self.files: Dict[str, bytes] = {}
+        self.playlist_updated = asyncio.Condition()
+
+    async def handle(self, request: HttpRequest) -> HttpResponse:
+        name = request.path.lstrip('/') or 'index.html'
+        if not NAME_PATTERN.match(name) or name.startswith('.'):
+            raise HttpError(404)
+
+        if request.method in ('PUT', 'POST', 'DELETE'):
+            if not request.is_loopback:
+                raise HttpError(403)
+            if request.method == 'DELETE':
+                self._delete(name)
+                return HttpResponse(204)
+            await self._store(name, request.body)
+            return HttpResponse(201)
+
+        if request.method not in ('GET', 'HEAD'):
+            raise HttpError(405)
+
+        if name == 'index.html' and self.index_html is not None:
+            return HttpResponse(body=self.index_html.encode(), content_type=CONTENT_TYPES['.html'])
+        if name.endswith('.m3u8'):
+            return await self._get_playlist(request)
+        return await self._get_file(name)
+
+    async def _store(self, name: str, body: bytes):
+        if name.endswith('.m3u8'):
+            self.playlist = self._add_server_control(body)
+            async with self.playlist_updated:
+                self.playlist_updated.notify_all()
+            return
+
+        if not name.endswith(SEGMENT_EXTENSIONS):
+            self.files[name] = body
+            return
+
+        self.segments[name] = body
+        self.segments.move_to_end(name)
+        while len(self.segments) > self.max_segments:
+            evicted_name, evicted = self.segments.popitem(last=False)
+            if self.spill_dir is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self._spill, evicted_name, evicted)
+
+    def _add_server_control(self, playlist: bytes) -> bytes:
+        """
+        Tracks the newest media sequence number and advertises blocking reloads to players.
+        """
+        text = playlist.decode()
+        lines = text.splitlines()
+        media_sequence = 0
+        segment_count = 0
+        for line in lines:
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                media_sequence = int(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-TARGETDURATION:'):
+                self.target_duration = max(1.0, float(line.split(':', 1)[1]))
+            elif line and not line.startswith('#'):
+                segment_count += 1
+        self.last_sequence = media_sequence + segment_count - 1
+
+        if '#EXT-X-SERVER-CONTROL' in text:
+            return playlist
+        output = []
+        for line in lines:
+            output.append(line)
+            if line.startswith('#EXT-X-TARGETDURATION:'):
+                output.append('#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES')
+        return ('\n'.join(output) + '\n').encode()
+
+    def _delete(self, name: str):
+        self.segments.pop(name, None)
+        self.files.pop(name, None)
+        if self.spill_dir is not None and os.path.exists(os.path.join(self.spill_dir, name)):
+            os.remove(os.path.join(self.spill_dir, name))
+
+    def _spill(self, name: str, body: bytes):
+        with open(os.path.join(self.spill_dir, name), 'wb') as f:
+            f.write(body)
+
+    def _read_spilled(self, name: str) -> Optional[bytes]:
+        path = os.path.join(self.spill_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def _get_playlist(self, request: HttpRequest) -> HttpResponse:
+        if '_HLS_msn' in request.query:
+            try:
+                sequence = int(request.query['_HLS_msn'])
+            except ValueError:
+                raise HttpError(400, "_HLS_msn must be an integer")
+            # Per the LL-HLS spec, requests too far ahead of the live edge are rejected rather than held.
+            if self.playlist is not None and sequence > self.last_sequence + 2:
+                raise HttpError(400, f"_HLS_msn {sequence} is too far ahead of {self.last_sequence}")
+
+            try:
+                async with self.playlist_updated:
+                    await asyncio.wait_for(
+                        self.playlist_updated.wait_for(lambda: self.last_sequence >= sequence),
+                        timeout=self.target_duration * 3,
+                    )
+            except asyncio.TimeoutError:
+                raise HttpError(503, "Timed out waiting for the requested segment")
+
+        if self.playlist is None:
+            raise HttpError(404)
+        return HttpResponse(
+            body=self.playlist,
+            content_type=CONTENT_TYPES['.m3u8'],
+            headers={'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        )
+
+    async def _get_file(self, name: str) -> HttpResponse:
+        body = self.segments.get(name) or self.files.get(name)
+        if body is None and self.spill_dir is not None:
+            body = await asyncio.get_running_loop().run_in_executor(None, self._read_spilled, name)
+        if body is None:
+            raise HttpError(404)
+
+        return HttpResponse(
+            body=body,
+            content_type=CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'),
+            # Segments never change once written.
+            headers={'Cache-Control': 'max-age=3600', 'Access-Control-Allow-Origin': '*'},
+        )
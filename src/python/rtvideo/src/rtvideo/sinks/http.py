@@ -0,0 +1,308 @@
+import asyncio
+import base64
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import struct
+import threading
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+log = logging.getLogger(__name__)
+
+STATUS_TEXT = {
+    200: 'OK',
+    201: 'Created',
+    204: 'No Content',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WEBSOCKET_TEXT = 0x1
+WEBSOCKET_BINARY = 0x2
+WEBSOCKET_CLOSE = 0x8
+WEBSOCKET_PING = 0x9
+WEBSOCKET_PONG = 0xA
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str = ''):
+        super().__init__(message or STATUS_TEXT.get(status, ''))
+        self.status = status
+
+
+@dataclass
+class HttpRequest:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+    client: str
+
+    @property
+    def is_loopback(self) -> bool:
+        return self.client in LOOPBACK_ADDRESSES
+
+
+@dataclass
+class HttpResponse:
+    status: int = 200
+    body: bytes = b''
+    content_type: str = 'text/plain'
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+class HttpStream:
+    """
+    Returned by `handle` to take over the connection instead of sending a single response, for WebSockets and
+    long-lived streams. The connection is closed once `run` returns.
+    """
+    async def run(self, request: HttpRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        raise NotImplementedError()
+
+
+def websocket_handshake(request: HttpRequest) -> bytes:
+    """
+    The 101 response that upgrades `request` to a WebSocket.
+    """
+    key = request.headers.get('sec-websocket-key')
+    if request.headers.get('upgrade', '').lower() != 'websocket' or key is None:
+        raise HttpError(400, "Expected a WebSocket upgrade")
+
+    accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+    return (
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+    ).encode('latin-1')
+
+
+def encode_websocket_frame(opcode: int, payload: bytes) -> bytes:
+    """
+    A single unmasked, unfragmented frame, which is what servers send.
+    """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_websocket_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """
+    Reads one frame from a client, returning (opcode, unmasked payload). Fragments are returned as they come.
+    """
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return opcode, payload
+
+
+class HttpServer:
+    """
+    A small HTTP/1.1 server running an asyncio event loop on a background thread, so sinks can serve viewers
+    without blocking the pipeline. Connections are kept alive and request bodies may be chunked, which is how
+    ffmpeg uploads with `-method PUT`. Subclasses implement `handle`, which runs on the server's event loop and
+    returns either a response or an HttpStream that takes over the connection.
+    """
+    loop: Optional[asyncio.AbstractEventLoop]
+    thread: Optional[threading.Thread]
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8888, max_body_size: int = 64 * 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.loop = None
+        self.thread = None
+
+    def __str__(self) -> str:
+        return f"{type(self).__name__}(host={self.host}, port={self.port})"
+
+    async def handle(self, request: HttpRequest) -> Union[HttpResponse, HttpStream]:
+        raise NotImplementedError()
+
+    def start(self):
+        started = threading.Event()
+        errors = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                server = loop.run_until_complete(asyncio.start_server(self._serve_connection, self.host, self.port))
+            except OSError as e:
+                errors.append(e)
+                started.set()
+                loop.close()
+                return
+
+            self.loop = loop
+            started.set()
+            try:
+                loop.run_forever()
+            finally:
+                server.close()
+                # Requests parked on a blocking reload or a stream never finish on their own.
+                tasks = asyncio.all_tasks(loop)
+                for task in tasks:
+                    task.cancel()
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+                loop.close()
+
+        self.thread = threading.Thread(target=run, name=str(self), daemon=True)
+        self.thread.start()
+        started.wait()
+        if errors:
+            self.thread = None
+            raise RuntimeError(f"Could not start {self}: {errors[0]}")
+        log.info(f"{self} listening")
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.thread = None
+        self.loop = None
+
+    def call_soon(self, callback, *args):
+        """
+        Runs `callback` on the server's event loop, for handing it data from pipeline threads.
+        """
+        loop = self.loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The server stopped in the meantime, there's no one left to hand it to.
+            pass
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = writer.get_extra_info('peername')[0]
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader, client)
+                except HttpError as e:
+                    await self._write_response(writer, 'GET', HttpResponse(e.status, str(e).encode()), keep_alive=False)
+                    return
+                if request is None:
+                    return
+
+                try:
+                    response = await self.handle(request)
+                except HttpError as e:
+                    response = HttpResponse(e.status, str(e).encode())
+                except Exception as e:
+                    log.error(f"Error handling {request.method} {request.path}: {e}")
+                    response = HttpResponse(500, b'Internal Server Error')
+
+                if isinstance(response, HttpStream):
+                    await response.run(request, reader, writer)
+                    return
+
+                keep_alive = request.headers.get('connection', '').lower() != 'close'
+                await self._write_response(writer, request.method, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # The server is stopping. This is the connection's top-level task, so ending it quietly is safe and
+            # avoids asyncio logging the cancellation as an error.
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader, client: str) -> Optional[HttpRequest]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HttpError(400, f"Malformed request line: {request_line!r}")
+        method, target, _ = parts
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked_body(reader)
+        else:
+            try:
+                length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise HttpError(400, f"Malformed Content-Length: {headers['content-length']!r}")
+            if length < 0:
+                raise HttpError(400, f"Negative Content-Length: {length}")
+            if length > self.max_body_size:
+                raise HttpError(413)
+            body = await reader.readexactly(length) if length else b''
+
+        url = urlsplit(target)
+        return HttpRequest(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body, client)
+
+    async def _read_chunked_body(self, reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        size = 0
+        while True:
+            line = await reader.readline()
+            try:
+                chunk_size = int(line.split(b';')[0].strip() or b'0', 16)
+            except ValueError:
+                raise HttpError(400, f"Malformed chunk size: {line!r}")
+            if chunk_size < 0:
+                raise HttpError(400, f"Negative chunk size: {line!r}")
+            if chunk_size == 0:
+                # Skip any trailers up to the blank line that ends the body.
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+
+            size += chunk_size
+            if size > self.max_body_size:
+                raise HttpError(413)
+            chunks.append(await reader.readexactly(chunk_size))
+            await reader.readline()
+
+    async def _write_response(self, writer: asyncio.StreamWriter, method: str, response: HttpResponse, keep_alive: bool):
+        headers = {
+            'Content-Type': response.content_type,
+            'Content-Length': str(len(response.body)),
+            'Connection': 'keep-alive' if keep_alive else 'close',
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, '')}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(response.body)
+        await writer.drain()
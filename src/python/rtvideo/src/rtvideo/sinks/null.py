@@ -0,0 +1,18 @@
+from rtvideo.common.structs import Frame, FrameProcessor
+
+
+class NullSink(FrameProcessor):
+    """
+    Discards frames, counting them. Used to run pipelines headless for benchmarking.
+    """
+    frame_count: int
+
+    def __init__(self):
+        self.frame_count = 0
+
+    def __str__(self) -> str:
+        return "NullSink()"
+
+    def __call__(self, frame: Frame) -> Frame:
+        self.frame_count += 1
+        return frame
@@ -0,0 +1,374 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Set
+
+import cv2
+
+from rtvideo.common.structs import Frame, FrameProcessor, PixelFormat
+from rtvideo.sinks.http import (
+    WEBSOCKET_BINARY,
+    WEBSOCKET_CLOSE,
+    WEBSOCKET_PING,
+    WEBSOCKET_PONG,
+    HttpError,
+    HttpRequest,
+    HttpResponse,
+    HttpServer,
+    HttpStream,
+    encode_websocket_frame,
+    read_websocket_frame,
+    websocket_handshake,
+)
+
+log = logging.getLogger(__name__)
+
+# Raw WebSocket frames start with the image's width, height and channels, followed by the BGR pixels.
+RAW_HEADER = struct.Struct('<III')
+MJPEG_BOUNDARY = 'frame'
+# Frames queued in the kernel are frames a slow viewer sees late, so keep the socket buffer to a few frames.
+SEND_BUFFER_SIZE = 256 * 1024
+
+PREVIEW_HTML = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="UTF-8">
+<title>Preview</title>
+<style>
+  body {
+    margin: 0;
+    height: 100vh;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    background-color: black;
+  }
+  canvas {
+    max-width: 100%;
+    max-height: 100%;
+  }
+</style>
+</head>
+<body>
+
+<canvas id="preview"></canvas> <!-- /stream.mjpeg also works directly in an <img> -->
+
+<script>
+  var canvas = document.getElementById('preview');
+  var context = canvas.getContext('2d');
+
+  function connect() {
+    var socket = new WebSocket(`ws://${location.host}/ws`);
+    socket.binaryType = 'blob';
+    socket.onmessage = async (event) => {
+      var image = await createImageBitmap(event.data);
+      canvas.width = image.width;
+      canvas.height = image.height;
+      context.drawImage(image, 0, 0);
+      image.close();
+    };
+    socket.onclose = () => setTimeout(connect, 1000);
+  }
+
+  document.addEventListener('DOMContentLoaded', connect);
+</script>
+
+</body>
+</html>
+"""
+
+
+class PreviewClient:
+    """
+    One viewer's slot for the latest frame. A newer frame replaces one that hasn't been sent yet, so a slow
+    viewer skips frames instead of queueing them.
+    """
+    def __init__(self, raw: bool):
+        self.raw = raw
+        self.latest: Optional[bytes] = None
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, payload: bytes):
+        if self.latest is not None:
+            self.dropped += 1
+        self.latest = payload
+        self.ready.set()
+
+    async def next(self) -> bytes:
+        await self.ready.wait()
+        self.ready.clear()
+        payload, self.latest = self.latest, None
+        self.sent += 1
+        return payload
+
+
+def limit_send_buffer(writer: asyncio.StreamWriter):
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+
+
+class MjpegStream(HttpStream):
+    def __init__(self, server: 'PreviewServer'):
+        self.server = server
+
+    async def run(self, request: HttpRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        limit_send_buffer(writer)
+        client = self.server.subscribe(raw=False)
+        try:
+            writer.write((
+                "HTTP/1.1 200 OK\r\n"
+                f"Content-Type: multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}\r\n"
+                "Cache-Control: no-cache\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode('latin-1'))
+            while True:
+                jpeg = await client.next()
+                writer.write(
+                    f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode('latin-1')
+                )
+                writer.write(jpeg)
+                writer.write(b'\r\n')
+                # Only this viewer waits here, the pipeline keeps replacing its slot in the meantime.
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.server.unsubscribe(client)
+
+
+class WebSocketStream(HttpStream):
+    def __init__(self, server: 'PreviewServer'):
+        self.server = server
+
+    async def run(self, request: HttpRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.write(websocket_handshake(request))
+        limit_send_buffer(writer)
+        client = self.server.subscribe(raw=request.query.get('format') == 'raw')
+        closed = asyncio.ensure_future(self._read_until_closed(reader, writer))
+        try:
+            while True:
+                next_payload = asyncio.ensure_future(client.next())
+                await asyncio.wait({next_payload, closed}, return_when=asyncio.FIRST_COMPLETED)
+                if closed.done():
+                    next_payload.cancel()
+                    return
+
+                writer.write(encode_websocket_frame(WEBSOCKET_BINARY, next_payload.result()))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            closed.cancel()
+            self.server.unsubscribe(client)
+
+    async def _read_until_closed(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Viewers only ever send control frames, but they still have to be read to notice a close.
+        """
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == WEBSOCKET_CLOSE:
+                    writer.write(encode_websocket_frame(WEBSOCKET_CLOSE, payload[:2]))
+                    return
+                if opcode == WEBSOCKET_PING:
+                    writer.write(encode_websocket_frame(WEBSOCKET_PONG, payload))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+
+
+class PreviewServer(HttpServer):
+    """
+    Serves the preview page at /, WebSocket frames at /ws (JPEG, or raw BGR with ?format=raw) and multipart
+    MJPEG at /stream.mjpeg.
+    """
+    clients: Set[PreviewClient]
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8890):
+        super().__init__(host, port)
+        self.clients = set()
+        # Read from pipeline threads to decide what to encode, so kept as plain counters.
+        self.jpeg_clients = 0
+        self.raw_clients = 0
+        self.offered = 0
+        self.dropped = 0
+        # Encodes can finish out of order, frames older than the last published one are stale.
+        self.published_sequence = -1
+        self.stale = 0
+
+    async def handle(self, request: HttpRequest):
+        if request.method not in ('GET', 'HEAD'):
+            raise HttpError(405)
+        if request.path in ('/', '/index.html'):
+            return HttpResponse(body=PREVIEW_HTML.encode(), content_type='text/html')
+        if request.path == '/ws':
+            return WebSocketStream(self)
+        if request.path == '/stream.mjpeg':
+            return MjpegStream(self)
+        raise HttpError(404)
+
+    def subscribe(self, raw: bool) -> PreviewClient:
+        client = PreviewClient(raw)
+        self.clients.add(client)
+        if raw:
+            self.raw_clients += 1
+        else:
+            self.jpeg_clients += 1
+        return client
+
+    def unsubscribe(self, client: PreviewClient):
+        if client not in self.clients:
+            return
+        self.clients.remove(client)
+        if client.raw:
+            self.raw_clients -= 1
+        else:
+            self.jpeg_clients -= 1
+
+    def publish(self, sequence: int, jpeg: Optional[bytes], raw: Optional[bytes]):
+        """
+        Hands an encoded frame to every viewer unless a newer one was already published, runs on the event loop.
+        """
+        if sequence <= self.published_sequence:
+            self.stale += 1
+            return
+        self.published_sequence = sequence
+        for client in self.clients:
+            payload = raw if client.raw else jpeg
+            if payload is None:
+                continue
+            self.offered += 1
+            if client.latest is not None:
+                self.dropped += 1
+            client.offer(payload)
+
+
+class PreviewSink(FrameProcessor):
+    """
+    A low-latency remote preview, see PreviewServer for the endpoints. Frames are downscaled and encoded once
+    in a small worker pool and shared by every viewer. When every worker is busy the frame is skipped, and each
+    viewer only ever holds the latest frame, so neither slow encoding nor a slow viewer stalls the pipeline.
+
+    The preview size adapts between `min_size` and `max_size` (longest side): it shrinks when encoding can't keep
+    up with the frame rate or viewers are dropping most frames, and grows back once there's headroom.
+    """
+    executor: Optional[ThreadPoolExecutor]
+
+    def __init__(
+        self,
+        port: int = 8890,
+        host: str = '0.0.0.0',
+        max_size: int = 1280,
+        min_size: int = 320,
+        quality: int = 75,
+        workers: int = 2,
+    ):
+        if min_size > max_size:
+            raise ValueError(f"min_size {min_size} is larger than max_size {max_size}")
+
+        self.server = PreviewServer(host, port)
+        self.max_size = max_size
+        self.min_size = min_size
+        self.quality = quality
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.submitted = 0
+        self.skipped_frames = 0
+        self.size = max_size
+        # Exponential moving averages of the time between frames and the time to encode one.
+        self.frame_interval = None
+        self.encode_time = None
+        self.last_frame_time = None
+        self.last_adapt_time = 0.0
+        self.last_offered = 0
+        self.last_dropped = 0
+
+    def __str__(self) -> str:
+        return f"PreviewSink(port={self.server.port})"
+
+    def open(self):
+        self.server.start()
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='preview')
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self.server.stop()
+
+    def __call__(self, frame: Frame) -> Frame:
+        now = time.perf_counter()
+        if self.last_frame_time is not None:
+            self.frame_interval = _ema(self.frame_interval, now - self.last_frame_time)
+        self.last_frame_time = now
+
+        if self.server.jpeg_clients == 0 and self.server.raw_clients == 0:
+            return frame
+
+        with self.lock:
+            if self.in_flight >= self.workers:
+                self.skipped_frames += 1
+                return frame
+            self.in_flight += 1
+            sequence = self.submitted
+            self.submitted += 1
+        self.executor.submit(self._encode, frame, self.size, sequence)
+        return frame
+
+    def _encode(self, frame: Frame, size: int, sequence: int):
+        try:
+            start = time.perf_counter()
+            pixels, _ = frame.downscaled(PixelFormat.BGR_uint8, size)
+            jpeg = None
+            if self.server.jpeg_clients:
+                jpeg = cv2.imencode('.jpg', pixels, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes()
+            raw = None
+            if self.server.raw_clients:
+                raw = RAW_HEADER.pack(pixels.shape[1], pixels.shape[0], pixels.shape[2]) + pixels.tobytes()
+            self.server.call_soon(self.server.publish, sequence, jpeg, raw)
+
+            with self.lock:
+                self.encode_time = _ema(self.encode_time, time.perf_counter() - start)
+                self._adapt()
+        except Exception as e:
+            log.error(f"Error encoding preview frame: {e}")
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _adapt(self):
+        now = time.perf_counter()
+        if self.frame_interval is None or now - self.last_adapt_time < 1.0:
+            return
+
+        offered, dropped = self.server.offered, self.server.dropped
+        drop_rate = (dropped - self.last_dropped) / max(1, offered - self.last_offered)
+        self.last_offered, self.last_dropped, self.last_adapt_time = offered, dropped, now
+
+        # Each worker has this long per frame before frames start getting skipped.
+        budget = self.frame_interval * self.workers
+        size = self.size
+        if self.encode_time > budget * 0.8 or drop_rate > 0.3:
+            size = max(self.min_size, int(self.size * 0.8))
+        elif self.encode_time < budget * 0.4 and drop_rate < 0.05:
+            size = min(self.max_size, int(self.size * 1.25))
+        # Multiples of 16 keep JPEG blocks whole.
+        size = max(self.min_size, size // 16 * 16)
+
+        if size != self.size:
+            log.info(f"Preview size {self.size} -> {size} (encode {self.encode_time * 1000:.1f}ms, drop rate {drop_rate:.0%})")
+            self.size = size
+
+
+def _ema(average: Optional[float], value: float, alpha: float = 0.1) -> float:
+    return value if average is None else average + alpha * (value - average)
@@ -0,0 +1,82 @@
+import os
+from typing import Any, Dict, List, Optional, Union
+
+from rtvideo.common.structs import Frame, FrameProcessor, PixelFormat
+from rtvideo.sinks.encoder import EncoderConfig, FfmpegEncoder
+
+CONTAINER_FORMATS = {
+    '.mp4': 'mp4',
+    '.mkv': 'matroska',
+}
+
+
+def recording_output_args(output_path: str, segment_time: Optional[float] = None) -> List[str]:
+    """
+    Writes an MP4 or MKV file, or a numbered series of them every `segment_time` seconds.
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension not in CONTAINER_FORMATS:
+        raise ValueError(f"Unsupported recording format: {output_path} (expected one of {sorted(CONTAINER_FORMATS)})")
+    container = CONTAINER_FORMATS[extension]
+
+    if segment_time is None:
+        # Fragmented MP4 stays playable if the process dies before the file is finalized.
+        movflags = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof'] if container == 'mp4' else []
+        return [*movflags, '-f', container, output_path]
+
+    if '%' not in output_path:
+        root, extension = os.path.splitext(output_path)
+        output_path = f'{root}_%05d{extension}'
+    return [
+        # Segments can only start on a keyframe, so force one at every boundary.
+        '-force_key_frames', f'expr:gte(t,n_forced*{segment_time})',
+        '-f', 'segment',
+        '-segment_time', str(segment_time),
+        '-segment_format', container,
+        '-reset_timestamps', '1',  # Every segment plays on its own from 0
+        output_path,
+    ]
+
+
+class RecordingSink(FrameProcessor):
+    """
+    Records frames to an MP4 or MKV file, optionally split into `segment_time` second segments (`output_path`
+    may contain a printf-style counter like `clip_%03d.mp4`). Unlike HlsSink, frames are not dropped by default
+    so the recording is complete, set `drop_frames` for live pipelines that must never wait on the encoder.
+    """
+    def __init__(
+        self,
+        output_path: str,
+        encoder: Union[EncoderConfig, Dict[str, Any], None] = None,
+        pixel_format: Optional[PixelFormat] = None,
+        fps: int = 30,
+        segment_time: Optional[float] = None,
+        queue_size: int = 8,
+        drop_frames: bool = False,
+    ):
+        self.output_path = output_path
+        self.encoder = FfmpegEncoder(
+            recording_output_args(output_path, segment_time),
+            encoder,
+            fps=fps,
+            pixel_format=pixel_format,
+            queue_size=queue_size,
+            drop_frames=drop_frames,
+            name='recording encoder',
+        )
+
+    def __str__(self) -> str:
+        return f"RecordingSink(output_path={self.output_path})"
+
+    def open(self):
+        self.encoder.budget_threads(self.cpu_threads)
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def close(self):
+        self.encoder.close()
+
+    def __call__(self, frame: Frame) -> Frame:
+        self.encoder.write(frame)
+        return frame
@@ -1,36 +1,87 @@
 from collections.abc import Iterator
+import time
+from typing import Optional
 from rtvideo.common.structs import Frame, FrameSource, PixelArrangement, PixelFormat
 
 import cv2
+import numpy as np
 
 from rtvideo.common.timer import NoopTimerSpan
 
+
+def video_fps(file_path: str, default: float = 30.0) -> float:
+    """
+    The frame rate a video file declares, or `default` if it doesn't declare one.
+    """
+    capture = cv2.VideoCapture(file_path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) if capture.isOpened() else 0
+    finally:
+        capture.release()
+    return fps if fps > 0 else default
+
+
 class FileSource(FrameSource):
-    def __init__(self, file_path: str, loop: bool = True):
+    """
+    Reads a video file, optionally only frames [`start_frame`, `end_frame`) of it. Seeking is cheapest when
+    `start_frame` is a keyframe, otherwise the decoder has to work forward from the one before it.
+    """
+    def __init__(self, file_path: str, loop: bool = True, start_frame: int = 0, end_frame: Optional[int] = None):
+        if start_frame < 0 or (end_frame is not None and end_frame <= start_frame):
+            raise ValueError(f"Invalid frame range [{start_frame}, {end_frame})")
+
         self.loop = loop
         self.file_path = file_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.position = start_frame
+        self.sequence = 0
 
     def open(self) -> None:
         self.capture = cv2.VideoCapture(self.file_path)
 
         if not self.capture.isOpened():
             raise RuntimeError("Could not open file")
+        self.position = 0
+        self.sequence = 0
+        if self.start_frame > 0:
+            self.seek(self.start_frame)
 
     def close(self) -> None:
         self.capture.release()
 
-    def __next__(self) -> Frame:
-        span = NoopTimerSpan() if self.timer is None else self.timer.span('frame')
-        span.start()
+    def seek(self, frame_index: int) -> None:
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        self.position = frame_index
+
+    def read(self) -> Optional[np.ndarray]:
+        if self.end_frame is not None and self.position >= self.end_frame:
+            return None
 
         ret, pixels = self.capture.read()
         if not ret:
+            return None
+        self.position += 1
+        return pixels
+
+    def __next__(self) -> Frame:
+        # Decoding is as close as a file gets to capture, so it counts towards the frame's latency.
+        capture_ts = time.time()
+        span = NoopTimerSpan() if self.timer is None else self.timer.span('frame')
+        span.start(capture_ts)
+
+        pixels = self.read()
+        if pixels is None:
             if self.loop:
-                self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                ret, pixels = self.capture.read()
-                if not ret:
+                self.seek(self.start_frame)
+                pixels = self.read()
+                if pixels is None:
                     raise StopIteration
             else:
                 raise StopIteration
 
-        return Frame(pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, [], span=span)
+        self.sequence += 1
+        return Frame(
+            pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, [], span=span,
+            sequence=self.sequence - 1, capture_ts=capture_ts, arrival_ts=time.time(),
+        )
@@ -0,0 +1,30 @@
+from rtvideo.common.structs import Frame, FrameSource
+
+
+class LimitSource(FrameSource):
+    """
+    Stops another source after `max_frames` frames, e.g. to benchmark a looping file for a fixed frame count.
+    """
+    def __init__(self, source: FrameSource, max_frames: int):
+        self.source = source
+        self.max_frames = max_frames
+        self.frame_count = 0
+
+    def __str__(self) -> str:
+        return f"LimitSource({self.source}, max_frames={self.max_frames})"
+
+    def open(self) -> None:
+        self.frame_count = 0
+        self.source.timer = self.timer
+        self.source.open()
+
+    def close(self) -> None:
+        self.source.close()
+
+    def __next__(self) -> Frame:
+        if self.frame_count >= self.max_frames:
+            raise StopIteration
+
+        frame = next(self.source)
+        self.frame_count += 1
+        return frame
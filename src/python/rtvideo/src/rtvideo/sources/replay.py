@@ -0,0 +1,131 @@
+import os
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from rtvideo.common.structs import PLANAR_YUV_FORMATS, Frame, FrameSource, PixelArrangement, PixelFormat
+from rtvideo.common.timer import NoopTimerSpan
+
+CHANNELS = {
+    PixelFormat.RGB_uint8: 3,
+    PixelFormat.RGBA_uint8: 4,
+    PixelFormat.RGB_float32: 3,
+    PixelFormat.RGBA_float32: 4,
+    PixelFormat.BGR_uint8: 3,
+    PixelFormat.BGRA_uint8: 4,
+    PixelFormat.YUYV422_uint8: 2,
+}
+
+
+def frame_shape(pixel_format: PixelFormat, width: int, height: int) -> Tuple[Tuple[int, ...], np.dtype]:
+    """
+    The HWC shape and dtype of a single frame's pixels.
+    """
+    if pixel_format in PLANAR_YUV_FORMATS:
+        return (height * 3 // 2, width), np.dtype(np.uint8)
+    dtype = np.dtype(np.float32 if pixel_format.value.endswith('float32') else np.uint8)
+    return (height, width, CHANNELS[pixel_format]), dtype
+
+
+class NpyReplaySource(FrameSource):
+    """
+    Replays recorded frames: a `.npy` array of shape (frames, *frame) as saved by play_opencv.py, or a `.raw`
+    dump of back-to-back frames as written by `ffmpeg -f rawvideo` (which needs `width` and `height`).
+
+    The file is memory-mapped and every frame is a view into it, so nothing is decoded or copied and every run
+    sees exactly the same input. Frames come out at `fps`, or as fast as they're consumed when it's None.
+    The mapping is copy-on-write, processors can draw on frames without touching the file, and it's
+    recreated on every loop so drawings never carry over into the next pass.
+    """
+    frames: Optional[np.ndarray]
+
+    def __init__(
+        self,
+        file_path: str,
+        fps: Optional[float] = None,
+        loop: bool = True,
+        pixel_format: PixelFormat = PixelFormat.BGR_uint8,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ):
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension not in ('.npy', '.raw'):
+            raise ValueError(f"Unsupported replay file: {file_path} (expected .npy or .raw)")
+        if extension == '.raw' and (width is None or height is None):
+            raise ValueError(f"Replaying raw frames from {file_path} needs a width and height")
+
+        self.file_path = file_path
+        self.fps = fps
+        self.loop = loop
+        self.pixel_format = pixel_format
+        self.width = width
+        self.height = height
+        self.frames = None
+        self.position = 0
+        self.sequence = 0
+
+    def __str__(self) -> str:
+        return f"NpyReplaySource({self.file_path}, fps={self.fps})"
+
+    def __len__(self) -> int:
+        return 0 if self.frames is None else len(self.frames)
+
+    def _map(self) -> np.ndarray:
+        if self.file_path.lower().endswith('.npy'):
+            frames = np.load(self.file_path, mmap_mode='c')
+            if frames.ndim < 3:
+                raise ValueError(f"{self.file_path} holds a {frames.shape} array, not a sequence of frames")
+            is_planar = self.pixel_format in PLANAR_YUV_FORMATS
+            height = frames.shape[1] * 2 // 3 if is_planar else frames.shape[1]
+            shape, dtype = frame_shape(self.pixel_format, frames.shape[2], height)
+            if frames.shape[1:] != shape or frames.dtype != dtype:
+                raise ValueError(f"{self.file_path} holds {frames.dtype} frames of {frames.shape[1:]}, not {self.pixel_format.value}")
+            return frames
+
+        shape, dtype = frame_shape(self.pixel_format, self.width, self.height)
+        data = np.memmap(self.file_path, dtype=dtype, mode='c')
+        frame_size = int(np.prod(shape))
+        # A dump cut off mid-frame ends with a partial frame, drop it.
+        frame_count = len(data) // frame_size
+        return data[:frame_count * frame_size].reshape(frame_count, *shape)
+
+    def open(self) -> None:
+        self.frames = self._map()
+        if len(self.frames) == 0:
+            raise RuntimeError(f"No frames in {self.file_path}")
+        self.position = 0
+        self.sequence = 0
+        self.start_ts = time.perf_counter()
+
+    def close(self) -> None:
+        # Views handed out keep the mapping alive until they're gone too.
+        self.frames = None
+
+    def __next__(self) -> Frame:
+        if self.position >= len(self.frames):
+            if not self.loop:
+                raise StopIteration
+            self.frames = self._map()
+            self.position = 0
+            self.start_ts = time.perf_counter()
+
+        arrival_ts = capture_ts = time.time()
+        if self.fps is not None:
+            # Paced against the start of the pass, so time spent downstream doesn't push later frames back.
+            delay = self.start_ts + self.position / self.fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            # Captured when it was due, like a camera that kept running while the pipeline was busy.
+            arrival_ts = time.time()
+            capture_ts = arrival_ts + min(0.0, delay)
+
+        span = NoopTimerSpan() if self.timer is None else self.timer.span('frame')
+        span.start(capture_ts)
+        pixels = self.frames[self.position]
+        self.position += 1
+        self.sequence += 1
+        return Frame(
+            pixels, self.pixel_format, PixelArrangement.HWC, [], span=span,
+            sequence=self.sequence - 1, capture_ts=capture_ts, arrival_ts=arrival_ts,
+        )
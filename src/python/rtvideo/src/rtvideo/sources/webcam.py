@@ -1,38 +1,410 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import logging
 import os
+import queue
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, List, Optional, Set, Tuple, Union
 
 import cv2
+import numpy as np
 from rtvideo.common.structs import Frame, FrameSource, PixelArrangement, PixelFormat
 from rtvideo.common.timer import NoopTimerSpan
 
+log = logging.getLogger(__name__)
+
 DEFAULT_WIDTH = 1280
 DEFAULT_HEIGHT = 720
 DEFAULT_FPS = 30
 
+# Tried in this order when probing, a backend missing from the OpenCV build is skipped.
+PROBE_BACKENDS = ('DSHOW', 'MSMF') if os.name == "nt" else ('V4L2', 'GSTREAMER')
+PROBE_FOURCCS = ('MJPG', 'YUYV', 'BGR3')
+# Frames read before timing, the first few are slow while the device starts streaming.
+PROBE_WARMUP_FRAMES = 5
+# Candidates within this fraction of the best frame rate count as equally fast, the cheapest to decode wins.
+PROBE_FPS_TOLERANCE = 0.05
+# A device timestamp older than this when the frame arrives is taken to be on some other clock and ignored.
+MAX_DEVICE_TIMESTAMP_AGE = 1.0
+# How long closing waits for the reader thread to finish its read() before releasing the capture under it.
+READER_STOP_TIMEOUT = 2.0
+
+
+def default_probe_cache() -> str:
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'rtvideo', 'webcam_probe.json')
+
+
+def device_name(device: Union[int, str]) -> str:
+    """
+    The device's name as the kernel reports it where that's available, so a cached choice follows the camera
+    rather than whichever one ends up at an index.
+    """
+    index = device if isinstance(device, int) else os.path.basename(str(device)).removeprefix('video')
+    try:
+        with open(f'/sys/class/video4linux/video{index}/name') as f:
+            return f"{f.read().strip()} ({device})"
+    except OSError:
+        return str(device)
+
+
+def native_thread_ids() -> Set[int]:
+    """
+    Every thread in the process, including ones started by native libraries. Empty where /proc isn't available.
+    """
+    try:
+        return {int(tid) for tid in os.listdir('/proc/self/task')}
+    except OSError:
+        return set()
+
+
+def threads_cpu_time(tids: Iterable[int]) -> float:
+    """
+    CPU seconds used so far by the given threads of this process, skipping any that have exited.
+    """
+    total = 0
+    for tid in tids:
+        try:
+            with open(f'/proc/self/task/{tid}/stat') as f:
+                # The name in parentheses may contain spaces, utime and stime are the 12th and 13th fields after it.
+                fields = f.read().rpartition(')')[2].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            pass
+    return total / os.sysconf('SC_CLK_TCK') if total else 0.0
+
+
+@dataclass
+class ProbeResult:
+    backend: str
+    fourcc: str
+    fps: float
+    # CPU time the reading thread and the backend's own threads spend per frame, mostly decoding and conversion.
+    cpu_ms: float
+
 
 class WebcamSource(FrameSource):
-    def __init__(self, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, fps=DEFAULT_FPS):
+    """
+    Reads frames from a camera. The backend and fourcc default to V4L2 (DirectShow on Windows) with MJPG,
+    or YUYV for the YUYV422 pixel format. With `fourcc='auto'` each available backend and fourcc is tried for
+    `probe_seconds` on the first open, and the one with the highest frame rate, then the lowest decode cost,
+    is cached per device and resolution in `probe_cache` for later opens. `reprobe=True` ignores the cache.
+
+    With MJPG and `decode_threads` set, compressed frames are read on a thread of their own and decoded on a pool
+    of that many threads, rather than inside `VideoCapture.read()`, and handed out in order. A frame that isn't
+    picked up before `decode_threads` newer ones are read is dropped, as the camera would. `detection_size`
+    also has the pool shrink each frame for a face detector with that input size, see `Frame.downscaled`.
+    """
+    def __init__(
+        self,
+        width=DEFAULT_WIDTH,
+        height=DEFAULT_HEIGHT,
+        fps=DEFAULT_FPS,
+        pixel_format=PixelFormat.BGR_uint8,
+        device: Union[int, str] = 0,
+        fourcc: Optional[str] = None,
+        backend: Optional[str] = None,
+        probe_seconds: float = 1.0,
+        probe_cache: Optional[str] = None,
+        reprobe: bool = False,
+        capture_factory: Callable = cv2.VideoCapture,
+        decode_threads: int = 0,
+        detection_size: Optional[int] = None,
+    ):
+        if pixel_format not in (PixelFormat.BGR_uint8, PixelFormat.YUYV422_uint8):
+            raise ValueError(f"Unsupported webcam pixel format: {pixel_format}")
+        if decode_threads and pixel_format != PixelFormat.BGR_uint8:
+            raise ValueError(f"decode_threads only applies to MJPG decoded to BGR, not {pixel_format}")
+        if fourcc is not None and fourcc != 'auto' and len(fourcc) != 4:
+            raise ValueError(f"Expected a four character code or 'auto', got '{fourcc}'")
+
         self.width = width
         self.height = height
         self.fps = fps
+        # YUYV422 skips OpenCV's conversion entirely and hands the raw camera buffer downstream.
+        self.pixel_format = pixel_format
+        self.device = device
+        self.fourcc = fourcc
+        self.backend = backend
+        self.probe_seconds = probe_seconds
+        self.probe_cache = probe_cache or default_probe_cache()
+        self.reprobe = reprobe
+        # Called as capture_factory(device, api), swapped for a fake device to exercise probing without a camera.
+        self.capture_factory = capture_factory
+        self.decode_threads = decode_threads
+        self.detection_size = detection_size
+        self.decode_pool: Optional[ThreadPoolExecutor] = None
 
     def open(self) -> None:
-        capture_api = cv2.CAP_DSHOW if os.name == "nt" else cv2.CAP_V4L2
-        self.capture = cv2.VideoCapture(0, capture_api)
-        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-        self.capture.set(cv2.CAP_PROP_FPS, self.fps)
-        self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc('M', 'J', 'P', 'G'))
+        backend, fourcc = self.backend, self.fourcc
+        if fourcc == 'auto':
+            backend, fourcc = self.select_capture()
+        if backend is None:
+            backend = PROBE_BACKENDS[0]
+        if fourcc is None:
+            fourcc = 'YUYV' if self.pixel_format == PixelFormat.YUYV422_uint8 else 'MJPG'
 
+        self.capture = self.open_capture(backend, fourcc)
         if not self.capture.isOpened():
             raise RuntimeError("Could not open webcam")
+        self.capture_backend = backend
+        self.sequence = 0
+
+        if self.decode_threads and fourcc == 'MJPG':
+            # Hand back the compressed buffer from read() instead of decoding it there.
+            self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            self.start_decoding()
+        elif self.decode_threads:
+            log.warn(f"Ignoring decode_threads, the webcam is capturing {fourcc} rather than MJPG")
 
     def close(self) -> None:
+        if self.decode_pool is not None:
+            self.stop_decoding()
         self.capture.release()
 
-    def __next__(self) -> Frame:
+    def start_decoding(self) -> None:
+        self.decode_pool = ThreadPoolExecutor(self.decode_threads, thread_name_prefix='mjpeg decode')
+        # Decodes in the order the frames were read, None once the camera stops delivering.
+        self.decoded: queue.Queue[Optional[Future]] = queue.Queue(maxsize=self.decode_threads)
+        self.reading = True
+        self.reader_thread = threading.Thread(target=self.read_compressed, name='webcam read', daemon=True)
+        self.reader_thread.start()
+
+    def stop_decoding(self) -> None:
+        self.reading = False
+        # Make room in case the reader is waiting to queue a frame.
+        deadline = time.monotonic() + READER_STOP_TIMEOUT
+        while self.reader_thread.is_alive() and time.monotonic() < deadline:
+            try:
+                self.decoded.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        if self.reader_thread.is_alive():
+            # Stuck in read() on a camera that stopped delivering, releasing the device makes the read return.
+            log.warn(f"Webcam read didn't return within {READER_STOP_TIMEOUT}s, releasing the camera")
+            self.capture.release()
+            self.reader_thread.join(timeout=READER_STOP_TIMEOUT)
+            if self.reader_thread.is_alive():
+                log.warn("Webcam read still hasn't returned, leaving the thread behind")
+        self.decode_pool.shutdown(wait=True, cancel_futures=True)
+        self.decode_pool = None
+
+    def read(self) -> Tuple[Optional[np.ndarray], float, float]:
+        """
+        Reads the next frame, returning its pixels (None once the camera stops), capture time and arrival time.
+        """
+        read_ts = time.time()
         ret, pixels = self.capture.read()
+        arrival_ts = time.time()
         if not ret:
-            raise StopIteration
-        span = NoopTimerSpan() if self.timer is None else self.timer.span('frame')
-        span.start()
-        return Frame(pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, [], span=span)
\ No newline at end of file
+            return None, read_ts, arrival_ts
+        return pixels, self.device_timestamp(arrival_ts) or read_ts, arrival_ts
+
+    def device_timestamp(self, arrival_ts: float) -> Optional[float]:
+        """
+        When the driver says the frame was captured, moved onto the `time.time()` clock. OpenCV's V4L2 backend
+        reports the buffer's CLOCK_MONOTONIC timestamp as CAP_PROP_POS_MSEC, other backends have no equivalent.
+        """
+        if self.capture_backend != 'V4L2':
+            return None
+        age = time.monotonic() - self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if not 0 <= age <= MAX_DEVICE_TIMESTAMP_AGE:
+            return None
+        return arrival_ts - age
+
+    def read_compressed(self) -> None:
+        end: Optional[Future] = None
+        try:
+            while self.reading:
+                data, capture_ts, arrival_ts = self.read()
+                if data is None:
+                    break
+                self.put_decode(self.decode_pool.submit(self.decode, data, self.sequence, capture_ts, arrival_ts))
+                self.sequence += 1
+        except Exception as e:
+            # Handed to next_decoded, which raises it where the frames are consumed.
+            end = Future()
+            end.set_exception(e)
+        finally:
+            # Always queued, or next_decoded would wait forever on a reader that's gone.
+            self.put_decode(end)
+
+    def put_decode(self, item: Optional[Future]) -> None:
+        while True:
+            try:
+                self.decoded.put_nowait(item)
+                return
+            except queue.Full:
+                if not self.reading:
+                    return
+                try:
+                    self.decoded.get_nowait().cancel()
+                    log.debug("Dropped a webcam frame waiting to be picked up")
+                except (queue.Empty, AttributeError):
+                    pass
+
+    def decode(self, data: np.ndarray, sequence: int, capture_ts: float, arrival_ts: float) -> Optional[Frame]:
+        # Backends that don't honour CONVERT_RGB return the frame already decoded.
+        pixels = data if data.ndim == 3 else cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if pixels is None:
+            log.debug(f"Skipping a webcam frame that failed to decode ({data.size} bytes)")
+            return None
+        frame = Frame(pixels, self.pixel_format, PixelArrangement.HWC, [], sequence=sequence, capture_ts=capture_ts, arrival_ts=arrival_ts)
+        if self.detection_size is not None:
+            # Memoized on the frame, so the detector finds its input ready. RGB for SCRFD, BGR for YOLOv8.
+            small, scale = frame.downscaled(PixelFormat.BGR_uint8, self.detection_size)
+            frame.downscales[(PixelFormat.RGB_uint8, self.detection_size)] = (cv2.cvtColor(small, cv2.COLOR_BGR2RGB), scale)
+        return frame
+
+    def next_decoded(self) -> Frame:
+        while True:
+            future = self.decoded.get()
+            if future is None:
+                raise StopIteration
+            if future.cancelled():
+                continue
+            # Raises what the decode, or the reader thread, failed with.
+            frame = future.result()
+            if frame is not None:
+                return frame
+
+    def open_capture(self, backend: str, fourcc: str):
+        capture = self.capture_factory(self.device, getattr(cv2, f'CAP_{backend}'))
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        capture.set(cv2.CAP_PROP_FPS, self.fps)
+        capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter.fourcc(*fourcc))
+        if self.pixel_format == PixelFormat.YUYV422_uint8:
+            capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        return capture
+
+    def cache_key(self) -> str:
+        key = f"{device_name(self.device)} {self.width}x{self.height}@{self.fps} {self.pixel_format.name}"
+        # A pinned backend gets its own entry, so a choice probed across every backend can't override it.
+        return f"{key} {self.backend}" if self.backend else key
+
+    def select_capture(self) -> Tuple[str, str]:
+        """
+        The backend and fourcc to use, from the cache or by probing every candidate.
+        """
+        key = self.cache_key()
+        cache = self.read_cache()
+        if key in cache and not self.reprobe:
+            choice = cache[key]
+            log.info(f"Using cached webcam capture {choice['backend']}/{choice['fourcc']} for {key}")
+            return choice['backend'], choice['fourcc']
+
+        results = self.probe()
+        if not results:
+            raise RuntimeError(f"No backend and fourcc could capture {key}")
+        best_fps = max(result.fps for result in results)
+        fast = [result for result in results if result.fps >= best_fps * (1 - PROBE_FPS_TOLERANCE)]
+        choice = min(fast, key=lambda result: result.cpu_ms)
+        log.info(f"Selected webcam capture {choice.backend}/{choice.fourcc} for {key}: {choice.fps:.1f} fps, {choice.cpu_ms:.2f}ms CPU per frame")
+
+        cache[key] = {**asdict(choice), 'probed_at': time.time()}
+        self.write_cache(cache)
+        return choice.backend, choice.fourcc
+
+    def candidates(self) -> List[Tuple[str, str]]:
+        available = {cv2.videoio_registry.getBackendName(api) for api in cv2.videoio_registry.getCameraBackends()}
+        backends = [self.backend] if self.backend else [name for name in PROBE_BACKENDS if name in available]
+        # The raw buffer handed downstream for YUYV422 only comes from YUYV capture.
+        fourccs = ('YUYV',) if self.pixel_format == PixelFormat.YUYV422_uint8 else PROBE_FOURCCS
+        return [(backend, fourcc) for backend in backends for fourcc in fourccs]
+
+    def probe(self) -> List[ProbeResult]:
+        results = []
+        for backend, fourcc in self.candidates():
+            try:
+                result = self.probe_capture(backend, fourcc)
+            except cv2.error as e:
+                log.debug(f"Probing {backend}/{fourcc} failed: {e}")
+                result = None
+            if result is not None:
+                log.info(f"Probed {backend}/{fourcc}: {result.fps:.1f} fps, {result.cpu_ms:.2f}ms CPU per frame")
+                results.append(result)
+        return results
+
+    def probe_capture(self, backend: str, fourcc: str) -> Optional[ProbeResult]:
+        """
+        Reads from the device for `probe_seconds` with one backend and fourcc. Returns None if it can't open,
+        ignores the fourcc, or delivers frames of the wrong size.
+        """
+        threads_before = native_thread_ids()
+        capture = self.open_capture(backend, fourcc)
+        try:
+            if not capture.isOpened():
+                return None
+            actual = int(capture.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, 'little').decode('ascii', errors='replace')
+            if actual != fourcc:
+                log.debug(f"{backend} ignored fourcc {fourcc}, got {actual}")
+                return None
+
+            for _ in range(PROBE_WARMUP_FRAMES):
+                ret, pixels = capture.read()
+                if not ret or not self.has_expected_size(pixels):
+                    return None
+
+            # Backends like GStreamer decode and convert on threads of their own rather than in read(), those are the
+            # native threads that appeared since the capture opened. Counting this thread and those rather than the
+            # whole process leaves out processors loading models on other threads while the source probes.
+            helpers = native_thread_ids() - threads_before - {thread.native_id for thread in threading.enumerate()}
+
+            def cpu_time() -> float:
+                return time.thread_time() + threads_cpu_time(helpers)
+
+            frames = 0
+            start, cpu_start = time.perf_counter(), cpu_time()
+            while time.perf_counter() - start < self.probe_seconds:
+                ret, _ = capture.read()
+                if not ret:
+                    return None
+                frames += 1
+            # A helper that exits mid-probe takes its CPU time with it.
+            elapsed, cpu = time.perf_counter() - start, max(0.0, cpu_time() - cpu_start)
+            return ProbeResult(backend, fourcc, frames / elapsed, cpu * 1000 / max(frames, 1))
+        finally:
+            capture.release()
+
+    def has_expected_size(self, pixels) -> bool:
+        if self.pixel_format == PixelFormat.YUYV422_uint8:
+            return pixels.size == self.height * self.width * 2
+        return pixels.shape == (self.height, self.width, 3)
+
+    def read_cache(self) -> dict:
+        try:
+            with open(self.probe_cache) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.warn(f"Ignoring unreadable webcam probe cache {self.probe_cache}: {e}")
+            return {}
+
+    def write_cache(self, cache: dict) -> None:
+        os.makedirs(os.path.dirname(self.probe_cache), exist_ok=True)
+        partial_path = f'{self.probe_cache}.partial'
+        with open(partial_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(partial_path, self.probe_cache)
+
+    def __next__(self) -> Frame:
+        if self.decode_pool is not None:
+            frame = self.next_decoded()
+        else:
+            pixels, capture_ts, arrival_ts = self.read()
+            if pixels is None:
+                raise StopIteration
+            if self.pixel_format == PixelFormat.YUYV422_uint8:
+                # Raw buffers may come back flattened, restore the packed (H, W, 2) layout.
+                pixels = pixels.reshape(self.height, self.width, 2)
+            frame = Frame(pixels, self.pixel_format, PixelArrangement.HWC, [], sequence=self.sequence, capture_ts=capture_ts, arrival_ts=arrival_ts)
+            self.sequence += 1
+
+        # From capture, so the frame's span covers the time spent in the driver and decoding too.
+        frame.span = NoopTimerSpan() if self.timer is None else self.timer.span('frame')
+        frame.span.start(frame.capture_ts)
+        return frame
@@ -0,0 +1,128 @@
+import logging
+from types import SimpleNamespace
+
+from rtvideo.common.frame_stats import FrameStats
+from rtvideo.common.structs import FrameProcessor, QualityKnob
+from rtvideo.common.timer import Timer
+from rtvideo.pipelines.adaptive_quality import AdaptiveQualityController
+
+FPS = 30
+INTERVAL = 2.0
+
+
+class KnobProcessor(FrameProcessor):
+    def __init__(self, name, *knobs):
+        self.name = name
+        self.knobs = list(knobs)
+
+    def __str__(self):
+        return self.name
+
+    def quality_knobs(self):
+        return self.knobs
+
+
+class Harness:
+    """
+    Feeds the controller's FrameStats and Timer with a window of frames and stage spans, then checks it.
+    """
+    def __init__(self, controller, processors):
+        self.controller = controller
+        self.stats = FrameStats()
+        self.timer = Timer()
+        self.sequence = 0
+        self.now = 0.0
+        controller.attach(processors, self.timer, self.stats)
+        controller.last_check = self.now
+
+    def window(self, delivered_every: int = 1, stage_ms=None, latency: float = 0.05):
+        start = self.now
+        self.now += INTERVAL
+        frames = int(INTERVAL * FPS)
+        for i in range(frames):
+            ts = start + (i + 1) * INTERVAL / frames
+            if i % delivered_every == 0:
+                frame = SimpleNamespace(sequence=self.sequence, capture_ts=ts - latency)
+                self.stats.record(frame, now=ts)
+            self.sequence += 1
+            for name, ms in (stage_ms or {}).items():
+                span = self.timer.span(f"{name}(frame)")
+                span.start_ts, span.end_ts, span.duration = ts - ms / 1000, ts, ms / 1000
+        return self.controller.update(now=self.now)
+
+    def values(self):
+        return [str(knob) for processor in self.controller.processors for knob in processor.quality_knobs()]
+
+
+def make_harness(**kwargs):
+    blur = KnobProcessor('blur', QualityKnob('kernel', [31, 15]))
+    detector = KnobProcessor('detector', QualityKnob('size', [640, 480, 320]))
+    controller = AdaptiveQualityController(target_fps=FPS, interval=INTERVAL, **kwargs)
+    return Harness(controller, [blur, detector])
+
+
+SLOW_DETECTOR = {'blur': 5, 'detector': 60}
+FAST = {'blur': 5, 'detector': 10}
+
+
+def test_degrades_the_slowest_stage_first():
+    harness = make_harness()
+    measurement = harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+
+    assert measurement.output_fps == FPS / 2
+    assert measurement.stage_ms == {'blur': 5, 'detector': 60}
+    assert harness.values() == ['kernel=31', 'size=480']
+    adjustment = harness.controller.adjustments[-1]
+    assert (adjustment.processor, adjustment.knob, adjustment.old_value, adjustment.new_value) == ('detector', 'size', 640, 480)
+
+
+def test_skips_the_check_after_a_change():
+    harness = make_harness()
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    assert harness.values() == ['kernel=31', 'size=480']
+
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    assert harness.values() == ['kernel=31', 'size=320']
+
+
+def test_moves_on_to_other_stages_then_warns_at_the_lowest(caplog):
+    harness = make_harness()
+    for _ in range(5):
+        harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    assert harness.values() == ['kernel=15', 'size=320']
+
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    with caplog.at_level(logging.WARNING, logger='rtvideo.pipelines.adaptive_quality'):
+        harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    assert 'every quality knob already at its lowest' in caplog.text
+    assert len(harness.controller.adjustments) == 3
+
+
+def test_improves_only_after_sustained_headroom():
+    harness = make_harness(improve_after=3)
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    harness.window(delivered_every=2, stage_ms=SLOW_DETECTOR)
+    assert harness.values() == ['kernel=31', 'size=320']
+
+    # Skipped after the change, then two checks with headroom aren't enough.
+    for _ in range(3):
+        harness.window(stage_ms=FAST)
+    assert harness.values() == ['kernel=31', 'size=320']
+    # A check without headroom starts the count over.
+    harness.window(stage_ms={'blur': 5, 'detector': 30})
+    for _ in range(2):
+        harness.window(stage_ms=FAST)
+    assert harness.values() == ['kernel=31', 'size=320']
+
+    harness.window(stage_ms=FAST)
+    assert harness.values() == ['kernel=31', 'size=480']
+    assert harness.controller.adjustments[-1].reason.startswith('headroom')
+
+
+def test_degrades_over_the_latency_budget():
+    harness = make_harness(latency_budget_ms=100)
+    harness.window(stage_ms=SLOW_DETECTOR, latency=0.2)
+    assert harness.values() == ['kernel=31', 'size=480']
+    assert harness.controller.adjustments[-1].reason.startswith('over latency budget')
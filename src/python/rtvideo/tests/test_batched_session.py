@@ -0,0 +1,98 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from rtvideo.common.batched_session import BatchedSession
+
+ANCHORS = 8
+
+
+class StandInSession:
+    """
+    Scores each image's anchors with the image's mean, as SCRFD would. `layout` is 'batched' for (N, anchors, 1)
+    outputs, 'flat' for (anchors * N, 1) and 'fixed' for an output that ignores the batch, with a length no batch
+    size up to 4 divides.
+    """
+    def __init__(self, layout: str):
+        self.layout = layout
+        self.batch_sizes = []
+        self.lock = threading.Lock()
+
+    def get_inputs(self):
+        return [SimpleNamespace(name='input.1', shape=['None', 3, '?', '?'])]
+
+    def get_outputs(self):
+        shape = {'batched': ['?', '?', 1], 'flat': ['?', 1], 'fixed': ['?', 1]}[self.layout]
+        return [SimpleNamespace(name='scores', shape=shape)]
+
+    def run(self, output_names, input_feed):
+        images = input_feed['input.1']
+        with self.lock:
+            self.batch_sizes.append(len(images))
+        scores = images.mean(axis=(1, 2, 3))[:, None, None] + np.arange(ANCHORS, dtype=np.float32)[None, :, None]
+        if self.layout == 'batched':
+            return [scores]
+        if self.layout == 'flat':
+            return [scores.reshape(-1, 1)]
+        return [np.concatenate([scores.reshape(-1, 1), scores.reshape(-1, 1)])[:ANCHORS + 3]]
+
+
+def expected(image: np.ndarray, layout: str) -> np.ndarray:
+    return StandInSession(layout).run(None, {'input.1': image})[0]
+
+
+def run_streams(batched: BatchedSession, layout: str, streams: int = 4, frames: int = 10):
+    errors = []
+    barrier = threading.Barrier(streams)
+
+    def stream(index):
+        session = batched.for_stream(f"stream{index}")
+        for frame in range(frames):
+            image = np.full((1, 3, 4, 4), index * 100 + frame, dtype=np.float32)
+            barrier.wait()
+            result = session.run(['scores'], {'input.1': image})[0]
+            if result.shape != expected(image, layout).shape or not np.array_equal(result, expected(image, layout)):
+                errors.append((index, frame, result.shape))
+
+    threads = [threading.Thread(target=stream, args=(index,)) for index in range(streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@pytest.mark.parametrize('layout', ['batched', 'flat'])
+def test_batches_split_back_per_stream(layout):
+    session = StandInSession(layout)
+    batched = BatchedSession(session, max_batch_size=4, max_wait_ms=200)
+    try:
+        assert run_streams(batched, layout) == []
+    finally:
+        batched.close()
+    assert max(session.batch_sizes) > 1
+    assert batched.batchable
+
+
+def test_outputs_that_dont_split_run_one_at_a_time():
+    session = StandInSession('fixed')
+    batched = BatchedSession(session, max_batch_size=4, max_wait_ms=200)
+    try:
+        assert run_streams(batched, 'fixed') == []
+    finally:
+        batched.close()
+    assert not batched.batchable
+    assert batched.max_batch_size == 1
+
+
+def test_fixed_batch_dimension_isnt_batched():
+    session = StandInSession('batched')
+    session.get_inputs = lambda: [SimpleNamespace(name='input.1', shape=[1, 3, 640, 640])]
+    batched = BatchedSession(session, max_batch_size=4)
+    try:
+        assert not batched.batchable
+        assert batched.max_batch_size == 1
+    finally:
+        batched.close()
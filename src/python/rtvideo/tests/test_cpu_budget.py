@@ -0,0 +1,41 @@
+import threading
+
+from rtvideo.common.cpu_budget import SHARED, CpuBudget, format_cpus, parse_cpus
+from rtvideo.common.structs import FrameProcessor
+
+
+def test_parses_and_formats_cpu_lists():
+    assert parse_cpus('0-3,6') == [0, 1, 2, 3, 6]
+    assert format_cpus([0, 1, 2, 3, 6, 8, 9]) == '0-3,6,8-9'
+
+
+def test_stages_get_their_own_cpus_and_threads():
+    budget = CpuBudget(cpus='0-7', stages={'face_detector': 2, 'hls': 3})
+    assert budget.stage_cpus == {'face_detector': [0, 1], 'hls': [2, 3, 4], SHARED: [5, 6, 7]}
+
+    detector, blur = FrameProcessor(), FrameProcessor()
+    budget.assign(detector, 'face_detector')
+    budget.assign(blur, 'blur')
+    assert detector.cpu_threads == 2
+    # Not library_threads, which only applies to OpenCV and BLAS.
+    assert blur.cpu_threads == 3
+
+
+def test_stage_threads_are_dropped_when_they_leave():
+    budget = CpuBudget(cpus=1)
+    budget.can_pin = False
+    processor = FrameProcessor()
+    budget.assign(processor)
+    tids = []
+
+    def stage():
+        budget.enter(processor)
+        tids.append(threading.get_native_id())
+        assert tids[0] in budget.thread_stages
+        budget.leave()
+
+    thread = threading.Thread(target=stage)
+    thread.start()
+    thread.join()
+    assert tids[0] not in budget.thread_stages
+    assert budget.thread_cpu[tids[0]][0] == SHARED
@@ -0,0 +1,38 @@
+import numpy as np
+
+from rtvideo.common.structs import Frame, PixelArrangement, PixelFormat
+from rtvideo.processors.health import FrameHealthFilter
+
+
+def make_frame(pixels: np.ndarray) -> Frame:
+    return Frame(pixels, PixelFormat.BGR_uint8, PixelArrangement.HWC, [])
+
+
+def scene(height: int = 360, width: int = 640, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(32, 255, (height, width, 3), dtype=np.uint8)
+
+
+def test_passes_letterboxed_content():
+    pixels = scene()
+    # 2.39:1 inside 16:9 leaves bars of about 13% of the rows at the top and bottom.
+    bar = round(360 * (1 - (640 / 2.39) / 360) / 2)
+    pixels[:bar] = 0
+    pixels[-bar:] = 0
+    assert FrameHealthFilter().check(make_frame(pixels)) is None
+
+
+def test_catches_black_frames():
+    health = FrameHealthFilter(action='flag')
+    frame = health(make_frame(np.full((360, 640, 3), 8, dtype=np.uint8)))
+    assert 'black' in frame.flags
+    assert FrameHealthFilter()(make_frame(np.zeros((360, 640, 3), dtype=np.uint8))) is None
+
+
+def test_catches_corrupted_and_frozen_frames():
+    pixels = scene()
+    pixels[120:] = (0, 128, 0)
+    assert FrameHealthFilter().check(make_frame(pixels)) == 'corrupted'
+
+    health = FrameHealthFilter(frozen_frames=3)
+    pixels = scene()
+    assert [health.check(make_frame(pixels.copy())) for _ in range(3)] == [None, None, 'frozen']
@@ -0,0 +1,115 @@
+import http.client
+import socket
+import threading
+import time
+
+import pytest
+
+from rtvideo.sinks.hls_server import HlsServer
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:6
+#EXT-X-TARGETDURATION:1
+#EXT-X-MEDIA-SEQUENCE:{first}
+{segments}
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def playlist(first: int, count: int) -> bytes:
+    segments = '\n'.join(f"#EXTINF:1.0,\nsegment{i}.ts" for i in range(first, first + count))
+    return PLAYLIST.format(first=first, segments=segments).encode()
+
+
+def request(server: HlsServer, method: str, path: str, body: bytes = None):
+    connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def raw_request(server: HlsServer, data: bytes) -> bytes:
+    with socket.create_connection(('127.0.0.1', server.port), timeout=10) as s:
+        s.sendall(data)
+        return s.recv(65536)
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = HlsServer(host='127.0.0.1', port=free_port(), max_segments=2, spill_dir=str(tmp_path))
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_serves_uploaded_playlist_and_segments(server):
+    assert request(server, 'PUT', '/segment0.ts', b'zero')[0] == 201
+    assert request(server, 'PUT', '/stream.m3u8', playlist(0, 1))[0] == 201
+
+    status, body = request(server, 'GET', '/stream.m3u8')
+    assert status == 200
+    assert b'#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES' in body
+    assert request(server, 'GET', '/segment0.ts') == (200, b'zero')
+
+
+def test_spills_evicted_segments(server, tmp_path):
+    for i in range(3):
+        request(server, 'PUT', f'/segment{i}.ts', f'body{i}'.encode())
+
+    assert 'segment0.ts' not in server.segments
+    assert (tmp_path / 'segment0.ts').read_bytes() == b'body0'
+    assert request(server, 'GET', '/segment0.ts') == (200, b'body0')
+
+
+def test_missing_files_are_404(server):
+    assert request(server, 'GET', '/stream.m3u8')[0] == 404
+    assert request(server, 'GET', '/segment9.ts')[0] == 404
+    assert request(server, 'GET', '/..%2Fetc%2Fpasswd')[0] == 404
+    request(server, 'PUT', '/segment0.ts', b'zero')
+    assert request(server, 'DELETE', '/segment0.ts')[0] == 204
+    assert request(server, 'GET', '/segment0.ts')[0] == 404
+
+
+def test_blocking_reload_waits_for_the_segment(server):
+    request(server, 'PUT', '/stream.m3u8', playlist(0, 1))
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(request(server, 'GET', '/stream.m3u8?_HLS_msn=1')))
+    waiter.start()
+    time.sleep(0.3)
+    assert not results
+
+    request(server, 'PUT', '/stream.m3u8', playlist(0, 2))
+    waiter.join(timeout=5)
+    status, body = results[0]
+    assert status == 200
+    assert b'segment1.ts' in body
+
+
+def test_blocking_reload_already_available_returns_at_once(server):
+    request(server, 'PUT', '/stream.m3u8', playlist(5, 2))
+    start = time.monotonic()
+    assert request(server, 'GET', '/stream.m3u8?_HLS_msn=6')[0] == 200
+    assert time.monotonic() - start < 1
+
+
+def test_blocking_reload_bad_requests(server):
+    request(server, 'PUT', '/stream.m3u8', playlist(0, 1))
+    assert request(server, 'GET', '/stream.m3u8?_HLS_msn=abc')[0] == 400
+    assert request(server, 'GET', '/stream.m3u8?_HLS_msn=10')[0] == 400
+
+
+def test_malformed_requests_are_400(server):
+    assert raw_request(server, b'GET /\r\n\r\n').startswith(b'HTTP/1.1 400')
+    bad_length = b'PUT /segment0.ts HTTP/1.1\r\nContent-Length: nope\r\n\r\n'
+    assert raw_request(server, bad_length).startswith(b'HTTP/1.1 400')
+    bad_chunk = b'PUT /segment0.ts HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n'
+    assert raw_request(server, bad_chunk).startswith(b'HTTP/1.1 400')
+    assert 'segment0.ts' not in server.segments
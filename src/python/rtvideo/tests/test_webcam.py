@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from rtvideo.common.structs import PixelFormat
+from rtvideo.sources.webcam import WebcamSource
+
+WIDTH, HEIGHT = 64, 48
+
+
+class FakeCapture:
+    """
+    Stands in for cv2.VideoCapture. `fourccs` maps each fourcc the device supports to (seconds per frame, shape),
+    anything else is ignored and the capture stays on its first fourcc.
+    """
+    def __init__(self, fourccs, opened=True):
+        self.fourccs = fourccs
+        self.opened = opened
+        self.fourcc = next(iter(fourccs))
+        self.released = False
+
+    def isOpened(self):
+        return self.opened
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FOURCC:
+            fourcc = int(value).to_bytes(4, 'little').decode('ascii')
+            if fourcc in self.fourccs:
+                self.fourcc = fourcc
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FOURCC:
+            return float(cv2.VideoWriter.fourcc(*self.fourcc))
+        return 0.0
+
+    def read(self):
+        interval, shape = self.fourccs[self.fourcc]
+        time.sleep(interval)
+        return True, np.zeros(shape, dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class FakeDevice:
+    def __init__(self, fourccs):
+        self.fourccs = fourccs
+        self.captures = []
+
+    def __call__(self, device, api):
+        capture = FakeCapture(self.fourccs)
+        self.captures.append(capture)
+        return capture
+
+
+def make_source(tmp_path, device, **kwargs):
+    return WebcamSource(
+        width=WIDTH, height=HEIGHT, device='fake', fourcc='auto', backend='V4L2', probe_seconds=0.2,
+        probe_cache=str(tmp_path / 'probe.json'), capture_factory=device, **kwargs,
+    )
+
+
+def test_probe_picks_the_fastest_fourcc_and_caches_it(tmp_path):
+    device = FakeDevice({'YUYV': (0.02, (HEIGHT, WIDTH, 3)), 'MJPG': (0.005, (HEIGHT, WIDTH, 3))})
+    source = make_source(tmp_path, device)
+
+    assert source.select_capture() == ('V4L2', 'MJPG')
+    # BGR3 isn't supported, the fake stays on YUYV and that candidate is skipped.
+    results = {result.fourcc: result for result in source.probe()}
+    assert set(results) == {'MJPG', 'YUYV'}
+    assert results['MJPG'].fps > results['YUYV'].fps
+    assert all(capture.released for capture in device.captures)
+
+    cache = json.loads((tmp_path / 'probe.json').read_text())
+    assert cache[source.cache_key()]['fourcc'] == 'MJPG'
+
+
+def test_cached_choice_skips_probing(tmp_path):
+    make_source(tmp_path, FakeDevice({'YUYV': (0.001, (HEIGHT, WIDTH, 3))})).select_capture()
+
+    device = FakeDevice({'MJPG': (0.001, (HEIGHT, WIDTH, 3))})
+    assert make_source(tmp_path, device).select_capture() == ('V4L2', 'YUYV')
+    assert device.captures == []
+
+    assert make_source(tmp_path, device, reprobe=True).select_capture() == ('V4L2', 'MJPG')
+    assert device.captures
+
+
+def test_pinned_backend_has_its_own_cache_entry(tmp_path):
+    source = make_source(tmp_path, FakeDevice({'MJPG': (0.001, (HEIGHT, WIDTH, 3))}))
+    source.backend = None
+    pinned = make_source(tmp_path, FakeDevice({'MJPG': (0.001, (HEIGHT, WIDTH, 3))}))
+    assert source.cache_key() != pinned.cache_key()
+
+
+def test_probe_rejects_frames_of_the_wrong_size(tmp_path):
+    device = FakeDevice({'MJPG': (0.001, (HEIGHT * 2, WIDTH * 2, 3)), 'YUYV': (0.001, (HEIGHT, WIDTH, 3))})
+    assert make_source(tmp_path, device).select_capture() == ('V4L2', 'YUYV')
+
+    device = FakeDevice({'MJPG': (0.001, (HEIGHT, WIDTH, 3))})
+    yuyv = make_source(tmp_path, device, pixel_format=PixelFormat.YUYV422_uint8)
+    with pytest.raises(RuntimeError):
+        yuyv.select_capture()
+
+
+def test_probe_cpu_leaves_out_other_threads(tmp_path):
+    stop = threading.Event()
+
+    def busy():
+        # Stands in for a processor loading a model while the source probes.
+        while not stop.is_set():
+            sum(range(10000))
+
+    thread = threading.Thread(target=busy)
+    thread.start()
+    try:
+        result = make_source(tmp_path, FakeDevice({'MJPG': (0.01, (HEIGHT, WIDTH, 3))})).probe()[0]
+    finally:
+        stop.set()
+        thread.join()
+    # Reading a fake frame costs next to nothing, the busy thread takes most of the 10ms between frames.
+    assert result.cpu_ms < 2
+
+
+class FailingCapture(FakeCapture):
+    def __init__(self, frames, stall: threading.Event = None):
+        super().__init__({'MJPG': (0.001, (HEIGHT, WIDTH, 3))})
+        self.frames = frames
+        self.stall = stall
+
+    def read(self):
+        if self.frames == 0:
+            if self.stall is None:
+                raise OSError("device unplugged")
+            # A camera that stops delivering without an error, until it's released.
+            self.stall.wait()
+            return False, None
+        self.frames -= 1
+        return super().read()
+
+    def release(self):
+        super().release()
+        if self.stall is not None:
+            self.stall.set()
+
+
+def decoding_source(tmp_path, capture):
+    return WebcamSource(
+        width=WIDTH, height=HEIGHT, device='fake', fourcc='MJPG', backend='V4L2', decode_threads=2,
+        probe_cache=str(tmp_path / 'probe.json'), capture_factory=lambda device, api: capture,
+    )
+
+
+def test_reader_errors_reach_the_consumer(tmp_path):
+    source = decoding_source(tmp_path, FailingCapture(frames=3))
+    source.open()
+    try:
+        with pytest.raises(OSError, match="unplugged"):
+            for _ in range(10):
+                next(source)
+    finally:
+        source.close()
+
+
+def test_close_releases_a_stalled_camera(tmp_path, monkeypatch):
+    monkeypatch.setattr('rtvideo.sources.webcam.READER_STOP_TIMEOUT', 0.2)
+    capture = FailingCapture(frames=1, stall=threading.Event())
+    source = decoding_source(tmp_path, capture)
+    source.open()
+    next(source)
+
+    start = time.monotonic()
+    source.close()
+    assert time.monotonic() - start < 1
+    assert capture.released
+    assert not source.reader_thread.is_alive()